@@ -1,11 +1,12 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from typing import Optional, List, Any, Dict
 from pathlib import Path
 import os
+import shutil
 import json, traceback
 from logger import GLOBAL_LOGGER as log
 from typing import Any, Dict
@@ -24,6 +25,20 @@ from utils.document_ops import FastAPIFileAdapter
 from src.doc_analyzer.data_analysis import DocumentAnalyzer
 from src.doc_compare.document_comparer import DocumentComparerLLM
 from src.document_chat.retrieval import ConversationalRAG
+from utils.model_loader import MODEL_REGISTRY
+from utils.index_cache import FAISS_INDEX_CACHE
+from utils.answer_cache import ANSWER_CACHE
+from utils.result_cache import RESULT_CACHE
+from utils.json_repair import JSON_REPAIR_STATS
+from utils.chat_history import CHAT_HISTORY
+from utils.session_manager import SESSIONS
+from utils.file_io import UPLOAD_LIMITS, UploadTooLargeError
+from src.multidoc_chat.query_rewrite import REWRITE_GATE
+from utils.config_loader import load_config
+from utils.concurrency import EXECUTORS, ServerBusyError
+from utils.embedding_cache import embedding_cache_stats
+from contextlib import asynccontextmanager, AsyncExitStack
+import asyncio
 import logging
 
 
@@ -33,7 +48,35 @@ logging.getLogger("openai").setLevel(logging.ERROR)
 logging.getLogger("groq").setLevel(logging.ERROR)
 
 
-app = FastAPI(title="Document Portal API", version="0.1")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    config = load_config()
+    faiss_cfg = config.get("faiss_db", {}) or {}
+    FAISS_INDEX_CACHE.configure(max_bytes=int(faiss_cfg.get("index_cache_max_mb", 512)) * 1024 * 1024)
+    ANSWER_CACHE.configure(config)
+    RESULT_CACHE.configure(config)
+    CHAT_HISTORY.configure(config)
+    REWRITE_GATE.configure(config)
+    SESSIONS.configure(config, base_dir=PROJECT_ROOT)
+    UPLOAD_LIMITS.configure(config)
+    # a deleted index must not be served from memory, nor its answers and history kept
+    SESSIONS.on_evict("faiss", lambda kind, sid, path: FAISS_INDEX_CACHE.invalidate(str(path)))
+    SESSIONS.on_evict("faiss", lambda kind, sid, path: ANSWER_CACHE.invalidate(str(path)))
+    SESSIONS.on_evict("faiss", lambda kind, sid, path: CHAT_HISTORY.clear(sid))
+    # Load the embedding model and LLM client once, before the first request.
+    EXECUTORS.configure(config.get("executor"))
+    stats = await asyncio.to_thread(MODEL_REGISTRY.warmup, config)
+    log.info(f"[startup] models warmed | loaded={stats['loaded']} | seconds={stats['total_load_seconds']}")
+    await asyncio.to_thread(SESSIONS.scan)
+    gc_task = asyncio.create_task(SESSIONS.run())
+    yield
+    gc_task.cancel()
+    await asyncio.to_thread(SESSIONS.save)
+    EXECUTORS.shutdown()
+    CHAT_HISTORY.close()
+
+
+app = FastAPI(title="Document Portal API", version="0.1", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -52,6 +95,27 @@ FAISS_BASE = str(PROJECT_ROOT / "faiss_index")
 app.mount("/static", StaticFiles(directory=PROJECT_ROOT / "static"), name="static")
 templates = Jinja2Templates(directory=PROJECT_ROOT / "templates")
 
+@app.exception_handler(ServerBusyError)
+async def server_busy_handler(request: Request, exc: ServerBusyError):
+    log.warning(f"[{exc.endpoint}] rejected | status={exc.status_code} | detail={exc.detail}")
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(UploadTooLargeError)
+async def upload_too_large_handler(request: Request, exc: UploadTooLargeError):
+    log.warning(f"Upload rejected | status={exc.status_code} | detail={exc.detail}")
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+def _adapt_uploads(*files: UploadFile) -> List[FastAPIFileAdapter]:
+    # reject oversized uploads before anything reads them
+    uploads = [FastAPIFileAdapter(f) for f in files]
+    for upload in uploads:
+        UPLOAD_LIMITS.check(upload.name, upload.size)
+    return uploads
+
 # --- Routes ---
 @app.get("/", response_class=HTMLResponse)
 async def serve_ui(request: Request):
@@ -61,6 +125,33 @@ async def serve_ui(request: Request):
 def health() -> Dict[str, str]:
     return {"status": "ok", "service": "document-portal"}
 
+@app.get("/metrics")
+def metrics() -> Dict[str, Any]:
+    return {
+        "models": MODEL_REGISTRY.stats(),
+        "faiss_index_cache": FAISS_INDEX_CACHE.stats(),
+        "answer_cache": ANSWER_CACHE.stats(),
+        "result_cache": RESULT_CACHE.stats(),
+        "json_repair": JSON_REPAIR_STATS.stats(),
+        "chat_history": CHAT_HISTORY.stats(),
+        "query_rewrite": REWRITE_GATE.stats(),
+        "sessions": SESSIONS.stats(),
+        "uploads": UPLOAD_LIMITS.stats(),
+        "embedding_cache": embedding_cache_stats(),
+        "executors": EXECUTORS.stats(),
+    }
+
+@app.get("/sessions")
+def sessions() -> Dict[str, Any]:
+    return SESSIONS.stats()
+
+@app.post("/sessions/gc")
+async def sessions_gc() -> Dict[str, Any]:
+    return await EXECUTORS.run_io(SESSIONS.collect)
+
+def _owner(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
 # Helper: wrap DocHandler.read_pdf with proper error binding
 def _read_pdf_via_handler(handler: DocHandler, path: str) -> str:
     try:
@@ -82,28 +173,58 @@ def _read_pdf_via_handler(handler: DocHandler, path: str) -> str:
         raise HTTPException(status_code=500, detail=f"Error handling PDF: {e}")
 
 @app.post("/analyze")
-async def analyze_document(file: UploadFile = File(...)) -> Dict[str, Any]:
-    # 1) Save + read PDF
+async def analyze_document(
+    request: Request, file: UploadFile = File(...), bypass_cache: bool = Form(False)
+) -> Dict[str, Any]:
+    async with EXECUTORS.limiter("analyze").slot(), AsyncExitStack() as pins:
+        return await _analyze_document(file, bypass_cache, pins, _owner(request))
+
+async def _analyze_document(
+    file: UploadFile, bypass_cache: bool = False, pins: Optional[AsyncExitStack] = None, owner: Optional[str] = None
+) -> Dict[str, Any]:
+    upload, = _adapt_uploads(file)
+    try:
+        analyzer = DocumentAnalyzer(config={})
+    except Exception as e:
+        log.error(f"[analyze] analyzer failed: {e}\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Analyzer failed: {e}")
+
+    # 0) Save (I/O thread); the upload is hashed as it is copied, so it is read only once
     try:
         dh = DocHandler()
-        saved_path = dh.save_pdf(FastAPIFileAdapter(file))
+        if pins is not None:
+            pins.enter_context(SESSIONS.pin("analysis", dh.session_id, owner))
+        saved_path = await EXECUTORS.run_io(dh.save_pdf, upload)
         log.info(f"[analyze] saved to {saved_path}")
-        text = dh.read_pdf(saved_path)
+    except Exception as e:
+        log.error(f"[analyze] save failed: {e}\n{traceback.format_exc()}")
+        raise HTTPException(status_code=400, detail=f"PDF processing failed: {e}")
+
+    # 1) Same bytes + prompt + model already analysed? (no PDF parsing, no LLM call)
+    cache_key = RESULT_CACHE.key("analyze", [dh.last_digest], analyzer.prompt_version, analyzer.model_id)
+    if not bypass_cache:
+        cached = await EXECUTORS.run_io(RESULT_CACHE.get, "analyze", cache_key)
+        if cached is not None:
+            await EXECUTORS.run_io(shutil.rmtree, dh.session_path, True)  # the copy is not needed
+            return {"filename": file.filename, "chars": cached["chars"], "analysis": cached["analysis"], "cached": True}
+
+    # 2) Read PDF (process pool)
+    try:
+        text = await EXECUTORS.run_cpu(dh.read_pdf, saved_path)
         log.info(f"[analyze] read {len(text)} chars")
     except Exception as e:
-        log.error(f"[analyze] save/read failed: {e}\n{traceback.format_exc()}")
+        log.error(f"[analyze] read failed: {e}\n{traceback.format_exc()}")
         raise HTTPException(status_code=400, detail=f"PDF processing failed: {e}")
 
-    # 2) Run analysis
+    # 3) Run analysis (async LLM call, does not block the event loop)
     try:
-        analyzer = DocumentAnalyzer(config={})
-        result = analyzer.analyze_document(text)
+        result = await analyzer.aanalyze_document(text)
         log.info("[analyze] analyzer finished")
     except Exception as e:
         log.error(f"[analyze] analyzer failed: {e}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Analyzer failed: {e}")
 
-    # 3) Make the result JSON-safe
+    # 4) Make the result JSON-safe
     try:
         if hasattr(result, "model_dump"):            # pydantic v2
             result = result.model_dump()
@@ -126,35 +247,115 @@ async def analyze_document(file: UploadFile = File(...)) -> Dict[str, Any]:
         log.error(f"[analyze] serialization failed: {e}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Serialization failed: {e}")
 
-    # 4) Return
+    # 5) Cache + return (an analysis missing failed sections is not served to later uploads)
+    failed = analyzer.last_failed_sections
+    if not failed:
+        await EXECUTORS.run_io(RESULT_CACHE.put, "analyze", cache_key, {"chars": len(text), "analysis": result})
     return {
         "filename": file.filename,
         "chars": len(text),
         "analysis": result,
+        "cached": False,
+        "failed_sections": failed,
     }
 
 @app.post("/compare")
 async def compare_documents(
+    request: Request,
     reference: UploadFile = File(...),
     actual: UploadFile = File(...),        
+    bypass_cache: bool = Form(False),
 ) -> Any:
-    try:
-        dc = DocumentComparator()
-        ref_path, actual_path = dc.save_uploaded_files(
-            FastAPIFileAdapter(reference), FastAPIFileAdapter(actual)
-        )
-        _ = ref_path, actual_path  
+    ref_upload, act_upload = _adapt_uploads(reference, actual)
+    async with EXECUTORS.limiter("compare").slot(), AsyncExitStack() as pins:
+        try:
+            comp = DocumentComparerLLM()
+            dc = DocumentComparator()
+            pins.enter_context(SESSIONS.pin("compare", dc.session_id, _owner(request)))
+            # hashed while saving, so each upload is read once
+            ref_path, actual_path = await EXECUTORS.run_io(dc.save_uploaded_files, ref_upload, act_upload)
+            # keyed by the ordered (reference, actual) pair: swapping them is a different comparison
+            cache_key = RESULT_CACHE.key("compare", dc.last_digests, comp.prompt_version, comp.model_id)
+            if not bypass_cache:
+                cached = await EXECUTORS.run_io(RESULT_CACHE.get, "compare", cache_key)
+                if cached is not None:
+                    await EXECUTORS.run_io(shutil.rmtree, dc.session_path, True)
+                    return {"rows": cached["rows"], "session_id": cached["session_id"], "cached": True}
 
-        combined_text = dc.combine_documents()
-        comp = DocumentComparerLLM()
-        df = comp.compare_documents(combined_text)
+            # only changed pages' hunks reach the LLM; identical files skip it entirely
+            diff = await EXECUTORS.run_cpu(dc.diff_documents, ref_path, actual_path)
+            df = await comp.acompare_diff(diff)
+
+            rows = df.to_dict(orient="records")
+            await EXECUTORS.run_io(RESULT_CACHE.put, "compare", cache_key, {"rows": rows, "session_id": dc.session_id})
+            return {"rows": rows, "session_id": dc.session_id, "cached": False, "diff": diff.stats()}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"comparison failed: {e}")
 
-        return {"rows": df.to_dict(orient="records"), "session_id": dc.session_id}
+@app.post("/compare/stream")
+async def compare_documents_stream(
+    request: Request,
+    reference: UploadFile = File(...),
+    actual: UploadFile = File(...),
+    bypass_cache: bool = Form(False),
+) -> StreamingResponse:
+    """Server-Sent Events: 'diff' (page diff stats), one 'window' per compared page window
+    as it completes (or 'window_error' once its retries are used up), then 'done' with all rows."""
+    ref_upload, act_upload = _adapt_uploads(reference, actual)
+    stack = AsyncExitStack()
+    await stack.enter_async_context(EXECUTORS.limiter("compare").slot())
+    try:
+        comp = DocumentComparerLLM()
+        dc = DocumentComparator()
+        stack.enter_context(SESSIONS.pin("compare", dc.session_id, _owner(request)))
+        ref_path, actual_path = await EXECUTORS.run_io(dc.save_uploaded_files, ref_upload, act_upload)
+        cache_key = RESULT_CACHE.key("compare", dc.last_digests, comp.prompt_version, comp.model_id)
+        cached = None if bypass_cache else await EXECUTORS.run_io(RESULT_CACHE.get, "compare", cache_key)
+        diff = None
+        if cached is None:
+            diff = await EXECUTORS.run_cpu(dc.diff_documents, ref_path, actual_path)
+        else:
+            await EXECUTORS.run_io(shutil.rmtree, dc.session_path, True)
     except Exception as e:
+        await stack.aclose()
         raise HTTPException(status_code=500, detail=f"comparison failed: {e}")
 
+    async def event_stream():
+        try:
+            if cached is not None:
+                yield _sse("done", {"rows": cached["rows"], "session_id": cached["session_id"], "cached": True})
+                return
+            t0 = asyncio.get_running_loop().time()
+            yield _sse("diff", diff.stats())
+            results = []
+            async for ev in comp.astream_diff(diff):
+                results.append(ev)
+                yield _sse("window_error" if "error" in ev else "window", ev)
+            failed = [r["window"] for r in results if "error" in r]
+            rows = [row for r in sorted(results, key=lambda r: r["window"]) for row in r.get("rows", [])]
+            if not failed:
+                await EXECUTORS.run_io(
+                    RESULT_CACHE.put, "compare", cache_key, {"rows": rows, "session_id": dc.session_id}
+                )
+            yield _sse("done", {
+                "rows": rows,
+                "session_id": dc.session_id,
+                "cached": False,
+                "windows": len(results),
+                "failed_windows": failed,
+                "total_ms": round((asyncio.get_running_loop().time() - t0) * 1000, 2),
+            })
+        except Exception as e:
+            log.error(f"[compare/stream] failed: {e}")
+            yield _sse("error", {"detail": f"comparison failed: {e}"})
+        finally:
+            await stack.aclose()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @app.post("/chat/index")
 async def chat_build_index(
+    request: Request,
     files: List[UploadFile] = File(...),
     session_id: Optional[str] = Form(None),
     use_session_dirs: bool = Form(True),
@@ -162,39 +363,181 @@ async def chat_build_index(
     chunk_overlap: int = Form(200),
     k: int = Form(5),
 ) -> Any:
-    try:
-        wrapped = [FastAPIFileAdapter(f) for f in files]
-        ci = ChatIngestor(
-            temp_base=UPLOAD_BASE,         
-            faiss_base=FAISS_BASE,         
-            use_session_dirs=use_session_dirs,
-            session_id=session_id or None,
-        )
-        # keep your original method name if that's what you implemented
-        ci.built_retriver(wrapped, chunk_size=chunk_size, chunk_overlap=chunk_overlap, k=k)
-        return {"ok": True, "detail": "index built"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"indexing failed: {e}")
+    wrapped = _adapt_uploads(*files)
+    async with EXECUTORS.limiter("chat_index").slot(), AsyncExitStack() as pins:
+        try:
+            ci = ChatIngestor(
+                temp_base=UPLOAD_BASE,
+                faiss_base=FAISS_BASE,
+                use_session_dirs=use_session_dirs,
+                session_id=session_id or None,
+            )
+            if use_session_dirs:
+                pins.enter_context(SESSIONS.pin("chat_uploads", ci.session_id, _owner(request)))
+                pins.enter_context(SESSIONS.pin("faiss", ci.session_id, _owner(request)))
+            # parsing, embedding and FAISS writes all block; run them on the I/O pool
+            # (the embedding model lives in this process, so it is not shipped to workers)
+            await EXECUTORS.run_io(
+                ci.built_retriver, wrapped, chunk_size=chunk_size, chunk_overlap=chunk_overlap, k=k
+            )
+            return {
+                "ok": True,
+                "detail": "index built",
+                "session_id": ci.session_id,
+                "k": k,
+                **getattr(ci, "ingest_report", {}),
+            }
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"indexing failed: {e}")
+
+def _chat_index_dir(session_id: Optional[str], use_session_dirs: bool) -> str:
+    if use_session_dirs and not session_id:
+        raise HTTPException(status_code=400, detail="session_id is required when use_session_dir = True")
+
+    index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE
+    if not os.path.isdir(index_dir):
+        raise HTTPException(status_code=404, detail=f"FAISS index not found at: {index_dir}")
+    return index_dir
+
+def _history_key(session_id: Optional[str]) -> Optional[str]:
+    # history belongs to a conversation the client names; without session dirs every client
+    # shares the one index, so falling back to it would mix different users' turns
+    return session_id or None
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
 
 @app.post("/chat/query")
 async def chat_query(
+    request: Request,
     question: str = Form(...),
     session_id: Optional[str] = Form(None),
     use_session_dirs: bool = Form(True),
     k: int = Form(5),
+    nprobe: Optional[int] = Form(None),
+    ef_search: Optional[int] = Form(None),
+    search_type: str = Form("similarity"),
+    fetch_k: int = Form(20),
+    lambda_mult: float = Form(0.5, alias="lambda"),
+    min_similarity: Optional[float] = Form(None),
+    token_budget: Optional[int] = Form(None),
+    use_history: bool = Form(True),
 ) -> Any:
-    try:
-        if use_session_dirs and not session_id:
-            raise HTTPException(status_code=400, detail="session_id is required when use_session_dir = True")
+    # 404 before anything is registered: pin() would otherwise track a session that does not exist
+    index_dir = _chat_index_dir(session_id, use_session_dirs)
+    async with EXECUTORS.limiter("chat_query").slot(), AsyncExitStack() as pins:
+        if use_session_dirs:
+            pins.enter_context(SESSIONS.pin("faiss", session_id, _owner(request)))
+        try:
+            rag = ConversationalRAG(session_id=session_id)
+            await EXECUTORS.run_io(
+                rag.load_retriever_from_faiss,
+                index_dir,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                search_type=search_type,
+                fetch_k=fetch_k,
+                lambda_mult=lambda_mult,
+                k=k,
+                min_similarity=min_similarity,
+                token_budget=token_budget,
+            )
+            history_key = _history_key(session_id)
+            use_history = use_history and history_key is not None
+            history = await EXECUTORS.run_io(CHAT_HISTORY.messages, history_key) if use_history else []
+            response = await rag.ainvoke(question, chat_history=history)
+            if use_history:
+                # may fold older turns into the rolling summary (an LLM call every few turns)
+                await EXECUTORS.run_io(CHAT_HISTORY.add_turn, history_key, question, response)
 
-        index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE
-        if not os.path.isdir(index_dir):
-            raise HTTPException(status_code=404, detail=f"FAISS index not found at: {index_dir}")
+            return {
+                "answer": response,
+                "session_id": session_id,
+                "k": k,
+                "engine": "LCEL-RAG",
+                "cached": bool(rag.last_cache and rag.last_cache["hit"]),
+                "cache": rag.last_cache,
+                "compression": rag.last_compression,
+                "retrieval": rag.last_retrieval,
+                "history": use_history,
+                "history_messages": len(history),
+                "rewrite": rag.last_rewrite,
+            }
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Query failed: {e}")
 
-        rag = ConversationalRAG(session_id=session_id)
-        rag.load_retriever_from_faiss(index_dir)
-        response = rag.invoke(question, chat_history=[])
+@app.post("/chat/query/stream")
+async def chat_query_stream(
+    request: Request,
+    question: str = Form(...),
+    session_id: Optional[str] = Form(None),
+    use_session_dirs: bool = Form(True),
+    k: int = Form(5),
+    nprobe: Optional[int] = Form(None),
+    ef_search: Optional[int] = Form(None),
+    search_type: str = Form("similarity"),
+    fetch_k: int = Form(20),
+    lambda_mult: float = Form(0.5, alias="lambda"),
+    min_similarity: Optional[float] = Form(None),
+    token_budget: Optional[int] = Form(None),
+    use_history: bool = Form(True),
+) -> StreamingResponse:
+    """Server-Sent Events: 'sources', then 'token'*, then 'done' (timings) or 'error'."""
+    index_dir = _chat_index_dir(session_id, use_session_dirs)
 
-        return {"answer": response, "session_id": session_id, "k": k, "engine": "LCEL-RAG"}
+    # take the slot before responding so overload still surfaces as 429/503,
+    # and hold it (and the session pin) until the stream finishes
+    stack = AsyncExitStack()
+    await stack.enter_async_context(EXECUTORS.limiter("chat_query").slot())
+    try:
+        if use_session_dirs:
+            stack.enter_context(SESSIONS.pin("faiss", session_id, _owner(request)))
+        rag = ConversationalRAG(session_id=session_id)
+        history_key = _history_key(session_id)
+        use_history = use_history and history_key is not None
+        history = await EXECUTORS.run_io(CHAT_HISTORY.messages, history_key) if use_history else []
+        await EXECUTORS.run_io(
+            rag.load_retriever_from_faiss,
+            index_dir,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            search_type=search_type,
+            fetch_k=fetch_k,
+            lambda_mult=lambda_mult,
+            k=k,
+            min_similarity=min_similarity,
+            token_budget=token_budget,
+        )
     except Exception as e:
+        await stack.aclose()
         raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+
+    async def event_stream():
+        try:
+            tokens = []
+            async for ev in rag.astream(question, chat_history=history):
+                if ev["event"] == "token":
+                    tokens.append(ev["data"])
+                elif ev["event"] == "done" and use_history:
+                    # record the turn before 'done': clients may disconnect as soon as they see it
+                    await EXECUTORS.run_io(CHAT_HISTORY.add_turn, history_key, question, "".join(tokens))
+                yield _sse(ev["event"], ev["data"])
+        except Exception as e:
+            log.error(f"[chat/query/stream] failed: {e}")
+            yield _sse("error", {"detail": getattr(e, "error_message", str(e))})
+        finally:
+            await stack.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.delete("/chat/history")
+async def chat_clear_history(session_id: Optional[str] = None) -> Dict[str, Any]:
+    history_key = _history_key(session_id)
+    if history_key is None:
+        raise HTTPException(status_code=400, detail="session_id is required")
+    await EXECUTORS.run_io(CHAT_HISTORY.clear, history_key)
+    return {"ok": True, "session_id": session_id}
@@ -1,16 +1,29 @@
 import sys
 import traceback
-from logger.custom_logger import CustomLogger  
+from logger.custom_logger import CustomLogger
 
-logger = CustomLogger().get_logger(__file__)  
+logger = CustomLogger().get_logger(__file__)
 
 class DocumentPortalException(Exception):
-    def __init__(self, error_message, error_details):
-        exc_type, exc_value, exc_tb = error_details.exc_info()
-        self.file_name = exc_tb.tb_frame.f_code.co_filename
-        self.lineno = exc_tb.tb_lineno
+    def __init__(self, error_message, error_details=sys):
+        # accept the sys module, an exception instance, or an exc_info() tuple
+        if hasattr(error_details, "exc_info"):
+            exc_type, exc_value, exc_tb = error_details.exc_info()
+        elif isinstance(error_details, BaseException):
+            exc_type, exc_value, exc_tb = type(error_details), error_details, error_details.__traceback__
+        elif isinstance(error_details, tuple) and len(error_details) == 3:
+            exc_type, exc_value, exc_tb = error_details
+        else:
+            exc_type, exc_value, exc_tb = None, None, None
+        super().__init__(str(error_message))
+        self.file_name = exc_tb.tb_frame.f_code.co_filename if exc_tb else "<unknown>"
+        self.lineno = exc_tb.tb_lineno if exc_tb else -1
         self.error_message = str(error_message)
-        self.traceback_str = ''.join(traceback.format_exception(exc_type, exc_value, exc_tb))
+        self.traceback_str = ''.join(traceback.format_exception(exc_type, exc_value, exc_tb)) if exc_type else ""
+
+    def __reduce__(self):
+        # picklable, so errors raised in worker processes reach the caller intact
+        return (_rebuild_exception, (type(self), self.error_message, self.file_name, self.lineno, self.traceback_str))
 
     def __str__(self):
         return f"""
@@ -20,11 +33,21 @@ class DocumentPortalException(Exception):
         {self.traceback_str}
         """
 
+
+def _rebuild_exception(cls, error_message, file_name, lineno, traceback_str):
+    exc = cls.__new__(cls)
+    Exception.__init__(exc, error_message)
+    exc.error_message = error_message
+    exc.file_name = file_name
+    exc.lineno = lineno
+    exc.traceback_str = traceback_str
+    return exc
+
 if __name__ == "__main__":
     try:
-        a = 1 / 0  
+        a = 1 / 0
     except Exception as e:
-        logger.exception("Original exception:")  
+        logger.exception("Original exception:")
         app_exc = DocumentPortalException(e, sys)
-        logger.error(str(app_exc))              
+        logger.error(str(app_exc))
         raise app_exc
@@ -28,6 +28,47 @@ your response should follow the instructions:
 """)
 
 
+document_comparison_diff_prompt = ChatPromptTemplate.from_template("""
+you will get the differences between a reference PDF and an actual PDF, already located by a diff.
+each block is headed by the page numbers it covers; lines starting with '-' are from the reference,
+lines starting with '+' are from the actual document, each with its line number in brackets, and
+lines starting with two spaces are unchanged context. pages not listed are identical.
+your task include the following:
+1. describe every change, in plain words, page by page.
+2. specify where the change occurs by indicating the page number, and line number.
+3. if the listed differences are only formatting and carry no change in content, say 'NO CHANGES IDENTIFIED'.
+
+Differences:
+{changed_hunks}
+
+your response should follow the instructions:
+{format_instructions}
+""")
+
+document_analysis_section_prompt = ChatPromptTemplate.from_template("""
+you are a highly skilled and capable assistant.
+you are reading section {section} of {sections} (pages {pages}) of a longer document.
+summarize this section in a few points and extract any document metadata it states.
+use "Not Available" for any field this section does not state.
+
+{format_instructions}
+
+Section text:
+{document_text}
+""")
+
+document_analysis_reduce_prompt = ChatPromptTemplate.from_template("""
+you are a highly skilled and capable assistant.
+below are analyses of consecutive sections of one document, in order.
+merge them into one analysis of the whole document: write a concise overall summary
+(not one point per section) and pick the most credible value for each metadata field.
+
+{format_instructions}
+
+Section analyses:
+{section_results}
+""")
+
 contextualize_question_prompt = ChatPromptTemplate.from_messages([
     ("system", (
         "Given a conversation history and the most recent user query, rewrite the query as a standalone question "
@@ -39,6 +80,20 @@ contextualize_question_prompt = ChatPromptTemplate.from_messages([
 ])
 
 
+chat_history_summary_prompt = ChatPromptTemplate.from_template("""
+you maintain a running summary of a conversation between a user and a document assistant.
+update the summary below with the newer messages. keep the facts, names, numbers and open
+questions later turns may refer back to; drop pleasantries. write plain prose of at most
+{max_words} words and return only the updated summary.
+
+Current summary:
+{summary}
+
+Newer messages:
+{messages}
+""")
+
+
 context_qa_prompt = ChatPromptTemplate.from_messages([
     ("system", (
         "You are an assistant designed to answer questions using the provided context. Rely only on the retrieved "
@@ -51,9 +106,13 @@ context_qa_prompt = ChatPromptTemplate.from_messages([
 
 PROMPT_REGISTRY = {
     "document_analysis": document_analysis_prompt,
+    "document_analysis_section": document_analysis_section_prompt,
+    "document_analysis_reduce": document_analysis_reduce_prompt,
     "document_comparison": document_comparison_prompt,
+    "document_comparison_diff": document_comparison_diff_prompt,
     "contextualize_question": contextualize_question_prompt,
-    "context_qa": context_qa_prompt,   
+    "context_qa": context_qa_prompt,
+    "chat_history_summary": chat_history_summary_prompt,   
 }
 
 
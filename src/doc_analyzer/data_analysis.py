@@ -1,12 +1,19 @@
 import os
 import sys
-from utils.model_loader import ModelLoader
+import json
+import asyncio
+from typing import Any, Dict, List, Tuple
+from utils.model_loader import ModelLoader, MODEL_REGISTRY
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 from models.models import *
-from langchain_core.output_parsers import JsonOutputParser
-from langchain.output_parsers import OutputFixingParser
 from prompt.prompt_library import PROMPT_REGISTRY
+from utils.json_repair import LocalFirstFixingParser, RepairingJsonParser
+from utils.result_cache import RESULT_CACHE, model_id, prompt_version
+from src.doc_analyzer.map_reduce import (
+    Section, analysis_config, merge_partials, page_count, split_sections,
+)
+from utils.token_count import approx_tokens
 
 # keep your existing logger boot
 CustomLogger.configure_logger()
@@ -18,17 +25,37 @@ class DocumentAnalyzer:
     """
     Analyzes document using a pre-trained model.
     Logs all operations automatically into the logger.
+
+    Documents over analysis.single_call_max_tokens (or every document, with
+    map_reduce: always) are analysed map-reduce style: token-budgeted sections are
+    analysed concurrently (at most analysis.max_concurrency LLM calls in flight),
+    then merged into one MetaData. Section results are cached by content hash, so
+    re-analysing an edited document only pays for the sections that changed.
+    Sections whose analysis failed are left out of the merge and listed in
+    last_failed_sections, so callers can avoid caching the incomplete result.
     """
 
-    def __init__(self, config):
+    def __init__(self, config=None):
         # keep module-level boot, but also have an instance logger
         self.log = CustomLogger.get_logger(__name__)
         try:
             self.loader = ModelLoader(config)
-            self.llm = self.loader.load_llm()
-            self.parser = JsonOutputParser(pydantic_object=MetaData)
-            self.fixing_parser = OutputFixingParser.from_llm(parser=self.parser, llm=self.llm)
+            self.llm = MODEL_REGISTRY.get_llm(self.loader.config)
+            # replies are validated and repaired locally first; the LLM fix call is the last resort
+            self.parser = RepairingJsonParser(pydantic_object=MetaData)
+            self.fixing_parser = LocalFirstFixingParser.from_llm(parser=self.parser, llm=self.llm)
             self.prompt = PROMPT_REGISTRY["document_analysis"]
+            self.section_prompt = PROMPT_REGISTRY["document_analysis_section"]
+            self.reduce_prompt = PROMPT_REGISTRY["document_analysis_reduce"]
+            self.analysis_cfg = analysis_config(self.loader.config)
+            # identify cached results (utils.result_cache) produced by these prompts + model
+            self.prompt_version = prompt_version(
+                [self.prompt, self.section_prompt, self.reduce_prompt],
+                self.parser.get_format_instructions() + json.dumps(self.analysis_cfg, sort_keys=True),
+            )
+            self.section_prompt_version = prompt_version(self.section_prompt, self.parser.get_format_instructions())
+            self.model_id = model_id(self.loader.config)
+            self.last_failed_sections: List[Dict[str, Any]] = []
 
             self.log.info("DocumentAnalyzer initialized successfully")
         except Exception as e:
@@ -41,6 +68,8 @@ class DocumentAnalyzer:
         """
         Analyze a document and extract metadata and create summary.
         """
+        if self._use_map_reduce(document_text):
+            return self.map_reduce_analyze(document_text)
         try:
             chain = self.prompt | self.llm | self.fixing_parser
             self.log.info("Meta-data analysis chain initialized")
@@ -64,3 +93,142 @@ class DocumentAnalyzer:
             self.log.exception(f"Metadata Analysis failed: {e}")
             # Preserve original exception as context
             raise DocumentPortalException("Metadata extraction failed", e) from e
+
+    async def aanalyze_document(self, document_text: str) -> dict:
+        """
+        Async variant of analyze_document(); awaits the LLM call.
+        """
+        if self._use_map_reduce(document_text):
+            return await self.amap_reduce_analyze(document_text)
+        try:
+            chain = self.prompt | self.llm | self.fixing_parser
+            response = await chain.ainvoke({
+                "format_instructions": self.parser.get_format_instructions(),
+                "document_text": document_text
+            })
+            self.log.info("Metadata analysis performed successfully (async)")
+            return response
+
+        except Exception as e:
+            self.log.exception(f"Metadata Analysis failed: {e}")
+            raise DocumentPortalException("Metadata extraction failed", e) from e
+
+    # ---------- map-reduce ----------
+
+    def _use_map_reduce(self, document_text: str) -> bool:
+        mode = str(self.analysis_cfg["map_reduce"]).lower()
+        if mode == "always":
+            return True
+        if mode == "never":
+            return False
+        return approx_tokens(document_text) > int(self.analysis_cfg["single_call_max_tokens"])
+
+    def _plan(self, document_text: str) -> Tuple[List[Section], List[str], Dict[int, Dict[str, Any]]]:
+        """Sections, their cache keys, and the results already cached for unchanged sections."""
+        self.last_failed_sections = []
+        sections = split_sections(document_text, int(self.analysis_cfg["section_tokens"]))
+        keys = [
+            RESULT_CACHE.key("analyze_section", [s.digest], self.section_prompt_version, self.model_id)
+            for s in sections
+        ]
+        cached = {}
+        for s, key in zip(sections, keys):
+            hit = RESULT_CACHE.get("analyze_section", key)
+            if hit is not None:
+                cached[s.index] = hit["result"]
+        self.log.info(
+            f"Map-reduce analysis planned | sections={len(sections)} | cached={len(cached)} | "
+            f"max_concurrency={self.analysis_cfg['max_concurrency']}"
+        )
+        return sections, keys, cached
+
+    def _section_inputs(self, sections: List[Section], todo: List[Section]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "section": s.index + 1,
+                "sections": len(sections),
+                "pages": s.pages,
+                "document_text": s.text,
+                "format_instructions": self.parser.get_format_instructions(),
+            }
+            for s in todo
+        ]
+
+    def _collect(self, todo: List[Section], keys: List[str], results: List[Any], partials: Dict[int, Dict[str, Any]]) -> None:
+        failed = []
+        for s, result in zip(todo, results):
+            if isinstance(result, Exception) or not isinstance(result, dict):
+                failed.append({"section": s.index + 1, "pages": s.pages})
+                self.log.warning(f"Section analysis failed | section={s.index + 1} | pages={s.pages} | error={result}")
+                continue
+            partials[s.index] = result
+            RESULT_CACHE.put("analyze_section", keys[s.index], {"pages": s.pages, "result": result})
+        self.last_failed_sections = failed
+        if todo and len(failed) == len(todo) and not partials:
+            raise RuntimeError("every section analysis failed")
+
+    def _reduce_inputs(self, partials: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+        ordered = [partials[i] for i in sorted(partials)]
+        return {
+            "section_results": json.dumps(ordered, ensure_ascii=False, default=str),
+            "format_instructions": self.parser.get_format_instructions(),
+        }
+
+    def _finish(self, reduced: Any, partials: Dict[int, Dict[str, Any]], document_text: str) -> dict:
+        ordered = [partials[i] for i in sorted(partials)]
+        merged = merge_partials(ordered, page_count(document_text), int(self.analysis_cfg["max_summary_points"]))
+        if isinstance(reduced, dict):
+            # trust the LLM's overall summary / field choices, fill anything it left out locally
+            merged.update({k: v for k, v in reduced.items() if k in merged and v not in (None, "", [])})
+            if page_count(document_text) is not None:
+                merged["PageCount"] = page_count(document_text)
+        self.log.info(f"Map-reduce analysis merged | sections={len(ordered)} | failed={len(self.last_failed_sections)} | reduce={'llm' if isinstance(reduced, dict) else 'local'}")
+        return merged
+
+    def map_reduce_analyze(self, document_text: str) -> dict:
+        try:
+            sections, keys, partials = self._plan(document_text)
+            todo = [s for s in sections if s.index not in partials]
+            if todo:
+                chain = self.section_prompt | self.llm | self.fixing_parser
+                results = chain.batch(
+                    self._section_inputs(sections, todo),
+                    config={"max_concurrency": int(self.analysis_cfg["max_concurrency"])},
+                    return_exceptions=True,
+                )
+                self._collect(todo, keys, results, partials)
+            reduced = None
+            if self.analysis_cfg["reduce"] == "llm" and len(partials) > 1:
+                try:
+                    reduced = (self.reduce_prompt | self.llm | self.fixing_parser).invoke(self._reduce_inputs(partials))
+                except Exception as e:
+                    self.log.warning(f"LLM reduce failed, merging locally | error={e}")
+            return self._finish(reduced, partials, document_text)
+        except Exception as e:
+            self.log.exception(f"Map-reduce analysis failed: {e}")
+            raise DocumentPortalException("Metadata extraction failed", e) from e
+
+    async def amap_reduce_analyze(self, document_text: str) -> dict:
+        """Async variant of map_reduce_analyze()."""
+        try:
+            # result-cache reads/writes are disk I/O (the first one scans the cache dir)
+            sections, keys, partials = await asyncio.to_thread(self._plan, document_text)
+            todo = [s for s in sections if s.index not in partials]
+            if todo:
+                chain = self.section_prompt | self.llm | self.fixing_parser
+                results = await chain.abatch(
+                    self._section_inputs(sections, todo),
+                    config={"max_concurrency": int(self.analysis_cfg["max_concurrency"])},
+                    return_exceptions=True,
+                )
+                await asyncio.to_thread(self._collect, todo, keys, results, partials)
+            reduced = None
+            if self.analysis_cfg["reduce"] == "llm" and len(partials) > 1:
+                try:
+                    reduced = await (self.reduce_prompt | self.llm | self.fixing_parser).ainvoke(self._reduce_inputs(partials))
+                except Exception as e:
+                    self.log.warning(f"LLM reduce failed, merging locally | error={e}")
+            return self._finish(reduced, partials, document_text)
+        except Exception as e:
+            self.log.exception(f"Map-reduce analysis failed: {e}")
+            raise DocumentPortalException("Metadata extraction failed", e) from e
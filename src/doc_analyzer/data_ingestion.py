@@ -1,4 +1,4 @@
-import fitz  # PyMuPDF 
+from utils.pdf_extraction import iter_pdf_pages
 import os
 import uuid
 from datetime import datetime
@@ -60,10 +60,7 @@ class DocumentHandler:
             if not os.path.exists(pdf_path):
                 raise DocumentPortalException("PDF file not found", FileNotFoundError(pdf_path))
 
-            text = ""
-            with fitz.Document(pdf_path) as doc:
-                for page in doc:
-                    text += page.get_text()
+            text = "".join(p.text for p in iter_pdf_pages(pdf_path))
 
             self.log.info(f"PDF read | path={pdf_path} | session_id={self.session_id}")
             return text
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import re
+import hashlib
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from models.models import MetaData
+from utils.token_count import approx_tokens
+
+DEFAULTS: Dict[str, Any] = {
+    "map_reduce": "auto",            # auto | always | never
+    "single_call_max_tokens": 12000,  # auto switches to map-reduce above this
+    "section_tokens": 4000,
+    "max_concurrency": 4,
+    "reduce": "llm",                 # llm | local
+    "max_summary_points": 12,
+}
+
+# page headers written by utils.pdf_extraction.extract_pdf_text
+_PAGE_HEADER = re.compile(r"^\s*--- Page (\d+) ---\s*$", re.MULTILINE)
+_PARAGRAPH = re.compile(r"(?<=\n\n)(?=\S)")
+# an anchor is expected about every _ANCHOR_FILL * section_tokens; sections running past
+# section_tokens before one comes are cut at the budget as before
+_ANCHOR_FILL = 1.0
+_MISSING = {"", "not available", "n/a", "na", "unknown", "none", "null", "not specified", "not mentioned"}
+_FIELDS = [name for name in MetaData.model_fields if name not in ("Summary", "PageCount")]
+
+
+def analysis_config(config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """analysis section of the app config, layered over DEFAULTS."""
+    return {**DEFAULTS, **{k: v for k, v in ((config or {}).get("analysis", {}) or {}).items() if v is not None}}
+
+
+@dataclass
+class Section:
+    index: int
+    text: str
+    first_page: Optional[int] = None
+    last_page: Optional[int] = None
+
+    @property
+    def digest(self) -> str:
+        # page numbers left out: a page inserted earlier renumbers this section without changing it
+        return hashlib.sha256(_PAGE_HEADER.sub("", self.text).encode("utf-8")).hexdigest()
+
+    @property
+    def pages(self) -> str:
+        if self.first_page is None:
+            return "n/a"
+        return str(self.first_page) if self.first_page == self.last_page else f"{self.first_page}-{self.last_page}"
+
+
+def _pages(text: str) -> List[tuple]:
+    """(page number or None, text) blocks, split on page headers when the text has them."""
+    marks = list(_PAGE_HEADER.finditer(text))
+    if not marks:
+        return [(None, text)]
+    blocks = [(None, text[:marks[0].start()])] if text[:marks[0].start()].strip() else []
+    for m, nxt in zip(marks, marks[1:] + [None]):
+        blocks.append((int(m.group(1)), text[m.start():nxt.start() if nxt else len(text)]))
+    return blocks
+
+
+def _cut(text: str, max_tokens: int) -> List[str]:
+    """Split one oversized block on paragraph, then line, then hard character boundaries."""
+    if approx_tokens(text) <= max_tokens:
+        return [text]
+    for sep in ("\n\n", "\n", " "):
+        parts = text.split(sep)
+        if len(parts) > 1:
+            out, cur = [], ""
+            for p in parts:
+                cand = f"{cur}{sep}{p}" if cur else p
+                if cur and approx_tokens(cand) > max_tokens:
+                    out.append(cur)
+                    cur = p
+                else:
+                    cur = cand
+            out.append(cur)
+            return [piece for part in out for piece in _cut(part, max_tokens)]
+    step = max_tokens * 4
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+
+def _anchored(block: str, max_tokens: int) -> bool:
+    """
+    Whether a section boundary follows this block. Decided by the block's own content
+    (with a chance proportional to its share of a section), so an edit only moves the
+    boundaries next to the edited page instead of every boundary after it.
+    """
+    body = _PAGE_HEADER.sub("", block).strip()
+    roll = int.from_bytes(hashlib.sha256(body.encode("utf-8")).digest()[:8], "big") / 2 ** 64
+    return roll < approx_tokens(block) / (max_tokens * _ANCHOR_FILL)
+
+
+def split_sections(text: str, max_tokens: int) -> List[Section]:
+    """
+    Split text into sections of at most max_tokens (approx.) on page boundaries (paragraphs
+    when the text has no page headers); oversized pages are cut. Boundaries are anchored
+    to page content rather than packed greedily, so sections of unchanged pages keep their
+    text (and cached results) when an earlier page is edited, inserted or removed.
+    """
+    sections: List[Section] = []
+    cur: List[str] = []
+    first = last = None
+    used = 0
+
+    def flush():
+        nonlocal cur, first, last, used
+        if cur:
+            sections.append(Section(len(sections), "".join(cur), first, last))
+        cur, first, last, used = [], None, None, 0
+
+    blocks = _pages(text)
+    if len(blocks) == 1 and blocks[0][0] is None:
+        blocks = [(None, b) for b in _PARAGRAPH.split(text) if b]
+    for page, block in blocks:
+        for piece in _cut(block, max_tokens):
+            tokens = approx_tokens(piece)
+            if cur and used + tokens > max_tokens:
+                flush()
+            cur.append(piece)
+            used += tokens
+            if page is not None:
+                first = page if first is None else first
+                last = page
+        if _anchored(block, max_tokens):
+            flush()
+    flush()
+    return sections
+
+
+def page_count(text: str) -> Optional[int]:
+    pages = {int(m.group(1)) for m in _PAGE_HEADER.finditer(text)}
+    return max(pages) if pages else None
+
+
+def _present(value: Any) -> bool:
+    return value is not None and str(value).strip().lower() not in _MISSING
+
+
+def merge_partials(partials: List[Dict[str, Any]], pages: Optional[int] = None, max_summary_points: int = 12) -> Dict[str, Any]:
+    """
+    Local reduce: each metadata field takes the value stated by the most sections
+    (earliest section wins ties), summaries are concatenated in section order without
+    repeats, and PageCount comes from the page headers when there are any.
+    """
+    merged: Dict[str, Any] = {}
+    for name in _FIELDS:
+        values = [str(p.get(name)).strip() for p in partials if _present(p.get(name))]
+        if values:
+            counts = Counter(values)
+            merged[name] = max(values, key=lambda v: (counts[v], -values.index(v)))
+        else:
+            merged[name] = "Not Available"
+
+    summary, seen = [], set()
+    for p in partials:
+        points = p.get("Summary") or []
+        for point in [points] if isinstance(points, str) else points:
+            key = " ".join(str(point).lower().split())
+            if key and key not in seen:
+                seen.add(key)
+                summary.append(str(point).strip())
+    merged["Summary"] = summary[:max_summary_points]
+
+    if pages is not None:
+        merged["PageCount"] = pages
+    else:
+        counts = [p.get("PageCount") for p in partials if _present(p.get("PageCount"))]
+        merged["PageCount"] = Counter(map(str, counts)).most_common(1)[0][0] if counts else "Not Available"
+    return MetaData(**merged).model_dump()
@@ -3,7 +3,7 @@ import sys
 from pathlib import Path
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
-import fitz  
+from utils.pdf_extraction import extract_pdf_text
 
 class DocumentIngestion:
     def __init__(self, base_dir: str = "/Users/ratulsur/Desktop/all_data/document_portal/data/document_compare"):
@@ -46,17 +46,9 @@ class DocumentIngestion:
 
     def read_pdf(self, pdf_path: Path) -> str:
         try:
-            with fitz.open(pdf_path) as doc:
-                if doc.is_encrypted:
-                    raise ValueError(f"PDF is encrypted: {pdf_path.name}")
-                all_text = []
-                for page_num in range(doc.page_count):
-                    page = doc.load_page(page_num)
-                    text = page.get_text()
-                    if text.strip():
-                        all_text.append(f"\n--- Page {page_num + 1} ---\n{text}")
-                self.log.info("PDF read successfully | file=%s | pages=%s", pdf_path, len(all_text))
-                return "\n".join(all_text)
+            text, pages = extract_pdf_text(pdf_path, skip_empty=True, reject_encrypted=True)
+            self.log.info("PDF read successfully | file=%s | pages=%s", pdf_path, pages)
+            return text
         except Exception as e:
             self.log.error("Error reading PDF %s: %s", pdf_path, e)
             raise DocumentPortalException("Error reading PDF document", sys) from e
@@ -1,26 +1,52 @@
 import sys
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List
 from dotenv import load_dotenv
 import pandas as pd
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 from models.models import *
 from prompt.prompt_library import PROMPT_REGISTRY
-from utils.model_loader import ModelLoader
-from langchain.output_parsers import OutputFixingParser
-from langchain_core.output_parsers import JsonOutputParser
+from utils.model_loader import ModelLoader, MODEL_REGISTRY
+from utils.json_repair import LocalFirstFixingParser, RepairingJsonParser
+from utils.result_cache import model_id, prompt_version
+from src.doc_compare.page_diff import PageDiff, no_changes_rows, split_windows
+from utils.concurrency import rate_limiter
+
+COMPARISON_DEFAULTS: Dict[str, Any] = {
+    "window_chars": 12000,
+    "max_concurrency": 4,
+    "requests_per_minute": 0,  # 0 = unlimited
+    "max_retries": 2,
+    "retry_backoff_seconds": 1.0,
+}
+
 
 class DocumentComparerLLM:
-    def __init__(self, config):
+    def __init__(self, config=None):
         load_dotenv()
         self.log = CustomLogger.get_logger(__name__)
 
         try:
             self.loader = ModelLoader(config)
-            self.llm = self.loader.load_llm()
-            self.parser = JsonOutputParser(pydantic_object=SummaryResponse)
-            self.fixing_parser = OutputFixingParser.from_llm(parser=self.parser, llm=self.llm)
+            self.llm = MODEL_REGISTRY.get_llm(self.loader.config)
+            # replies are validated and repaired locally first; the LLM fix call is the last resort
+            self.parser = RepairingJsonParser(pydantic_object=SummaryResponse)
+            self.fixing_parser = LocalFirstFixingParser.from_llm(parser=self.parser, llm=self.llm)
             self.prompt = PROMPT_REGISTRY["document_comparison"]
             self.chain = self.prompt | self.llm | self.fixing_parser
+            self.diff_prompt = PROMPT_REGISTRY["document_comparison_diff"]
+            self.diff_chain = self.diff_prompt | self.llm | self.fixing_parser
+            self.compare_cfg = {**COMPARISON_DEFAULTS, **(self.loader.config.get("comparison") or {})}
+            # identify cached results (utils.result_cache) produced by these prompts + model
+            self.prompt_version = prompt_version(
+                [self.prompt, self.diff_prompt],
+                f"{self.parser.get_format_instructions()}|window_chars={self.compare_cfg['window_chars']}",
+            )
+            self.model_id = model_id(self.loader.config)
+            self.rate_limiter = rate_limiter(self.compare_cfg["requests_per_minute"])
             self.log.info("DocumentComparer initialized")
         except Exception as e:
             self.log.error(f"Initialization failed: {e}")
@@ -32,14 +58,131 @@ class DocumentComparerLLM:
                 "combined_documents": combined_docs,  
                 "format_instructions": self.parser.get_format_instructions()
             }
-            self.log.info("Starting document comparison", inputs=inputs)
+            self.log.info(f"Starting document comparison | chars={len(combined_docs)}")
             response = self.chain.invoke(inputs)
-            self.log.info("Document comparison completed", response=response)
+            self.log.info("Document comparison completed")
             return self._format_response(response)
         except Exception as e:
             self.log.error(f"Error in compare_documents: {e}")
             raise DocumentPortalException("An error occurred while comparing documents.", sys) from e
 
+    async def acompare_documents(self, combined_docs: str) -> pd.DataFrame:
+        """Async variant of compare_documents(); awaits the LLM call."""
+        try:
+            inputs = {
+                "combined_documents": combined_docs,
+                "format_instructions": self.parser.get_format_instructions()
+            }
+            response = await self.chain.ainvoke(inputs)
+            self.log.info("Document comparison completed (async)")
+            return self._format_response(response)
+        except Exception as e:
+            self.log.error(f"Error in acompare_documents: {e}")
+            raise DocumentPortalException("An error occurred while comparing documents.", sys) from e
+
+    def _window_inputs(self, window: PageDiff) -> dict:
+        return {
+            "changed_hunks": window.to_prompt(),
+            "format_instructions": self.parser.get_format_instructions(),
+        }
+
+    @staticmethod
+    def _rows(response) -> List[dict]:
+        if isinstance(response, dict):
+            return [response]
+        return list(response or [])
+
+    def _backoff(self, attempt: int) -> float:
+        return float(self.compare_cfg["retry_backoff_seconds"]) * (2 ** (attempt - 1))
+
+    def _compare_window(self, index: int, window: PageDiff) -> Dict[str, Any]:
+        """One window, retried on its own up to max_retries times."""
+        attempts = int(self.compare_cfg["max_retries"]) + 1
+        for attempt in range(1, attempts + 1):
+            try:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire()
+                rows = self._rows(self.diff_chain.invoke(self._window_inputs(window)))
+                return {"window": index, "pages": window.pages(), "rows": rows, "attempts": attempt}
+            except Exception as e:
+                self.log.warning(f"Window comparison failed | window={index} | attempt={attempt}/{attempts} | error={e}")
+                if attempt == attempts:
+                    raise
+                time.sleep(self._backoff(attempt))
+
+    async def _acompare_window(self, index: int, window: PageDiff, sem: asyncio.Semaphore) -> Dict[str, Any]:
+        attempts = int(self.compare_cfg["max_retries"]) + 1
+        async with sem:
+            for attempt in range(1, attempts + 1):
+                try:
+                    if self.rate_limiter is not None:
+                        await self.rate_limiter.aacquire()
+                    rows = self._rows(await self.diff_chain.ainvoke(self._window_inputs(window)))
+                    return {"window": index, "pages": window.pages(), "rows": rows, "attempts": attempt}
+                except Exception as e:
+                    self.log.warning(
+                        f"Window comparison failed | window={index} | attempt={attempt}/{attempts} | error={e}"
+                    )
+                    if attempt == attempts:
+                        return {"window": index, "pages": window.pages(), "error": str(e), "attempts": attempt}
+                    await asyncio.sleep(self._backoff(attempt))
+
+    def windows(self, diff: PageDiff) -> List[PageDiff]:
+        return split_windows(diff, int(self.compare_cfg["window_chars"]))
+
+    def compare_diff(self, diff: PageDiff) -> pd.DataFrame:
+        """
+        Describe the changes in a page_diff.PageDiff: only the changed hunks reach the LLM,
+        split into page windows compared in parallel (comparison.max_concurrency, rate-limited
+        by comparison.requests_per_minute). Identical documents return NO CHANGES IDENTIFIED
+        without an LLM call.
+        """
+        try:
+            if diff.identical:
+                self.log.info("Documents identical, LLM comparison skipped")
+                return self._format_response(no_changes_rows())
+            windows = self.windows(diff)
+            with ThreadPoolExecutor(max_workers=int(self.compare_cfg["max_concurrency"])) as pool:
+                results = list(pool.map(lambda iw: self._compare_window(*iw), enumerate(windows)))
+            self.log.info(f"Diff comparison completed | windows={len(windows)} | {diff.stats()}")
+            return self._format_response([row for r in results for row in r["rows"]])
+        except Exception as e:
+            self.log.error(f"Error in compare_diff: {e}")
+            raise DocumentPortalException("An error occurred while comparing documents.", sys) from e
+
+    async def astream_diff(self, diff: PageDiff) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Compare page windows concurrently and yield each window's result as it completes:
+        {"window", "pages", "rows", "attempts"}, or {"window", "pages", "error", "attempts"}
+        once a window has used up its retries. Other windows are unaffected by a failure.
+        """
+        if diff.identical:
+            yield {"window": 0, "pages": "ALL", "rows": no_changes_rows(), "attempts": 0}
+            return
+        windows = self.windows(diff)
+        sem = asyncio.Semaphore(int(self.compare_cfg["max_concurrency"]))
+        tasks = [asyncio.create_task(self._acompare_window(i, w, sem)) for i, w in enumerate(windows)]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield await done
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    async def acompare_diff(self, diff: PageDiff) -> pd.DataFrame:
+        """Async variant of compare_diff(); rows keep page order regardless of completion order."""
+        try:
+            results = [r async for r in self.astream_diff(diff)]
+            failed = [r for r in results if "error" in r]
+            if failed:
+                raise RuntimeError(f"{len(failed)} window(s) failed: {failed[0]['error']}")
+            results.sort(key=lambda r: r["window"])
+            self.log.info(f"Diff comparison completed (async) | windows={len(results)} | {diff.stats()}")
+            return self._format_response([row for r in results for row in r["rows"]])
+        except Exception as e:
+            self.log.error(f"Error in acompare_diff: {e}")
+            raise DocumentPortalException("An error occurred while comparing documents.", sys) from e
+
     def _format_response(self, response_parsed: list[dict]) -> pd.DataFrame:
 
         """
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import difflib
+import hashlib
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.pdf_extraction import PageText
+
+NO_CHANGES = "NO CHANGES IDENTIFIED"
+
+
+def normalize_lines(text: str) -> List[str]:
+    """Lines with Unicode width/ligature forms folded, whitespace collapsed and blank lines dropped."""
+    lines = (" ".join(unicodedata.normalize("NFKC", line).split()) for line in text.splitlines())
+    return [line for line in lines if line]
+
+
+@dataclass
+class Page:
+    number: int
+    lines: List[str]
+    digest: str
+
+    @classmethod
+    def from_text(cls, number: int, text: str) -> "Page":
+        lines = normalize_lines(text)
+        return cls(number, lines, hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest())
+
+
+@dataclass
+class PageChange:
+    """One changed page: a modified pair, or a page only one side has (ref or act is None)."""
+    ref: Optional[Page]
+    act: Optional[Page]
+    hunks: List[str] = field(default_factory=list)
+
+    @property
+    def kind(self) -> str:
+        if self.ref is None:
+            return "inserted"
+        if self.act is None:
+            return "deleted"
+        return "modified"
+
+    def header(self) -> str:
+        if self.kind == "inserted":
+            return f"=== Actual page {self.act.number} (inserted; no reference page) ==="
+        if self.kind == "deleted":
+            return f"=== Reference page {self.ref.number} (deleted; no actual page) ==="
+        return f"=== Reference page {self.ref.number} vs Actual page {self.act.number} ==="
+
+
+@dataclass
+class PageDiff:
+    reference_pages: int
+    actual_pages: int
+    changes: List[PageChange]
+    full_chars: int
+
+    @property
+    def identical(self) -> bool:
+        return not self.changes
+
+    def pages(self) -> str:
+        """Page span covered by the changes, for progress events and logs."""
+        labels = [
+            f"{c.ref.number if c.ref else '-'}/{c.act.number if c.act else '-'}" for c in self.changes
+        ]
+        return ", ".join(labels)
+
+    def to_prompt(self) -> str:
+        """Changed hunks only, each under a page header; '-' lines are reference, '+' lines actual."""
+        blocks = []
+        for c in self.changes:
+            blocks.append("\n".join([c.header(), *c.hunks]))
+        return "\n\n".join(blocks)
+
+    def stats(self) -> Dict[str, Any]:
+        prompt_chars = len(self.to_prompt())
+        return {
+            "reference_pages": self.reference_pages,
+            "actual_pages": self.actual_pages,
+            "changed_pages": len(self.changes),
+            "identical": self.identical,
+            "full_chars": self.full_chars,
+            "prompt_chars": prompt_chars,
+            "prompt_ratio": round(prompt_chars / self.full_chars, 4) if self.full_chars else 0.0,
+        }
+
+
+def _span(start: int, stop: int) -> str:
+    if stop <= start:
+        return "none"
+    return str(start + 1) if stop == start + 1 else f"{start + 1}-{stop}"
+
+
+def _line_hunks(ref: List[str], act: List[str], context: int) -> List[str]:
+    """Line-level diff of one page pair, with 1-based line numbers on each side."""
+    hunks = []
+    matcher = difflib.SequenceMatcher(None, ref, act, autojunk=False)
+    for group in matcher.get_grouped_opcodes(context):
+        r0, r1 = group[0][1], group[-1][2]
+        a0, a1 = group[0][3], group[-1][4]
+        hunks.append(f"@@ reference lines {_span(r0, r1)} | actual lines {_span(a0, a1)} @@")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                hunks.extend(f"  {line}" for line in ref[i1:i2])
+                continue
+            hunks.extend(f"- [{i + 1}] {ref[i]}" for i in range(i1, i2))
+            hunks.extend(f"+ [{j + 1}] {act[j]}" for j in range(j1, j2))
+    return hunks
+
+
+def diff_pages(reference: Iterable[PageText], actual: Iterable[PageText], context: int = 1) -> PageDiff:
+    """
+    Align the two documents page by page and diff only the pages that differ.
+
+    Pages are compared by the hash of their normalized text, and aligned with a
+    sequence match over those hashes, so an inserted or deleted page does not make
+    every later page look changed. Within a replaced run, pages are paired in order;
+    the surplus on either side is reported as inserted / deleted.
+    """
+    full_chars = 0
+    ref_pages: List[Page] = []
+    act_pages: List[Page] = []
+    for target, pages in ((ref_pages, reference), (act_pages, actual)):
+        for p in pages:
+            full_chars += len(p.text)
+            target.append(Page.from_text(p.number, p.text))
+
+    changes: List[PageChange] = []
+    matcher = difflib.SequenceMatcher(
+        None, [p.digest for p in ref_pages], [p.digest for p in act_pages], autojunk=False
+    )
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        refs, acts = ref_pages[i1:i2], act_pages[j1:j2]
+        for k in range(max(len(refs), len(acts))):
+            r = refs[k] if k < len(refs) else None
+            a = acts[k] if k < len(acts) else None
+            change = PageChange(r, a)
+            change.hunks = _line_hunks(r.lines if r else [], a.lines if a else [], context)
+            changes.append(change)
+    return PageDiff(len(ref_pages), len(act_pages), changes, full_chars)
+
+
+def split_windows(diff: PageDiff, max_chars: int) -> List[PageDiff]:
+    """
+    Group consecutive changed pages into windows of at most max_chars of prompt text,
+    each still a PageDiff, so windows can be compared independently and in parallel.
+    A single page larger than max_chars gets a window of its own.
+    """
+    windows: List[PageDiff] = []
+    cur: List[PageChange] = []
+    used = 0
+    for change in diff.changes:
+        size = len(change.header()) + sum(len(h) + 1 for h in change.hunks)
+        if cur and used + size > max_chars:
+            windows.append(PageDiff(diff.reference_pages, diff.actual_pages, cur, diff.full_chars))
+            cur, used = [], 0
+        cur.append(change)
+        used += size
+    if cur:
+        windows.append(PageDiff(diff.reference_pages, diff.actual_pages, cur, diff.full_chars))
+    return windows
+
+
+def no_changes_rows() -> List[Dict[str, str]]:
+    """The comparison result for identical documents, shaped like SummaryResponse rows."""
+    return [{"page": "ALL", "changes": NO_CHANGES}]
@@ -1,24 +1,54 @@
 import sys
 import os
+import time
+import asyncio
 from operator import itemgetter
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
 from langchain_community.vectorstores import FAISS
 from logger.custom_logger import CustomLogger
-from utils.model_loader import ModelLoader
+from utils.model_loader import MODEL_REGISTRY
+from utils.index_cache import FAISS_INDEX_CACHE
+from utils.answer_cache import ANSWER_CACHE, Probe
+from utils.segment_store import load_vectorstore
+from utils.ann_index import with_search_params
+from utils.bm25_index import BM25Index, bm25_config
+from src.multidoc_chat.mmr import MMRRetriever
+from src.multidoc_chat.hybrid import HybridRetriever
+from src.multidoc_chat.adaptive import AdaptiveRetriever, adaptive_config
+from src.multidoc_chat.query_rewrite import REWRITE_GATE, history_digest
+from src.multidoc_chat.contextual_compression import ContextCompressor
 from exception.custom_exception import DocumentPortalException
 from prompt.prompt_library import PROMPT_REGISTRY
 from models.models import PromptType
 
+# retrieval settings a single invoke()/ainvoke()/astream() call may override
+RETRIEVAL_PARAMS = (
+    "search_type", "k", "fetch_k", "lambda_mult", "nprobe", "ef_search",
+    "min_k", "min_similarity", "max_drop", "token_budget",
+)
+
 class ConversationalRAG:
-    def __init__(self, session_id: str, retriever=None):
+    def __init__(self, session_id: str, retriever=None, config: Optional[Dict[str, Any]] = None):
         try:
             self.log = CustomLogger.get_logger(__name__)
             self.session_id = session_id
-            if retriever is None:
-                raise ValueError("Retriever is none!")
             self.retriever = retriever
+            self.chain = None
+            self.config = config or MODEL_REGISTRY.default_config()
+            # optional local compression of retrieved chunks before they reach the prompt
+            self.compressor = ContextCompressor.from_config(MODEL_REGISTRY.get_embeddings(self.config), self.config)
+            self.last_compression: Optional[Dict[str, Any]] = None
+            # answers are cached per (index version, retrieval settings, question); see utils.answer_cache
+            self.index_path: Optional[str] = None
+            self.last_cache: Optional[Dict[str, Any]] = None
+            # the loaded store and its retrieval settings; per-call overrides are layered on top
+            self.vectorstore = None
+            self.retrieval: Dict[str, Any] = {}
+            self.last_retrieval: Optional[Dict[str, Any]] = None
+            self.last_rewrite: Optional[Dict[str, Any]] = None
 
             self.llm = self._load_llm()
 
@@ -26,7 +56,9 @@ class ConversationalRAG:
             self.contextualize_prompt = self._resolve_prompt(PromptType.CONTEXTUALIZE_QUESTION)
             self.qa_prompt = self._resolve_prompt(PromptType.CONTEXT_QA)
 
-            self._build_lcel_chain()
+            # retriever may be attached later via load_retriever_from_faiss()
+            if self.retriever is not None:
+                self._build_lcel_chain()
             self.log.info("conversationalRAG initialized | session_id=%s", session_id)
 
         except Exception as e:
@@ -50,18 +82,46 @@ class ConversationalRAG:
         )
         raise DocumentPortalException("Required prompt missing from PROMPT_REGISTRY", sys)
 
-    def load_retriever_from_faiss(self, index_path: str):
-        """Loads a retriever from FAISS and rebuilds the chain."""
+    def load_retriever_from_faiss(
+        self,
+        index_path: str,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        search_type: str = "similarity",
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        k: int = 5,
+        **adaptive,
+    ):
+        """Loads a retriever from FAISS and rebuilds the chain.
+        k is the number of chunks retrieved (the upper bound for search_type="adaptive");
+        nprobe (IVF) / ef_search (HNSW) override the index defaults for this retriever only;
+        search_type="mmr" reranks the top fetch_k hits for diversity (lambda_mult 1 = pure relevance);
+        search_type="hybrid" fuses the FAISS and BM25 top fetch_k with reciprocal rank fusion;
+        search_type="adaptive" stops adding chunks once similarity drops or the token budget is
+        spent (min_k, min_similarity, max_drop, token_budget; defaults from retriever.adaptive).
+        These become the defaults; invoke()/ainvoke()/astream() can override any of them per call."""
         try:
-            embeddings = ModelLoader().load_embeddings()
+            embeddings = MODEL_REGISTRY.get_embeddings(self.config)
             if not os.path.isdir(index_path):
                 raise DocumentPortalException(f"FAISS directory not found: {index_path}", sys)
-            vectorstore = FAISS.load_local(
-                folder_path=index_path,
-                embeddings=embeddings,
-                allow_dangerous_deserialization=True,
+            # hot sessions are served from the process-wide cache (no disk I/O / unpickling)
+            self.vectorstore = FAISS_INDEX_CACHE.get(
+                index_path,
+                lambda: self._load_index(index_path, embeddings),
             )
-            self.retriever = vectorstore.as_retriever(search_type='similarity', search_kwargs={'k': 5})
+            self.retrieval = {
+                "search_type": search_type,
+                "k": k,
+                "fetch_k": fetch_k,
+                "lambda_mult": lambda_mult,
+                "nprobe": nprobe,
+                "ef_search": ef_search,
+                **adaptive_config(self.config),
+            }
+            self.retrieval.update(self._check_overrides(adaptive))
+            self.retriever = self._make_retriever(self.retrieval)
+            self.index_path = index_path
             self.log.info("FAISS loaded successfully | path=%s", index_path)
             self._build_lcel_chain()
             return self.retriever
@@ -69,23 +129,264 @@ class ConversationalRAG:
             self.log.error("Some error in loading the retriever | error=%s", str(e))
             raise DocumentPortalException("Retry creating the retriever", sys) from e
 
-    def invoke(self, user_input: str, chat_history: Optional[List[BaseMessage]] = None) -> str:
+    @staticmethod
+    def _check_overrides(overrides: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        overrides = {key: v for key, v in (overrides or {}).items() if v is not None}
+        unknown = set(overrides) - set(RETRIEVAL_PARAMS)
+        if unknown:
+            raise ValueError(f"Unsupported retrieval parameters: {sorted(unknown)}")
+        return overrides
+
+    def _params(self, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return {**self.retrieval, **self._check_overrides(overrides)}
+
+    def _make_retriever(self, params: Dict[str, Any]):
+        """A retriever for these settings over the loaded store; cheap enough to build per call."""
+        vectorstore = with_search_params(self.vectorstore, nprobe=params["nprobe"], ef_search=params["ef_search"])
+        search_type, k = params["search_type"], int(params["k"])
+        if search_type == "mmr":
+            return MMRRetriever(
+                vectorstore=vectorstore, k=k, fetch_k=params["fetch_k"], lambda_mult=params["lambda_mult"]
+            )
+        if search_type == "hybrid":
+            return HybridRetriever(
+                vectorstore=vectorstore,
+                bm25=getattr(vectorstore, "bm25", None),
+                k=k,
+                fetch_k=params["fetch_k"],
+                rrf_k=bm25_config(self.config)["rrf_k"],
+            )
+        if search_type == "adaptive":
+            return AdaptiveRetriever(
+                vectorstore=vectorstore,
+                k=k,
+                min_k=params["min_k"],
+                min_similarity=params["min_similarity"],
+                max_drop=params["max_drop"],
+                token_budget=params["token_budget"],
+            )
+        if search_type == "similarity":
+            return vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": k})
+        raise ValueError(f"Unsupported search_type: {search_type}")
+
+    @staticmethod
+    def _retrieval_key(params: Dict[str, Any]) -> str:
+        """Settings that change which chunks are retrieved (part of the answer cache key)."""
+        keys = ["k", "nprobe", "ef_search"] + {
+            "mmr": ["fetch_k", "lambda_mult"],
+            "hybrid": ["fetch_k"],
+            "adaptive": ["min_k", "min_similarity", "max_drop", "token_budget"],
+        }.get(params["search_type"], [])
+        return "|".join([params["search_type"]] + [f"{key}={params[key]}" for key in keys])
+
+    def _search(self, query: str, overrides: Optional[Dict[str, Any]] = None) -> List[Any]:
+        params = self._params(overrides)
+        retriever = self._make_retriever(params) if overrides else self.retriever
+        if isinstance(retriever, AdaptiveRetriever):
+            docs, info = retriever.select(query)
+        else:
+            docs = retriever.invoke(query)
+            info = {"kept": len(docs)}
+        self.last_retrieval = {"search_type": params["search_type"], "k": int(params["k"]), **info}
+        return docs
+
+    def _rewrite_inputs(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return {"input": inputs["input"], "chat_history": inputs.get("chat_history") or []}
+
+    def _retrieve(self, inputs: Dict[str, Any]) -> List[Any]:
+        """Chain step: make a follow-up standalone (only when the rewrite gate says it needs it),
+        then retrieve with the call's inputs["retrieval"] overrides."""
+        rewrite_inputs = self._rewrite_inputs(inputs)
+        query, self.last_rewrite = REWRITE_GATE.rewrite(
+            inputs["input"], rewrite_inputs["chat_history"], lambda: self.rewrite_chain.invoke(rewrite_inputs)
+        )
+        return self._search(query, inputs.get("retrieval"))
+
+    async def _aretrieve(self, inputs: Dict[str, Any]) -> List[Any]:
+        rewrite_inputs = self._rewrite_inputs(inputs)
+        query, self.last_rewrite = await REWRITE_GATE.arewrite(
+            inputs["input"], rewrite_inputs["chat_history"], lambda: self.rewrite_chain.ainvoke(rewrite_inputs)
+        )
+        return await asyncio.to_thread(self._search, query, inputs.get("retrieval"))
+
+    def _load_index(self, index_path: str, embeddings) -> FAISS:
+        """FAISS store plus, when present, the session's BM25 index (cached together)."""
+        vectorstore = load_vectorstore(index_path, embeddings)
+        vectorstore.bm25 = (
+            BM25Index.from_config(index_path, self.config) if BM25Index.exists(index_path) else None
+        )
+        return vectorstore
+
+    def _embed_question(self, question: str) -> List[float]:
+        return MODEL_REGISTRY.get_embeddings(self.config).embed_query(question)
+
+    def _cache_probe(
+        self, user_input: str, chat_history: List[BaseMessage], retrieval: Optional[Dict[str, Any]] = None
+    ) -> Optional[Probe]:
+        if self.index_path is None or not ANSWER_CACHE.enabled:
+            self.last_cache = None
+            return None
+        variant = self._retrieval_key(self._params(retrieval))
+        if REWRITE_GATE.needs_history(user_input, chat_history):
+            # a follow-up's answer depends on the earlier turns: only the same recent history matches
+            variant += "|history=" + history_digest(chat_history, REWRITE_GATE.history_messages)
+        return ANSWER_CACHE.probe(self.index_path, variant, user_input)
+
+    def _cache_hit(self, hit: Optional[Dict[str, Any]], start: float) -> Optional[str]:
+        if hit is None:
+            self.last_cache = {"hit": False}
+            return None
+        self.last_cache = {"hit": True, **{k: v for k, v in hit.items() if k != "answer"}}
+        self.last_cache["ms"] = round((time.perf_counter() - start) * 1000, 2)
+        self.log.info("answer served from cache | session_id=%s | cache=%s", self.session_id, self.last_cache)
+        return hit["answer"]
+
+    def invoke(
+        self,
+        user_input: str,
+        chat_history: Optional[List[BaseMessage]] = None,
+        retrieval: Optional[Dict[str, Any]] = None,
+    ) -> str:
         try:
+            if self.chain is None:
+                raise ValueError("Retriever not loaded; call load_retriever_from_faiss() first")
             chat_history = chat_history or []
-            payload = {"input": user_input, "chat_history": chat_history}
+            start = time.perf_counter()
+            probe = self._cache_probe(user_input, chat_history, retrieval)
+            if probe is not None:
+                cached = self._cache_hit(ANSWER_CACHE.get(probe, self._embed_question), start)
+                if cached is not None:
+                    return cached
+            payload = {"input": user_input, "chat_history": chat_history, "retrieval": retrieval}
             answer = self.chain.invoke(payload)
             if not answer:
                 self.log.warning("no answer generated")
                 return "no answer generated"
+            if probe is not None:
+                ANSWER_CACHE.put(probe, answer, self._embed_question)
             self.log.info("chain invoked successfully")
             return answer  
         except Exception as e:
             self.log.error("Some error in invoking | error=%s", str(e))
             raise DocumentPortalException("Retry invoking", sys) from e
 
+    async def ainvoke(
+        self,
+        user_input: str,
+        chat_history: Optional[List[BaseMessage]] = None,
+        retrieval: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Async variant of invoke(); awaits the LLM instead of blocking the event loop."""
+        try:
+            if self.chain is None:
+                raise ValueError("Retriever not loaded; call load_retriever_from_faiss() first")
+            chat_history = chat_history or []
+            start = time.perf_counter()
+            probe = self._cache_probe(user_input, chat_history, retrieval)
+            if probe is not None:
+                hit = await asyncio.to_thread(ANSWER_CACHE.get, probe, self._embed_question)
+                cached = self._cache_hit(hit, start)
+                if cached is not None:
+                    return cached
+            payload = {"input": user_input, "chat_history": chat_history, "retrieval": retrieval}
+            answer = await self.chain.ainvoke(payload)
+            if not answer:
+                self.log.warning("no answer generated")
+                return "no answer generated"
+            if probe is not None:
+                await asyncio.to_thread(ANSWER_CACHE.put, probe, answer, self._embed_question)
+            self.log.info("chain invoked successfully (async)")
+            return answer
+        except Exception as e:
+            self.log.error("Some error in async invoking | error=%s", str(e))
+            raise DocumentPortalException("Retry invoking", sys) from e
+
+    async def astream(
+        self,
+        user_input: str,
+        chat_history: Optional[List[BaseMessage]] = None,
+        retrieval: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the answer as events: 'sources' (retrieved chunk metadata) first,
+        then one 'token' per LLM chunk, then 'done' with timing breakdowns in ms.
+        A cached answer is sent as a single 'token' followed by 'done'.
+        """
+        try:
+            if self.chain is None:
+                raise ValueError("Retriever not loaded; call load_retriever_from_faiss() first")
+            chat_history = chat_history or []
+            t0 = time.perf_counter()
+            ms = lambda a, b: round((b - a) * 1000, 2)
+
+            probe = self._cache_probe(user_input, chat_history, retrieval)
+            if probe is not None:
+                hit = await asyncio.to_thread(ANSWER_CACHE.get, probe, self._embed_question)
+                cached = self._cache_hit(hit, t0)
+                if cached is not None:
+                    yield {"event": "token", "data": cached}
+                    t_end = time.perf_counter()
+                    yield {"event": "done", "data": {
+                        "retrieve_ms": 0.0,
+                        "first_token_ms": ms(t0, t_end),
+                        "total_ms": ms(t0, t_end),
+                        "cache": self.last_cache,
+                    }}
+                    return
+
+            docs = await self._aretrieve({"input": user_input, "chat_history": chat_history, "retrieval": retrieval})
+            t_retrieved = time.perf_counter()
+            yield {"event": "sources", "data": [self._source_info(i, d) for i, d in enumerate(docs)]}
+
+            context = await asyncio.to_thread(self._build_context, {"input": user_input, "docs": docs})
+            prompt_value = await self.qa_prompt.ainvoke(
+                {"context": context, "input": user_input, "chat_history": chat_history}
+            )
+            t_prompt = time.perf_counter()
+
+            t_first = None
+            tokens: List[str] = []
+            async for token in self.generation_chain.astream(prompt_value):
+                if t_first is None:
+                    t_first = time.perf_counter()
+                tokens.append(token)
+                yield {"event": "token", "data": token}
+            t_end = time.perf_counter()
+            answer = "".join(tokens)
+            if probe is not None and answer:
+                await asyncio.to_thread(ANSWER_CACHE.put, probe, answer, self._embed_question)
+
+            timings = {
+                "retrieve_ms": ms(t0, t_retrieved),
+                "prompt_build_ms": ms(t_retrieved, t_prompt),
+                "first_token_ms": ms(t0, t_first) if t_first else None,
+                "total_ms": ms(t0, t_end),
+            }
+            if self.last_compression is not None:
+                timings["compression"] = self.last_compression
+            timings["retrieval"] = self.last_retrieval
+            timings["rewrite"] = self.last_rewrite
+            if self.last_cache is not None:
+                timings["cache"] = self.last_cache
+            self.log.info("chain streamed successfully | timings=%s", timings)
+            yield {"event": "done", "data": timings}
+        except Exception as e:
+            self.log.error("Some error in streaming | error=%s", str(e))
+            raise DocumentPortalException("Retry streaming", sys) from e
+
+    @staticmethod
+    def _source_info(rank: int, doc) -> Dict[str, Any]:
+        md = dict(doc.metadata or {})
+        return {
+            "rank": rank + 1,
+            "source": md.get("source") or md.get("file_path"),
+            "page": md.get("page"),
+            "metadata": md,
+        }
+
     def _load_llm(self):
         try:
-            llm = ModelLoader().load_llm()
+            llm = MODEL_REGISTRY.get_llm()
             if not llm:
                 raise ValueError("Failed to load LLM")
             self.log.info("LLM loaded successfully")
@@ -98,10 +399,25 @@ class ConversationalRAG:
     def _format_docs(docs):
         return "\n\n".join(d.page_content for d in docs)
 
+    def _build_context(self, inputs: Dict[str, Any]) -> str:
+        """Join the retrieved chunks, or compress them to the relevant sentences when enabled."""
+        if self.compressor is None:
+            return self._format_docs(inputs["docs"])
+        context, self.last_compression = self.compressor.compress(inputs["input"], inputs["docs"])
+        return context
+
     def _build_lcel_chain(self):
         try:
-            # use retriever to fetch docs -> format -> pass as 'context'
-            retrieve_docs = self.retriever | self._format_docs
+            # use retriever to fetch docs -> format / compress -> pass as 'context'
+            # per-call retrieval overrides ride along in the payload, so the chain is built once
+            retrieve_docs = {
+                "docs": RunnableLambda(self._retrieve, afunc=self._aretrieve),
+                "input": itemgetter("input"),
+            } | RunnableLambda(self._build_context)
+            # prompt -> answer; astream() drives this part directly to stream tokens
+            self.generation_chain = self.llm | StrOutputParser()
+            # follow-up -> standalone question; only called when REWRITE_GATE can't skip it
+            self.rewrite_chain = self.contextualize_prompt | self.llm | StrOutputParser()
             self.chain = (
                 {
                     "context": retrieve_docs,
@@ -109,8 +425,7 @@ class ConversationalRAG:
                     "chat_history": itemgetter("chat_history"),
                 }
                 | self.qa_prompt
-                | self.llm
-                | StrOutputParser()   
+                | self.generation_chain
             )
             self.log.info("LCEL graph created successfully")
         except Exception as e:
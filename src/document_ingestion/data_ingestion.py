@@ -9,89 +9,239 @@ import shutil
 from pathlib import Path
 from typing import Iterable, List, Optional, Dict, Any
 
-import fitz  # PyMuPDF
 from langchain.schema import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 
-from utils.model_loader import ModelLoader
+from utils.model_loader import ModelLoader, MODEL_REGISTRY
+from utils.index_cache import FAISS_INDEX_CACHE
+from utils.answer_cache import ANSWER_CACHE
+from utils.segment_store import SegmentStore, load_vectorstore
+from utils.ann_index import build_index, choose_index_type, index_config, index_type_of
+from utils.bm25_index import BM25Index
+from src.document_ingestion.embedding_pipeline import EmbeddingPipeline
 from exception.custom_exception import DocumentPortalException
-from utils.file_io import generate_session_id, save_uploaded_files
+from utils.file_io import generate_session_id, save_uploaded_files, stream_upload, UploadTooLargeError
 from utils.document_ops import load_documents, concat_for_analysis, concat_for_comparison
+from utils.pdf_extraction import extract_pdf_text, iter_pdf_pages
+from src.doc_compare.page_diff import PageDiff, diff_pages
 from logger import GLOBAL_LOGGER  # use the global, configured logger
 
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 
 
 class FaissManager:
-    """Load-or-create wrapper for FAISS + simple idempotent add."""
+    """
+    Load-or-create wrapper for FAISS with an idempotent, content-addressed ingest.
+
+    The index is persisted as an append-only SegmentStore, so each ingest writes only
+    the new vectors and chunks. Its ingest log records every chunk seen so far:
+      rows    - chunk key (content hash | source | page | offset) -> content hash
+      content - content hash -> key of the chunk that was actually embedded
+    A chunk whose key is already in rows is skipped; a chunk whose text is already
+    indexed under another key is recorded as a duplicate and not embedded again.
+
+    Unless retriever.bm25.enabled is false, a BM25Index in the same directory gets the
+    newly embedded chunks (under the same row ids) right after each FAISS commit.
+    """
     def __init__(self, index_dir: Path, model_loader: Optional[ModelLoader] = None):
         self.log = GLOBAL_LOGGER
 
         self.index_dir = Path(index_dir)
         self.index_dir.mkdir(parents=True, exist_ok=True)
 
-        self.meta_path = self.index_dir / "ingested_meta.json"
-        self._meta: Dict[str, Any] = {"rows": {}}
-
-        if self.meta_path.exists():
-            try:
-                self._meta = json.loads(self.meta_path.read_text(encoding="utf-8")) or {"rows": {}}
-            except Exception:
-                self._meta = {"rows": {}}
-
         self.model_loader = model_loader or ModelLoader()
-        self.emb = self.model_loader.load_embeddings()
+        faiss_cfg = self.model_loader.config.get("faiss_db", {}) or {}
+        self.store = SegmentStore(self.index_dir, compact_segments=faiss_cfg.get("compact_segments", 16))
+        self.ann_cfg = index_config(self.model_loader.config)
+        self._meta: Dict[str, Dict[str, str]] = {"rows": {}, "content": {}}
+        self.bm25 = BM25Index.from_config(self.index_dir, self.model_loader.config)
+        self._bm25_pending: List[tuple] = []
+
+        self.emb = MODEL_REGISTRY.get_embeddings(self.model_loader.config)
+        self.pipeline = EmbeddingPipeline.from_config(self.emb, self.model_loader.config)
         self.vs: Optional[FAISS] = None
 
     def _exists(self) -> bool:
-        return (self.index_dir / "index.faiss").exists() and (self.index_dir / "index.pkl").exists()
+        return self.store.exists() or self.store.has_legacy()
 
     @staticmethod
-    def _fingerprint(text: str, md: Dict[str, Any]) -> str:
-        src = md.get("source") or md.get("file_path")
-        rid = md.get("row_id")
-        if src is not None:
-            return f"{src}::{'' if rid is None else rid}"
+    def _content_hash(text: str) -> str:
         return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-    def _save_meta(self) -> None:
-        self.meta_path.write_text(json.dumps(self._meta, ensure_ascii=False, indent=2), encoding="utf-8")
-
-    def add_documents(self, docs: List[Document]) -> int:
-        if self.vs is None:
-            raise RuntimeError("Call load_or_create() before add_documents().")
+    @classmethod
+    def _fingerprint(cls, text: str, md: Dict[str, Any]) -> str:
+        src = md.get("source") or md.get("file_path") or ""
+        page = md.get("page", "")
+        offset = md.get("start_index", md.get("row_id", ""))
+        return f"{cls._content_hash(text)}|{src}|{page}|{offset}"
+
+    def _apply_records(self, records: List[Dict[str, Any]]) -> None:
+        for r in records:
+            self._meta["rows"][r["k"]] = r["h"]
+            if not r["d"]:
+                self._meta["content"].setdefault(r["h"], r["k"])
+
+    def _backfill_records(self) -> None:
+        """Indexes migrated from save_local have no ingest log yet; derive it from the docstore."""
+        records = [
+            {"k": self._fingerprint(doc.page_content, doc.metadata or {}), "h": self._content_hash(doc.page_content), "d": 0}
+            for doc in self.vs.docstore
+        ]
+        self.store.begin()
+        self.store.commit(records)
+        self._apply_records(records)
+        self.log.info(f"FAISS ingest log rebuilt | rows={len(records)} | index={self.index_dir}")
+
+    def _embed_into_index(self, docs: List[Document]) -> Dict[str, Any]:
+        """Embed docs in length-sorted batches; each batch goes into the index and a store segment."""
+        def sink(batch: List[Document], vectors) -> None:
+            pairs = list(zip((d.page_content for d in batch), vectors))
+            metas = [d.metadata for d in batch]
+            # docstore ids are row numbers, matching the columnar docstore on disk
+            start = self.vs.index.ntotal if self.vs is not None else 0
+            ids = [str(start + j) for j in range(len(batch))]
+            if self.vs is None:
+                self.vs = FAISS.from_embeddings(pairs, self.emb, metadatas=metas, ids=ids)
+            else:
+                self.vs.add_embeddings(pairs, metadatas=metas, ids=ids)
+            self.store.append(ids, vectors, batch)
+            self._bm25_pending.extend((int(i), d.page_content) for i, d in zip(ids, batch))
+
+        return self.pipeline.run(docs, sink)
+
+    def _load(self) -> FAISS:
+        self.vs = load_vectorstore(self.index_dir, self.emb)
+        records = self.store.read_ingest_log()
+        if records or not self.vs.index.ntotal:
+            self._apply_records(records)
+        else:
+            self._backfill_records()
+        self._catch_up_bm25()
+        return self.vs
 
+    def _reload(self) -> None:
+        self.vs = None
+        self._meta = {"rows": {}, "content": {}}
+        self.bm25 = BM25Index.from_config(self.index_dir, self.model_loader.config)
+        self._load()
+
+    def _catch_up_bm25(self) -> None:
+        """Index FAISS rows the BM25 index lacks (built before it existed, or a crash between the two commits)."""
+        if self.bm25 is None:
+            return
+        ntotal = self.vs.index.ntotal
+        if self.bm25.rows > ntotal:
+            self.log.warning(f"BM25 index ahead of FAISS, rebuilding | bm25={self.bm25.rows} | faiss={ntotal}")
+            self.bm25.clear()
+        if self.bm25.rows < ntotal:
+            rows = list(range(self.bm25.rows, ntotal))
+            docs = [self.vs.docstore.search(self.vs.index_to_docstore_id[r]) for r in rows]
+            self.bm25.add(rows, [d.page_content for d in docs])
+            self.log.info(f"BM25 index caught up | rows={len(rows)} | index={self.index_dir}")
+
+    def ingest(self, docs: List[Document]) -> Dict[str, int]:
+        """
+        Add docs to the index (creating it if needed), embedding each unique chunk exactly once.
+        Returns counts of added, skipped (already ingested) and duplicate (same text elsewhere) chunks.
+        """
+        # one ingest per index at a time across worker processes: the BM25 index and the
+        # in-memory view are updated alongside the store
+        with self.store.write_lock:
+            return self._ingest(docs)
+
+    def _ingest(self, docs: List[Document]) -> Dict[str, int]:
+        if self.vs is None and self._exists():
+            self._reload()  # the BM25 view opened in __init__ may predate another process's commit
+        elif self.vs is None and self.bm25 is not None and self.bm25.rows:
+            self.bm25.clear()  # left over from a deleted FAISS index
+
+        rows, content = self._meta["rows"], self._meta["content"]
+        seen_keys, seen_hashes = set(), set()
         new_docs: List[Document] = []
+        records: List[Dict[str, Any]] = []
+        skipped = duplicates = 0
         for d in docs:
             key = self._fingerprint(d.page_content, d.metadata or {})
-            if key in self._meta["rows"]:
+            if key in rows or key in seen_keys:
+                skipped += 1
+                continue
+            seen_keys.add(key)
+            h = self._content_hash(d.page_content)
+            dup = h in content or h in seen_hashes
+            records.append({"k": key, "h": h, "d": int(dup)})
+            if dup:
+                duplicates += 1
                 continue
-            self._meta["rows"][key] = True
+            seen_hashes.add(h)
             new_docs.append(d)
 
-        if new_docs:
-            self.vs.add_documents(new_docs)
-            self.vs.save_local(str(self.index_dir))
-            self._save_meta()
+        if records:
+            self.store.begin()
+            if self.store.committed_rows != (self.vs.index.ntotal if self.vs is not None else 0):
+                # another worker process committed since this view was loaded: reload and redo
+                self.store.abort()
+                self._reload()
+                return self._ingest(docs)
+            self._bm25_pending = []
+            try:
+                if new_docs:
+                    self._embed_into_index(new_docs)
+            except Exception:
+                self.store.abort()
+                raise
+            self.store.commit(records)
+            self._apply_records(records)
+            if self.bm25 is not None and self._bm25_pending:
+                rows, texts = zip(*self._bm25_pending)
+                try:
+                    self.bm25.add(list(rows), list(texts))
+                except Exception as e:
+                    # FAISS is committed; the next load catches the BM25 index up
+                    self.log.warning(f"BM25 update failed | error={e} | index={self.index_dir}")
+            self._bm25_pending = []
+            if new_docs:
+                self._maybe_compact()
+                FAISS_INDEX_CACHE.invalidate(self.index_dir)
+                ANSWER_CACHE.invalidate(self.index_dir)
+
+        report = {"added": len(new_docs), "skipped": skipped, "duplicates": duplicates}
+        self.log.info(
+            f"FAISS ingest | added={report['added']} | skipped={skipped} | duplicates={duplicates} | "
+            f"index={self.index_dir}"
+        )
+        return report
+
+    def _maybe_compact(self) -> None:
+        """Switch index type as the corpus grows (faiss_db.index), retrain IVF, or fold recent rows into the base."""
+        index_type = choose_index_type(self.vs.index.ntotal, self.ann_cfg)
+        reason = self.store.needs_compaction(index_type, self.ann_cfg["retrain_growth"])
+        if reason is None:
+            return
+        if reason == "fold" or (reason == "retype" and index_type_of(self.vs.index) == index_type):
+            # the in-memory index already holds every committed row
+            index = self.vs.index
+        else:
+            index = build_index(self.store.vectors(), index_type, self.ann_cfg)
+        self.store.compact(index, index_type, trained=reason != "fold")
+        self.vs.index = index
+        self.log.info(f"FAISS index compacted | reason={reason} | type={index_type} | index={self.index_dir}")
 
-        return len(new_docs)
+    def add_documents(self, docs: List[Document]) -> int:
+        if self.vs is None:
+            raise RuntimeError("Call load_or_create() before add_documents().")
+        return self.ingest(docs)["added"]
 
     def load_or_create(self, texts: Optional[List[str]] = None, metadatas: Optional[List[dict]] = None) -> FAISS:
         # Load existing index if present
         if self._exists():
-            self.vs = FAISS.load_local(
-                str(self.index_dir),
-                embeddings=self.emb,
-                allow_dangerous_deserialization=True,
-            )
-            return self.vs
+            return self._load()
 
         # Create new
         if not texts:
             raise DocumentPortalException("No existing FAISS index and no data to create one", ValueError("no texts"))
-        self.vs = FAISS.from_texts(texts=texts, embedding=self.emb, metadatas=metadatas or [])
-        self.vs.save_local(str(self.index_dir))
+        metadatas = metadatas or [{} for _ in texts]
+        self.ingest([Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)])
         return self.vs
 
 
@@ -135,7 +285,10 @@ class ChatIngestor:
         return base
 
     def _split(self, docs: List[Document], chunk_size=1000, chunk_overlap=200) -> List[Document]:
-        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        # start_index gives every chunk a stable offset for the ingest manifest
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+        )
         chunks = splitter.split_documents(docs)
         self.log.info(
             f"Documents split | chunks={len(chunks)} | chunk_size={chunk_size} | overlap={chunk_overlap}"
@@ -159,19 +312,11 @@ class ChatIngestor:
             chunks = self._split(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
 
             fm = FaissManager(self.faiss_dir, self.model_loader)
+            # loads or creates the index; each unique chunk is embedded exactly once
+            self.ingest_report = fm.ingest(chunks)
+            self.log.info(f"FAISS index updated | {self.ingest_report} | index={self.faiss_dir}")
 
-            texts = [c.page_content for c in chunks]
-            metas = [c.metadata for c in chunks]
-
-            try:
-                vs = fm.load_or_create(texts=texts, metadatas=metas)
-            except Exception:
-                vs = fm.load_or_create(texts=texts, metadatas=metas)
-
-            added = fm.add_documents(chunks)
-            self.log.info(f"FAISS index updated | added={added} | index={self.faiss_dir}")
-
-            return vs.as_retriever(search_type="similarity", search_kwargs={"k": k})
+            return fm.vs.as_retriever(search_type="similarity", search_kwargs={"k": k})
 
         except Exception as e:
             self.log.error(f"Failed to build retriever | error={e}")
@@ -196,6 +341,7 @@ class DocHandler:
         self.session_id = session_id or generate_session_id("session")
         self.session_path = os.path.join(self.data_dir, self.session_id)
         os.makedirs(self.session_path, exist_ok=True)
+        self.last_digest: Optional[str] = None  # sha256 of the last saved PDF, computed while streaming it
         self.log.info(
             f"DocHandler initialized | session_id={self.session_id} | session_path={self.session_path}"
         )
@@ -207,30 +353,25 @@ class DocHandler:
                 raise ValueError("Invalid file type. Only PDFs are allowed.")
 
             save_path = os.path.join(self.session_path, filename)
-            with open(save_path, "wb") as f:
-                if hasattr(uploaded_file, "read"):
-                    f.write(uploaded_file.read())
-                else:
-                    f.write(uploaded_file.getbuffer())
+            size, digest = stream_upload(uploaded_file, Path(save_path))
+            self.last_digest = digest
 
             self.log.info(
-                f"PDF saved successfully | file={filename} | save_path={save_path} | session_id={self.session_id}"
+                f"PDF saved successfully | file={filename} | save_path={save_path} | bytes={size} | "
+                f"sha256={digest} | session_id={self.session_id}"
             )
             return save_path
+        except UploadTooLargeError:
+            raise
         except Exception as e:
             self.log.error(f"Failed to save PDF | error={e} | session_id={self.session_id}")
             raise DocumentPortalException(f"Failed to save PDF: {str(e)}", e) from e
 
     def read_pdf(self, pdf_path: str) -> str:
         try:
-            text_chunks: List[str] = []
-            with fitz.open(pdf_path) as doc:
-                for page_num in range(doc.page_count):
-                    page = doc.load_page(page_num)
-                    text_chunks.append(f"\n--- Page {page_num + 1} ---\n{page.get_text()}")  # type: ignore
-            text = "\n".join(text_chunks)
+            text, pages = extract_pdf_text(pdf_path)
             self.log.info(
-                f"PDF read successfully | pdf_path={pdf_path} | pages={len(text_chunks)} | session_id={self.session_id}"
+                f"PDF read successfully | pdf_path={pdf_path} | pages={pages} | session_id={self.session_id}"
             )
             return text
         except Exception as e:
@@ -249,43 +390,57 @@ class DocumentComparator:
         self.session_id = session_id or generate_session_id()
         self.session_path = self.base_dir / self.session_id
         self.session_path.mkdir(parents=True, exist_ok=True)
+        self.last_digests: List[str] = []  # sha256 of the last saved (reference, actual) pair
         self.log.info(f"DocumentComparator initialized | session_path={self.session_path}")
 
     def save_uploaded_files(self, reference_file, actual_file):
         try:
             ref_path = self.session_path / reference_file.name
             act_path = self.session_path / actual_file.name
-            for fobj, out in ((reference_file, ref_path), (actual_file, act_path)):
+            for fobj in (reference_file, actual_file):
                 if not fobj.name.lower().endswith(".pdf"):
                     raise ValueError("Only PDF files are allowed.")
-                with open(out, "wb") as f:
-                    if hasattr(fobj, "read"):
-                        f.write(fobj.read())
-                    else:
-                        f.write(fobj.getbuffer())
-            self.log.info(f"Files saved | reference={ref_path} | actual={act_path} | session={self.session_id}")
+            ref_size, ref_digest = stream_upload(reference_file, ref_path)
+            act_size, act_digest = stream_upload(actual_file, act_path)
+            self.last_digests = [ref_digest, act_digest]
+            self.log.info(
+                f"Files saved | reference={ref_path} | actual={act_path} | bytes={ref_size + act_size} | "
+                f"session={self.session_id}"
+            )
             return ref_path, act_path
+        except UploadTooLargeError:
+            raise
         except Exception as e:
             self.log.error(f"Error saving PDF files | error={e} | session={self.session_id}")
             raise DocumentPortalException("Error saving files", e) from e
 
     def read_pdf(self, pdf_path: Path) -> str:
         try:
-            with fitz.open(pdf_path) as doc:
-                if doc.is_encrypted:
-                    raise ValueError(f"PDF is encrypted: {pdf_path.name}")
-                parts: List[str] = []
-                for page_num in range(doc.page_count):
-                    page = doc.load_page(page_num)
-                    text = page.get_text()  # type: ignore
-                    if text.strip():
-                        parts.append(f"\n --- Page {page_num + 1} --- \n{text}")
-            self.log.info(f"PDF read successfully | file={pdf_path} | pages={len(parts)}")
-            return "\n".join(parts)
+            text, pages = extract_pdf_text(
+                pdf_path,
+                page_header=lambda n: f"\n --- Page {n} --- \n",
+                skip_empty=True,
+                reject_encrypted=True,
+            )
+            self.log.info(f"PDF read successfully | file={pdf_path} | pages={pages}")
+            return text
         except Exception as e:
             self.log.error(f"Error reading PDF | file={pdf_path} | error={e}")
             raise DocumentPortalException("Error reading PDF", e) from e
 
+    def diff_documents(self, reference_path: Path, actual_path: Path) -> PageDiff:
+        """Page-aligned diff of the two PDFs (see page_diff.diff_pages); cheap enough to run before any LLM call."""
+        try:
+            diff = diff_pages(
+                iter_pdf_pages(reference_path, reject_encrypted=True),
+                iter_pdf_pages(actual_path, reject_encrypted=True),
+            )
+            self.log.info(f"Documents diffed | {diff.stats()} | session={self.session_id}")
+            return diff
+        except Exception as e:
+            self.log.error(f"Error diffing documents | error={e} | session={self.session_id}")
+            raise DocumentPortalException("Error diffing documents", e) from e
+
     def combine_documents(self) -> str:
         try:
             doc_parts: List[str] = []
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import copy
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from langchain.schema import Document
+
+from utils.embedding_cache import CachedEmbeddings
+from utils.model_loader import ModelLoader, ModelRegistry
+from logger import GLOBAL_LOGGER
+
+# Called with (documents, vectors) for every finished batch, in completion order
+BatchSink = Callable[[List[Document], np.ndarray], None]
+
+_PROCESS_POOLS: Dict[str, ProcessPoolExecutor] = {}
+_PROCESS_POOLS_LOCK = threading.Lock()
+_WORKER_EMBEDDINGS = None
+
+
+def _init_worker(config: Dict[str, Any]) -> None:
+    # each worker process loads its own copy of the model; the on-disk cache
+    # stays with the parent so only one process ever appends to it
+    global _WORKER_EMBEDDINGS
+    cfg = copy.deepcopy(config)
+    cfg.setdefault("embedding_model", {}).setdefault("cache", {})["enabled"] = False
+    _WORKER_EMBEDDINGS = ModelLoader(cfg).load_embeddings()
+
+
+def _embed_in_worker(texts: List[str]) -> np.ndarray:
+    return np.asarray(_WORKER_EMBEDDINGS.embed_documents(texts), dtype=np.float32)
+
+
+def _process_pool(config: Dict[str, Any], workers: int) -> ProcessPoolExecutor:
+    key = f"{ModelRegistry.fingerprint(config.get('embedding_model'))}:{workers}"
+    with _PROCESS_POOLS_LOCK:
+        if key not in _PROCESS_POOLS:
+            _PROCESS_POOLS[key] = ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(config,)
+            )
+        return _PROCESS_POOLS[key]
+
+
+class EmbeddingPipeline:
+    """
+    Dedicated embedding stage for ingestion.
+    Chunks are sorted by token length and packed into batches (less padding per batch),
+    batches run on `workers` threads or processes, and each finished batch is handed
+    to a sink (e.g. a FAISS add) so at most a few batches of vectors are held at once.
+    """
+    def __init__(
+        self,
+        embeddings,
+        config: Optional[Dict[str, Any]] = None,
+        batch_size: int = 64,
+        workers: int = 2,
+        mode: str = "thread",
+    ):
+        self.log = GLOBAL_LOGGER
+        self.embeddings = embeddings
+        self.config = config or {}
+        self.batch_size = max(1, int(batch_size))
+        self.workers = max(1, int(workers))
+        self.mode = (mode or "thread").lower()
+        if self.mode not in ("thread", "process"):
+            raise ValueError(f"Unknown embedding pipeline mode: {mode}")
+        self._tokenizer = self._find_tokenizer(embeddings)
+
+    @classmethod
+    def from_config(cls, embeddings, config: Optional[Dict[str, Any]] = None) -> "EmbeddingPipeline":
+        cfg = (config or {}).get("embedding_pipeline", {}) or {}
+        return cls(
+            embeddings,
+            config=config,
+            batch_size=cfg.get("batch_size", 64),
+            workers=cfg.get("workers", 2),
+            mode=cfg.get("mode", "thread"),
+        )
+
+    @staticmethod
+    def _find_tokenizer(embeddings):
+        # sentence-transformers backends expose their tokenizer on .client
+        backend = getattr(embeddings, "backend", embeddings)
+        return getattr(getattr(backend, "client", None), "tokenizer", None)
+
+    def token_length(self, text: str) -> int:
+        if self._tokenizer is not None:
+            try:
+                return len(self._tokenizer.tokenize(text))
+            except Exception:
+                self._tokenizer = None
+        return len(text.split())
+
+    def make_batches(self, docs: List[Document]) -> List[List[int]]:
+        order = sorted(range(len(docs)), key=lambda i: self.token_length(docs[i].page_content))
+        return [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+
+    def _embed_fn(self) -> Callable[[List[str]], Any]:
+        if self.mode == "process":
+            pool = _process_pool(self.config, self.workers)
+            return lambda texts: pool.submit(_embed_in_worker, texts).result()
+        backend = self.embeddings.backend if isinstance(self.embeddings, CachedEmbeddings) else self.embeddings
+        return backend.embed_documents
+
+    def _embed_batch(self, texts: List[str], embed_fn) -> np.ndarray:
+        if isinstance(self.embeddings, CachedEmbeddings):
+            return np.stack(self.embeddings.embed_with(texts, embed_fn))
+        return np.asarray(embed_fn(texts), dtype=np.float32)
+
+    def run(self, docs: List[Document], sink: BatchSink) -> Dict[str, Any]:
+        if not docs:
+            return {"chunks": 0, "batches": 0, "seconds": 0.0, "chunks_per_sec": 0.0}
+
+        batches = self.make_batches(docs)
+        embed_fn = self._embed_fn()
+        start = time.perf_counter()
+        latencies: List[float] = []
+
+        def job(idx: List[int]):
+            t0 = time.perf_counter()
+            vectors = self._embed_batch([docs[i].page_content for i in idx], embed_fn)
+            return idx, vectors, time.perf_counter() - t0
+
+        # the embedding calls run on these threads; in process mode they only wait on the pool
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed") as ex:
+            pending = set()
+            queue = iter(batches)
+            for idx in queue:
+                pending.add(ex.submit(job, idx))
+                if len(pending) >= self.workers * 2:
+                    break
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    idx, vectors, latency = fut.result()
+                    latencies.append(latency)
+                    sink([docs[i] for i in idx], vectors)
+                    self.log.info(
+                        f"Embedding batch done | size={len(idx)} | latency_ms={latency * 1000:.1f} | "
+                        f"batches={len(latencies)}/{len(batches)}"
+                    )
+                    nxt = next(queue, None)
+                    if nxt is not None:
+                        pending.add(ex.submit(job, nxt))
+
+        elapsed = time.perf_counter() - start
+        stats = {
+            "chunks": len(docs),
+            "batches": len(batches),
+            "seconds": round(elapsed, 4),
+            "chunks_per_sec": round(len(docs) / elapsed, 2) if elapsed else 0.0,
+            "batch_latency_ms_avg": round(1000 * sum(latencies) / len(latencies), 2),
+            "batch_latency_ms_max": round(1000 * max(latencies), 2),
+            "workers": self.workers,
+            "mode": self.mode,
+        }
+        self.log.info(
+            f"Embedding pipeline finished | chunks={stats['chunks']} | batches={stats['batches']} | "
+            f"chunks_per_sec={stats['chunks_per_sec']} | workers={self.workers} | mode={self.mode}"
+        )
+        return stats
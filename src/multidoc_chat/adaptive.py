@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from utils.token_count import approx_tokens
+from src.multidoc_chat.mmr import stored_vectors
+
+DEFAULTS: Dict[str, Any] = {
+    "min_k": 1,             # always keep at least this many chunks
+    "min_similarity": 0.3,  # cosine floor for any further chunk
+    "max_drop": 0.2,        # stop once a chunk is this much less similar than the best one
+    "token_budget": 1500,   # approx. prompt tokens of retrieved chunks
+}
+
+
+def adaptive_config(config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """retriever.adaptive section of the app config, layered over DEFAULTS."""
+    cfg = ((config or {}).get("retriever", {}) or {}).get("adaptive", {}) or {}
+    return {**DEFAULTS, **{k: v for k, v in cfg.items() if v is not None}}
+
+
+def adaptive_cutoff(
+    similarities: Sequence[float],
+    tokens: Sequence[int],
+    min_k: int = 1,
+    min_similarity: float = 0.3,
+    max_drop: float = 0.2,
+    token_budget: int = 1500,
+) -> Tuple[int, str]:
+    """
+    How many of the ranked chunks to keep, and why the cut was made there: chunks are
+    added best first until one falls below min_similarity, drops more than max_drop
+    below the best, or would push the total past token_budget. The first min_k chunks
+    are always kept.
+    """
+    if not len(similarities):
+        return 0, "empty"
+    best = float(similarities[0])
+    used = 0
+    for i, (sim, n) in enumerate(zip(similarities, tokens)):
+        if i >= min_k:
+            if sim < min_similarity:
+                return i, "min_similarity"
+            if best - sim > max_drop:
+                return i, "max_drop"
+            if used + n > token_budget:
+                return i, "token_budget"
+        used += n
+    return len(similarities), "k"
+
+
+class AdaptiveRetriever(BaseRetriever):
+    """
+    Dynamic top-k: the FAISS top-k (k is the upper bound) is cut short by adaptive_cutoff,
+    using cosine similarities computed from the stored vectors, so easy questions send
+    fewer chunks to the LLM.
+    """
+    vectorstore: Any
+    k: int = 8
+    min_k: int = DEFAULTS["min_k"]
+    min_similarity: float = DEFAULTS["min_similarity"]
+    max_drop: float = DEFAULTS["max_drop"]
+    token_budget: int = DEFAULTS["token_budget"]
+
+    def select(self, query: str) -> Tuple[List[Document], Dict[str, Any]]:
+        """The kept chunks and a summary of the cut (kept, candidates, reason, similarities)."""
+        embedding = np.asarray([self.vectorstore._embed_query(query)], dtype=np.float32)
+        _, indices = self.vectorstore.index.search(embedding, self.k)
+        rows = [int(i) for i in indices[0] if i >= 0]
+        docs = []
+        for row in rows:
+            doc = self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[row])
+            docs.append(doc if isinstance(doc, Document) else None)
+        keep = [i for i, d in enumerate(docs) if d is not None]
+        rows, docs = [rows[i] for i in keep], [docs[i] for i in keep]
+        if not rows:
+            return [], {"kept": 0, "candidates": 0, "reason": "empty", "similarities": []}
+
+        vectors = stored_vectors(self.vectorstore, rows)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        q = embedding[0] / max(float(np.linalg.norm(embedding[0])), 1e-12)
+        sims = vectors @ q
+        # FAISS order can differ from cosine order (L2 on unnormalized vectors, ANN)
+        order = np.argsort(-sims, kind="stable")
+        sims = sims[order]
+        docs = [docs[i] for i in order]
+
+        n, reason = adaptive_cutoff(
+            sims,
+            [approx_tokens(d.page_content) for d in docs],
+            min_k=self.min_k,
+            min_similarity=self.min_similarity,
+            max_drop=self.max_drop,
+            token_budget=self.token_budget,
+        )
+        info = {
+            "kept": n,
+            "candidates": len(docs),
+            "reason": reason,
+            "similarities": [round(float(s), 4) for s in sims[:n]],
+        }
+        return docs[:n], info
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        return self.select(query)[0]
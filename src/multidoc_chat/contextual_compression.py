@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from logger import GLOBAL_LOGGER as log
+from utils.token_count import approx_tokens
+
+# sentence ends, or line breaks between blocks (PDF text is often one line per heading / list item)
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+|\n\s*\n|\n(?=\s*(?:[-•*]|\d+[.)])\s)")
+GAP = "…"
+
+
+def split_sentences(text: str, min_chars: int = 20) -> List[str]:
+    """Split into sentence-like spans; very short fragments are merged into their neighbour."""
+    spans: List[str] = []
+    for part in _SENTENCE_END.split(text):
+        part = " ".join(part.split())
+        if not part:
+            continue
+        if spans and (len(part) < min_chars or len(spans[-1]) < min_chars):
+            spans[-1] = f"{spans[-1]} {part}"
+        else:
+            spans.append(part)
+    return spans
+
+
+@dataclass
+class _Span:
+    doc: int
+    pos: int
+    text: str
+    tokens: int
+
+
+class ContextCompressor:
+    """
+    Local (no LLM call) contextual compression for retrieved chunks.
+
+    Every chunk is split into sentences, which are scored by cosine similarity to the
+    query embedding. The best sentences are kept, in score order, until token_budget
+    is reached; a sentence nearly identical (redundancy_threshold) to one already kept,
+    from any chunk, is dropped. Kept sentences are re-emitted in their original order,
+    with gaps marked, so the LLM still sees coherent excerpts.
+    """
+    def __init__(
+        self,
+        embeddings,
+        token_budget: int = 1200,
+        min_similarity: float = 0.15,
+        redundancy_threshold: float = 0.9,
+    ):
+        self.embeddings = embeddings
+        self.token_budget = int(token_budget)
+        self.min_similarity = float(min_similarity)
+        self.redundancy_threshold = float(redundancy_threshold)
+
+    @classmethod
+    def from_config(cls, embeddings, config: Optional[Dict[str, Any]] = None) -> Optional["ContextCompressor"]:
+        cfg = ((config or {}).get("retriever", {}) or {}).get("compression", {}) or {}
+        if not cfg.get("enabled", False):
+            return None
+        return cls(
+            embeddings,
+            token_budget=cfg.get("token_budget", 1200),
+            min_similarity=cfg.get("min_similarity", 0.15),
+            redundancy_threshold=cfg.get("redundancy_threshold", 0.9),
+        )
+
+    @staticmethod
+    def _unit(x: np.ndarray) -> np.ndarray:
+        return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+    def compress(self, query: str, docs: List[Document]) -> Tuple[str, Dict[str, Any]]:
+        """Return (context, stats); stats carries tokens before/after and the compression ratio."""
+        start = time.perf_counter()
+        spans = [
+            _Span(d, p, s, approx_tokens(s))
+            for d, doc in enumerate(docs)
+            for p, s in enumerate(split_sentences(doc.page_content))
+        ]
+        tokens_in = sum(approx_tokens(doc.page_content) for doc in docs)
+        if not spans:
+            return "", self._stats(docs, spans, [], tokens_in, 0, start)
+
+        q = self._unit(np.asarray(self.embeddings.embed_query(query), dtype=np.float32))
+        # sentences skip the persistent chunk cache (CachedEmbeddings): they are many, rarely
+        # repeat, and writing them would put disk appends on the query path
+        backend = getattr(self.embeddings, "backend", self.embeddings)
+        vecs = self._unit(np.asarray(backend.embed_documents([s.text for s in spans]), dtype=np.float32))
+        scores = vecs @ q
+
+        kept: List[int] = []
+        used = 0
+        for i in np.argsort(-scores):
+            i = int(i)
+            if kept and scores[i] < self.min_similarity:
+                break
+            if used + spans[i].tokens > self.token_budget:
+                if kept:
+                    continue
+            if kept and float(np.max(vecs[kept] @ vecs[i])) >= self.redundancy_threshold:
+                continue
+            kept.append(i)
+            used += spans[i].tokens
+            if used >= self.token_budget:
+                break
+
+        context = self._assemble(docs, spans, kept)
+        return context, self._stats(docs, spans, kept, tokens_in, approx_tokens(context), start)
+
+    @staticmethod
+    def _assemble(docs: List[Document], spans: List[_Span], kept: List[int]) -> str:
+        by_doc: Dict[int, List[_Span]] = {}
+        for i in sorted(kept, key=lambda i: (spans[i].doc, spans[i].pos)):
+            by_doc.setdefault(spans[i].doc, []).append(spans[i])
+        blocks = []
+        for d in sorted(by_doc):
+            parts, prev = [], None
+            for s in by_doc[d]:
+                if prev is not None and s.pos != prev + 1:
+                    parts.append(GAP)
+                parts.append(s.text)
+                prev = s.pos
+            blocks.append(" ".join(parts))
+        return "\n\n".join(blocks)
+
+    def _stats(self, docs, spans, kept, tokens_in: int, tokens_out: int, start: float) -> Dict[str, Any]:
+        stats = {
+            "chunks": len(docs),
+            "chunks_kept": len({spans[i].doc for i in kept}),
+            "sentences": len(spans),
+            "sentences_kept": len(kept),
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "compression_ratio": round(tokens_out / tokens_in, 4) if tokens_in else 1.0,
+            "ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+        log.info(
+            f"Context compressed | chunks={stats['chunks']} | sentences={stats['sentences_kept']}/{stats['sentences']} | "
+            f"tokens={tokens_in}->{tokens_out} | ratio={stats['compression_ratio']} | ms={stats['ms']}"
+        )
+        return stats
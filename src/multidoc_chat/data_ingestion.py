@@ -3,12 +3,13 @@ from pathlib import Path
 import sys
 from datetime import datetime, timezone
 
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
+from langchain_community.document_loaders import Docx2txtLoader, TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 
 from exception.custom_exception import DocumentPortalException
 from utils.model_loader import ModelLoader
+from utils.pdf_extraction import iter_pdf_documents
 from logger.custom_logger import CustomLogger
 
 
@@ -79,7 +80,8 @@ class DocumentIngestor:
 
                 # Load via appropriate loader
                 if ext == ".pdf":
-                    loader = PyPDFLoader(str(temp_path))
+                    documents.extend(iter_pdf_documents(temp_path))
+                    continue
                 elif ext == ".docx":
                     loader = Docx2txtLoader(str(temp_path))
                 elif ext in (".txt", ".md"):
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from utils.bm25_index import reciprocal_rank_fusion
+
+
+def dense_rows(vectorstore, query: str, fetch_k: int) -> List[int]:
+    """FAISS row ids of the fetch_k nearest chunks, best first."""
+    embedding = np.asarray([vectorstore._embed_query(query)], dtype=np.float32)
+    _, indices = vectorstore.index.search(embedding, fetch_k)
+    return [int(i) for i in indices[0] if i >= 0]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense + sparse retrieval: the FAISS top-fetch_k and the BM25 top-fetch_k are fused
+    with reciprocal rank fusion (rrf_k dampens the weight of the very first ranks).
+    Both indexes share the session's row ids, so fusion needs no document matching.
+    """
+    vectorstore: Any
+    bm25: Any
+    k: int = 5
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        fetch_k = max(self.k, self.fetch_k)
+        rankings = [dense_rows(self.vectorstore, query, fetch_k)]
+        if self.bm25 is not None:
+            rankings.append([row for row, _ in self.bm25.search(query, fetch_k)])
+        out = []
+        for row in reciprocal_rank_fusion(rankings, k=self.rrf_k, limit=self.k):
+            doc = self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[row])
+            if isinstance(doc, Document):
+                out.append(doc)
+        return out
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+
+def mmr_select(
+    query: np.ndarray,
+    candidates: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+) -> List[int]:
+    """
+    Maximal Marginal Relevance over candidate vectors (rows), by cosine similarity.
+    Keeps a running max-similarity-to-selected vector, so each of the k steps is a
+    single (fetch_k x dim) @ (dim,) product: O(fetch_k * k * dim) overall.
+    Returns positions into candidates, in selection order.
+    """
+    n = len(candidates)
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    cand = np.asarray(candidates, dtype=np.float32)
+    cand = cand / np.maximum(np.linalg.norm(cand, axis=1, keepdims=True), 1e-12)
+    q = np.asarray(query, dtype=np.float32).ravel()
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+
+    similarity = cand @ q
+    relevance = lambda_mult * similarity
+    max_sim = np.full(n, -np.inf, dtype=np.float32)
+    chosen = np.zeros(n, dtype=bool)
+    selected: List[int] = []
+
+    # first pick is the most relevant candidate (no redundancy term yet), whatever lambda_mult is
+    idx = int(np.argmax(similarity))
+    for _ in range(k):
+        selected.append(idx)
+        chosen[idx] = True
+        if len(selected) == k:
+            break
+        np.maximum(max_sim, cand @ cand[idx], out=max_sim)
+        score = relevance - (1.0 - lambda_mult) * max_sim
+        score[chosen] = -np.inf
+        idx = int(np.argmax(score))
+    return selected
+
+
+def stored_vectors(vectorstore, rows: Sequence[int]) -> np.ndarray:
+    """Embeddings for index rows without re-embedding: the store's memmap if present, else FAISS reconstruct."""
+    raw = getattr(vectorstore, "raw_vectors", None)
+    rows = np.asarray(rows, dtype=np.int64)
+    if raw is not None and len(rows) and rows.max() < len(raw):
+        return np.asarray(raw[rows], dtype=np.float32)
+    return vectorstore.index.reconstruct_batch(rows)
+
+
+def mmr_search_by_vector(
+    vectorstore,
+    embedding: Sequence[float],
+    k: int = 5,
+    fetch_k: int = 20,
+    lambda_mult: float = 0.5,
+) -> List[Tuple[Document, float]]:
+    """Fetch fetch_k nearest rows, MMR-rerank them, and materialize only the k picks."""
+    query = np.asarray([embedding], dtype=np.float32)
+    distances, indices = vectorstore.index.search(query, max(k, fetch_k))
+    keep = indices[0] >= 0
+    rows, distances = indices[0][keep], distances[0][keep]
+    if not len(rows):
+        return []
+
+    picks = mmr_select(query[0], stored_vectors(vectorstore, rows), k, lambda_mult)
+    out = []
+    for p in picks:
+        doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(rows[p])])
+        if isinstance(doc, Document):
+            out.append((doc, float(distances[p])))
+    return out
+
+
+class MMRRetriever(BaseRetriever):
+    """Retriever that diversifies a FAISS top-fetch_k with mmr_search_by_vector."""
+    vectorstore: Any
+    k: int = 5
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        embedding = self.vectorstore._embed_query(query)
+        return [doc for doc, _ in mmr_search_by_vector(
+            self.vectorstore, embedding, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult
+        )]
+
+
+def benchmark(
+    vectorstore,
+    queries: np.ndarray,
+    k: int = 5,
+    fetch_k: int = 50,
+    lambda_mult: float = 0.5,
+) -> Dict[str, Any]:
+    """Latency of this MMR vs LangChain's FAISS MMR on the same queries, and how often they agree."""
+    ours_ms, lc_ms, overlap = [], [], 0
+    for q in np.asarray(queries, dtype=np.float32):
+        t0 = time.perf_counter()
+        mine = mmr_search_by_vector(vectorstore, q, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
+        ours_ms.append((time.perf_counter() - t0) * 1000)
+        t0 = time.perf_counter()
+        theirs = vectorstore.max_marginal_relevance_search_with_score_by_vector(
+            q.tolist(), k=k, fetch_k=fetch_k, lambda_mult=lambda_mult
+        )
+        lc_ms.append((time.perf_counter() - t0) * 1000)
+        overlap += len({d.page_content for d, _ in mine} & {d.page_content for d, _ in theirs})
+    return {
+        "queries": len(queries),
+        "k": k,
+        "fetch_k": fetch_k,
+        "lambda": lambda_mult,
+        "mmr_ms_avg": round(float(np.mean(ours_ms)), 4),
+        "langchain_mmr_ms_avg": round(float(np.mean(lc_ms)), 4),
+        "speedup": round(float(np.mean(lc_ms) / max(np.mean(ours_ms), 1e-9)), 2),
+        "agreement": round(overlap / (k * len(queries)), 4),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    from langchain_community.embeddings import FakeEmbeddings
+    from utils.segment_store import load_vectorstore
+
+    rng = np.random.default_rng(0)
+    if len(sys.argv) > 1:
+        vs = load_vectorstore(sys.argv[1], FakeEmbeddings(size=1))
+        data = np.asarray(vs.raw_vectors)
+    else:
+        from langchain_community.vectorstores import FAISS
+        data = rng.normal(size=(20_000, 384)).astype(np.float32)
+        vs = FAISS.from_embeddings([(str(i), v) for i, v in enumerate(data.tolist())], FakeEmbeddings(size=384))
+    # blend two stored vectors per query: a corpus row itself would make every MMR score tie
+    pairs = rng.choice(len(data), size=(100, 2))
+    qs = data[pairs[:, 0]] + data[pairs[:, 1]]
+    for fk in (20, 50, 100):
+        print(benchmark(vs, qs, k=5, fetch_k=fk))
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage
+
+from logger import GLOBAL_LOGGER as log
+from utils.answer_cache import normalize_question
+
+DEFAULTS: Dict[str, Any] = {
+    "gate": True,             # skip the rewrite LLM call for self-contained questions
+    "cache_entries": 2048,
+    "history_messages": 6,    # most recent messages that key the rewrite cache
+    "short_question_words": 3,
+}
+
+# words that only make sense against an earlier turn (anaphora, deixis, comparison)
+_ANAPHORA = re.compile(
+    r"\b(it|its|it's|they|them|their|theirs|this|that|these|those|he|him|his|she|her|hers|"
+    r"there|then|former|latter|above|aforementioned|mentioned|previous|previously|earlier|same|"
+    r"another|else|also|too|again|instead|more)\b",
+    re.IGNORECASE,
+)
+# openings that continue the previous question (ellipsis)
+_ELLIPSIS = re.compile(
+    r"^\s*(and|but|or|so|also|what about|how about|why not|what if|what else|and what|"
+    r"same for|same with|compared to|versus|vs\.?|which one)\b",
+    re.IGNORECASE,
+)
+
+
+def rewrite_cue(question: str, short_question_words: int = 3) -> Optional[str]:
+    """Why a question may depend on earlier turns ('ellipsis', 'anaphora', 'short'), or None."""
+    if _ELLIPSIS.search(question):
+        return "ellipsis"
+    if _ANAPHORA.search(question):
+        return "anaphora"
+    if len(question.split()) <= short_question_words:
+        return "short"
+    return None
+
+
+def history_digest(history: Sequence[BaseMessage], last: int) -> str:
+    h = hashlib.sha256()
+    for m in list(history)[-last:]:
+        h.update(f"{m.type}\x00{m.content}\x01".encode("utf-8"))
+    return h.hexdigest()
+
+
+class RewriteGate:
+    """
+    Decides locally whether a question needs the contextualize-question LLM call, and
+    caches the rewrites it does make.
+
+    No history, or a question without anaphora / ellipsis cues (and not just a couple
+    of words), is used as-is. Otherwise the rewrite is looked up in an LRU keyed by
+    (digest of the recent history, normalized question) before the LLM is called.
+    """
+    def __init__(
+        self,
+        gate: bool = True,
+        cache_entries: int = DEFAULTS["cache_entries"],
+        history_messages: int = DEFAULTS["history_messages"],
+        short_question_words: int = DEFAULTS["short_question_words"],
+    ):
+        self.gate = bool(gate)
+        self.cache_entries = int(cache_entries)
+        self.history_messages = int(history_messages)
+        self.short_question_words = int(short_question_words)
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self.skipped_no_history = 0
+        self.skipped_no_cue = 0
+        self.cache_hits = 0
+        self.llm_calls = 0
+        self.llm_failures = 0
+
+    def configure(self, config: Optional[Dict[str, Any]] = None) -> None:
+        cfg = {**DEFAULTS, **((config or {}).get("query_rewrite", {}) or {})}
+        with self._lock:
+            self.gate = bool(cfg["gate"])
+            self.cache_entries = int(cfg["cache_entries"])
+            self.history_messages = int(cfg["history_messages"])
+            self.short_question_words = int(cfg["short_question_words"])
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def needs_history(self, question: str, history: Sequence[BaseMessage]) -> bool:
+        """Whether the answer may depend on the earlier turns (the rewrite would not be skipped)."""
+        return bool(history) and (not self.gate or rewrite_cue(question, self.short_question_words) is not None)
+
+    def _plan(self, question: str, history: Sequence[BaseMessage]) -> Tuple[Optional[str], Dict[str, Any], Optional[Tuple[str, str]]]:
+        """(rewrite to use without an LLM call or None, info, cache key)."""
+        if not history:
+            with self._lock:
+                self.skipped_no_history += 1
+            return question, {"rewritten": False, "reason": "no_history"}, None
+        cue = rewrite_cue(question, self.short_question_words)
+        if self.gate and cue is None:
+            with self._lock:
+                self.skipped_no_cue += 1
+            return question, {"rewritten": False, "reason": "self_contained"}, None
+        key = (history_digest(history, self.history_messages), normalize_question(question))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return cached, {"rewritten": True, "reason": cue or "gate_off", "cached": True}, key
+        return None, {"rewritten": True, "reason": cue or "gate_off", "cached": False}, key
+
+    def _store(self, key: Tuple[str, str], question: str, rewritten: Any) -> str:
+        text = " ".join(str(rewritten or "").split()) or question
+        with self._lock:
+            self.llm_calls += 1
+            self._cache[key] = text
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return text
+
+    def _failed(self, question: str, e: Exception, info: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        with self._lock:
+            self.llm_failures += 1
+        log.warning(f"Question rewrite failed, using the question as asked | error={e}")
+        return question, {**info, "rewritten": False, "reason": "rewrite_failed"}
+
+    def rewrite(
+        self, question: str, history: Sequence[BaseMessage], llm_rewrite: Callable[[], Any]
+    ) -> Tuple[str, Dict[str, Any]]:
+        """The standalone question and how it was obtained; llm_rewrite runs only when needed."""
+        ready, info, key = self._plan(question, history)
+        if ready is not None:
+            return ready, info
+        try:
+            return self._store(key, question, llm_rewrite()), info
+        except Exception as e:
+            return self._failed(question, e, info)
+
+    async def arewrite(
+        self, question: str, history: Sequence[BaseMessage], llm_rewrite: Callable[[], Awaitable[Any]]
+    ) -> Tuple[str, Dict[str, Any]]:
+        ready, info, key = self._plan(question, history)
+        if ready is not None:
+            return ready, info
+        try:
+            return self._store(key, question, await llm_rewrite()), info
+        except Exception as e:
+            return self._failed(question, e, info)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.skipped_no_history + self.skipped_no_cue + self.cache_hits + self.llm_calls + self.llm_failures
+            skipped = self.skipped_no_history + self.skipped_no_cue + self.cache_hits
+            return {
+                "gate": self.gate,
+                "entries": len(self._cache),
+                "skipped_no_history": self.skipped_no_history,
+                "skipped_no_cue": self.skipped_no_cue,
+                "cache_hits": self.cache_hits,
+                "llm_calls": self.llm_calls,
+                "llm_failures": self.llm_failures,
+                "llm_calls_saved_rate": round(skipped / total, 4) if total else 0.0,
+            }
+
+
+# Shared by every request handled in this process
+REWRITE_GATE = RewriteGate()
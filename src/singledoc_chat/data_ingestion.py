@@ -1,12 +1,13 @@
 import uuid
 from pathlib import Path
 import sys
-from langchain_community.document_loaders import PyPDFLoader
+from utils.pdf_extraction import iter_pdf_documents
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS  # ← updated import
 from exception.custom_exception import DocumentPortalException
 from utils.model_loader import ModelLoader
 from utils.config_loader import load_config
+from utils.segment_store import SegmentStore
 from logger.custom_logger import CustomLogger
 from datetime import datetime, timezone
 
@@ -58,9 +59,7 @@ class SingleDocIngestor:
                     f_out.write(data)
 
                 # load PDF into LangChain docs
-                loader = PyPDFLoader(str(temp_path))
-                docs = loader.load()
-                documents.extend(docs)
+                documents.extend(iter_pdf_documents(temp_path))
 
             self.log.info("PDFs loaded | total_docs=%s | files_ingested=%s",
                           len(documents), len(uploaded_files))
@@ -80,7 +79,13 @@ class SingleDocIngestor:
             embeddings = self.model_loader.load_embeddings()
             vectorstore = FAISS.from_documents(documents=chunks, embedding=embeddings)
 
-            vectorstore.save_local(str(self.faiss_dir))
+            # same on-disk layout as the multi-document indexes, so nothing is pickled
+            ids = vectorstore.index_to_docstore_id
+            SegmentStore(self.faiss_dir).write_snapshot(
+                vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal),
+                (vectorstore.docstore.search(ids[i]) for i in range(vectorstore.index.ntotal)),
+                replace=True,
+            )
             self.log.info("FAISS index created and saved | path=%s", self.faiss_dir)
 
             retriever = vectorstore.as_retriever(
@@ -1,14 +1,15 @@
 import sys
 import os
 from dotenv import load_dotenv
-from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain_community.vectorstores import FAISS
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
 from langchain.chains.retrieval import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from utils.model_loader import ModelLoader
+from utils.segment_store import load_vectorstore
+from utils.chat_history import CHAT_HISTORY, SessionHistory
+from src.multidoc_chat.query_rewrite import REWRITE_GATE
 from exception.custom_exception import DocumentPortalException
 from logger.custom_logger import CustomLogger
 from prompt.prompt_library import PROMPT_REGISTRY
@@ -16,9 +17,7 @@ from models.models import PromptType
 
 
 class ConversationalRAG:
-    # simple in-memory store for chat histories per session
-    _HISTORY_STORE: dict[str, ChatMessageHistory] = {}
-
+    # chat histories live in the shared, bounded store (utils.chat_history)
     def __init__(self, session_id: str, retriever) -> None:
         try:
             self.log = CustomLogger.get_logger(__name__)
@@ -30,9 +29,7 @@ class ConversationalRAG:
             self.contextualize_prompt = self._resolve_prompt(PromptType.CONTEXTUALIZE_QUESTION)
             self.qa_prompt = self._resolve_prompt(PromptType.CONTEXT_QA)
 
-            self.history_aware_retriever = create_history_aware_retriever(
-                self.llm, self.retriever, self.contextualize_prompt
-            )
+            self.history_aware_retriever = self._gated_history_aware_retriever()
             self.log.info("Conversational RAG initialized | session_id=%s", session_id)
 
             self.qa_chain = create_stuff_documents_chain(self.llm, self.qa_prompt)
@@ -72,6 +69,23 @@ class ConversationalRAG:
         raise DocumentPortalException("Required prompt missing from PROMPT_REGISTRY",
                                       (exc_type, exc_obj, exc_tb))
 
+    def _gated_history_aware_retriever(self):
+        """Like create_history_aware_retriever, but the contextualize-question LLM call is made
+        only when REWRITE_GATE finds the question depends on the history (and isn't cached)."""
+        rewrite_chain = self.contextualize_prompt | self.llm | StrOutputParser()
+
+        def retrieve(inputs):
+            history = inputs.get("chat_history") or []
+            query, _ = REWRITE_GATE.rewrite(inputs["input"], history, lambda: rewrite_chain.invoke(inputs))
+            return self.retriever.invoke(query)
+
+        async def aretrieve(inputs):
+            history = inputs.get("chat_history") or []
+            query, _ = await REWRITE_GATE.arewrite(inputs["input"], history, lambda: rewrite_chain.ainvoke(inputs))
+            return await self.retriever.ainvoke(query)
+
+        return RunnableLambda(retrieve, afunc=aretrieve).with_config(run_name="gated_history_aware_retriever")
+
     def _load_llm(self):
         try:
             llm = ModelLoader().load_llm()
@@ -82,14 +96,10 @@ class ConversationalRAG:
             self.log.error("Failed to load LLMs: %s", e)
             raise DocumentPortalException("some error in loading LLMs", (exc_type, exc_obj, exc_tb)) from e
 
-    def _get_session_history(self, config) -> ChatMessageHistory:
-        """Return a ChatMessageHistory for the given config (required signature)."""
+    def _get_session_history(self, session_id: str) -> SessionHistory:
+        """Return the session's history; RunnableWithMessageHistory passes configurable.session_id."""
         try:
-            cfg = config.get("configurable", {}) if isinstance(config, dict) else {}
-            sid = cfg.get("session_id", self.session_id)
-            if sid not in self._HISTORY_STORE:
-                self._HISTORY_STORE[sid] = ChatMessageHistory()
-            return self._HISTORY_STORE[sid]
+            return SessionHistory(CHAT_HISTORY, session_id or self.session_id)
         except Exception as e:
             exc_type, exc_obj, exc_tb = sys.exc_info()
             self.log.error("Failed to get session history: %s", e)
@@ -102,11 +112,7 @@ class ConversationalRAG:
             if not os.path.isdir(index_path):
                 raise FileNotFoundError(f"FAISS not found at: {index_path}")
 
-            vectorstore = FAISS.load_local(
-                folder_path=index_path,
-                embeddings=embeddings,
-                allow_dangerous_deserialization=True,
-            )
+            vectorstore = load_vectorstore(index_path, embeddings)
             self.log.info("Loaded retriever from FAISS | path=%s", index_path)
             return vectorstore.as_retriever(search_type='similarity', search_kwargs={"k": 5})
         except Exception as e:
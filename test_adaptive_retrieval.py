@@ -0,0 +1,31 @@
+"""
+Testing code for the adaptive top-k cutoff of retrieved chunks
+"""
+
+from src.multidoc_chat.adaptive import adaptive_cutoff
+
+
+def test_empty_candidates():
+    assert adaptive_cutoff([], []) == (0, "empty")
+
+
+def test_keeps_everything_when_no_limit_is_hit():
+    assert adaptive_cutoff([0.9, 0.85, 0.8], [100, 100, 100]) == (3, "k")
+
+
+def test_cut_reasons():
+    assert adaptive_cutoff([0.9, 0.2], [10, 10]) == (1, "min_similarity")
+    assert adaptive_cutoff([0.9, 0.8, 0.6], [10, 10, 10]) == (2, "max_drop")
+    assert adaptive_cutoff([0.9, 0.89, 0.88], [800, 800, 800], token_budget=1500) == (1, "token_budget")
+
+
+def test_min_k_is_always_kept():
+    assert adaptive_cutoff([0.1, 0.05, 0.01], [5000, 5000, 5000], min_k=2) == (2, "min_similarity")
+
+
+if __name__ == "__main__":
+    test_empty_candidates()
+    test_keeps_everything_when_no_limit_is_hit()
+    test_cut_reasons()
+    test_min_k_is_always_kept()
+    print("adaptive retrieval tests passed")
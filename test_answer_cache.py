@@ -0,0 +1,89 @@
+"""
+Testing code for the RAG answer cache: exact hits, the opt-in semantic tier, and
+near-miss questions never being served by default
+"""
+
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from utils.answer_cache import DEFAULTS, AnswerCache, Probe, normalize_question
+
+NEAR_MISSES = [
+    ("What was the total revenue reported for fiscal year 2023?", "What was the total revenue reported for fiscal year 2024?"),
+    ("Which liabilities did the annual report list for Northwind Traders Ltd?", "Which liabilities did the annual report list for Northwind Traders Inc?"),
+]
+
+
+def trigram_embed(text: str) -> list:
+    """Character-trigram counts: like a small sentence model, it barely moves when one token changes."""
+    text = normalize_question(text)
+    grams = Counter(text[i:i + 3] for i in range(len(text) - 2))
+    vec = np.zeros(4096, dtype=np.float32)
+    for gram, count in grams.items():
+        vec[zlib.crc32(gram.encode("utf-8")) % 4096] += count
+    return vec.tolist()
+
+
+def probe(question: str, variant: str = "k=5") -> Probe:
+    return Probe("session", ("v1",), variant, question, normalize_question(question))
+
+
+def similarity(a: str, b: str) -> float:
+    va, vb = np.asarray(trigram_embed(a)), np.asarray(trigram_embed(b))
+    return float(va @ vb / (np.linalg.norm(va) * np.linalg.norm(vb)))
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = AnswerCache()
+    cache.put(probe("What is the notice period?"), "30 days", trigram_embed)
+    hit = cache.get(probe("  what is the NOTICE period "), trigram_embed)
+    assert hit is not None and hit["answer"] == "30 days" and hit["match"] == "exact"
+
+
+def test_semantic_hit_for_a_rephrased_question():
+    cache = AnswerCache(semantic=True)
+    cache.put(probe("What is the notice period for terminating the lease agreement?"), "30 days", trigram_embed)
+    hit = cache.get(probe("what is the notice-period for terminating the lease agreement"), trigram_embed)
+    assert hit is not None and hit["match"] == "semantic" and hit["similarity"] >= cache.threshold
+    assert cache.get(probe("Who are the parties to the lease?"), trigram_embed) is None
+
+
+def test_other_retrieval_settings_do_not_share_answers():
+    cache = AnswerCache(semantic=True)
+    cache.put(probe("What is the notice period?"), "30 days", trigram_embed)
+    assert cache.get(probe("What is the notice period?", variant="k=10"), trigram_embed) is None
+
+
+def test_semantic_tier_is_off_by_default():
+    assert DEFAULTS["semantic"]["enabled"] is False
+    assert AnswerCache().semantic is False
+
+
+def test_near_miss_questions_are_not_served():
+    cache = AnswerCache()
+    for asked, other in NEAR_MISSES:
+        # close enough to pass the semantic threshold, yet a different question
+        assert similarity(asked, other) >= cache.threshold
+        cache.put(probe(asked), f"answer to {asked}", trigram_embed)
+        assert cache.get(probe(other), trigram_embed) is None
+
+
+def test_semantic_tier_would_serve_near_misses():
+    # why the tier is opt-in: with it on, the same pairs get each other's answers
+    cache = AnswerCache(semantic=True)
+    asked, other = NEAR_MISSES[0]
+    cache.put(probe(asked), "revenue 2023", trigram_embed)
+    hit = cache.get(probe(other), trigram_embed)
+    assert hit is not None and hit["match"] == "semantic"
+
+
+if __name__ == "__main__":
+    test_exact_hit_ignores_case_and_punctuation()
+    test_semantic_hit_for_a_rephrased_question()
+    test_other_retrieval_settings_do_not_share_answers()
+    test_semantic_tier_is_off_by_default()
+    test_near_miss_questions_are_not_served()
+    test_semantic_tier_would_serve_near_misses()
+    print("answer cache tests passed")
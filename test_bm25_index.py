@@ -0,0 +1,105 @@
+"""
+Testing code for the varint-segment BM25 index and its fusion with dense retrieval
+"""
+
+import math
+from collections import Counter
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.multidoc_chat.hybrid import HybridRetriever
+from utils.bm25_index import BM25Index, decode_varints, encode_varints, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "The lease may be terminated with thirty days notice.",
+    "Invoice 4471 is payable within 30 days of receipt.",
+    "Section 3.2 covers termination fees and notice periods for the lease.",
+    "The supplier ships gpt-4 hardware to the tenant.",
+    "Late invoice payments accrue interest; invoice disputes go to arbitration.",
+    "Notice must be given in writing.",
+]
+
+
+def reference_scores(texts, query, k1=1.5, b=0.75):
+    docs = [Counter(tokenize(t)) for t in texts]
+    avgdl = sum(sum(d.values()) for d in docs) / len(docs)
+    scores = np.zeros(len(docs))
+    for term in set(tokenize(query)):
+        df = sum(term in d for d in docs)
+        if not df:
+            continue
+        idf = math.log(1.0 + (len(docs) - df + 0.5) / (df + 0.5))
+        for i, d in enumerate(docs):
+            tf, dl = d[term], sum(d.values())
+            scores[i] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+    return scores
+
+
+def test_varint_round_trip():
+    values = np.array([0, 1, 127, 128, 300, 16383, 16384, 2**32 + 5, 2**63 - 1], dtype=np.uint64)
+    data, nbytes = encode_varints(values)
+    assert list(nbytes) == [1, 1, 1, 2, 2, 2, 3, 5, 9]
+    assert len(data) == nbytes.sum()
+    assert np.array_equal(decode_varints(np.frombuffer(data, dtype=np.uint8)).astype(np.uint64), values)
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 2**40, size=5000, dtype=np.uint64)
+    data, _ = encode_varints(values)
+    assert np.array_equal(decode_varints(np.frombuffer(data, dtype=np.uint8)).astype(np.uint64), values)
+
+
+def test_search_matches_reference_bm25(tmp_path):
+    index = BM25Index(tmp_path, compact_segments=8)
+    index.add([0, 1, 2], TEXTS[:3])
+    index.add([3, 4, 5], TEXTS[3:])
+    assert index.stats()["segments"] == 2
+    for query in ("invoice payment", "lease notice", "section 3.2", "gpt-4", "nothing matches zzz"):
+        expected = reference_scores(TEXTS, query)
+        hits = index.search(query, k=len(TEXTS))
+        assert [row for row, _ in hits] == [int(i) for i in np.argsort(-expected, kind="stable") if expected[i] > 0]
+        assert all(math.isclose(score, expected[row], rel_tol=1e-6) for row, score in hits)
+    assert index.search("invoice", k=1)[0][0] == 4
+
+    # reopened and compacted indexes rank the same
+    before = index.search("lease notice termination", k=3)
+    assert BM25Index(tmp_path).search("lease notice termination", k=3) == before
+    compacted = BM25Index(tmp_path, compact_segments=1)
+    compacted.add([6], ["unrelated appendix"])
+    assert compacted.stats()["segments"] == 1
+    assert [row for row, _ in compacted.search("lease notice termination", k=3)] == [row for row, _ in before]
+
+
+def test_reciprocal_rank_fusion():
+    # 1: 1/61 + 1/62, 3: 1/63 + 1/61, 2: 1/62
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60) == [1, 3, 2]
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60, limit=2) == [1, 3]
+    assert reciprocal_rank_fusion([[5], [6]]) == [5, 6]  # ties break on the row id
+    assert reciprocal_rank_fusion([]) == []
+
+
+class FixedBM25:
+    def __init__(self, hits):
+        self.hits = hits
+
+    def search(self, query, k):
+        return self.hits[:k]
+
+
+def test_hybrid_retriever_fuses_dense_and_sparse_rows():
+    vectorstore = FAISS.from_texts(TEXTS, DeterministicFakeEmbedding(size=16))
+    # the dense side ranks row 0 first (exact text); BM25 ranks row 3 first and row 0 second
+    retriever = HybridRetriever(vectorstore=vectorstore, bm25=FixedBM25([(3, 9.0), (0, 5.0)]), k=2, fetch_k=6)
+    assert [d.page_content for d in retriever.invoke(TEXTS[0])] == [TEXTS[0], TEXTS[3]]
+    dense_only = HybridRetriever(vectorstore=vectorstore, bm25=None, k=1)
+    assert [d.page_content for d in dense_only.invoke(TEXTS[5])] == [TEXTS[5]]
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    test_varint_round_trip()
+    test_search_matches_reference_bm25(Path(tempfile.mkdtemp()))
+    test_reciprocal_rank_fusion()
+    test_hybrid_retriever_fuses_dense_and_sparse_rows()
+    print("bm25 index tests passed")
@@ -0,0 +1,58 @@
+"""
+Testing code for the SQLite chat history store shared by several worker processes
+"""
+
+from utils.chat_history import ChatHistoryStore
+
+
+def store(tmp_path, **kwargs):
+    return ChatHistoryStore(path=str(tmp_path / "history.db"), summarizer="local", **kwargs)
+
+
+def contents(s, session="s1"):
+    return [m.content for m in s.messages(session)]
+
+
+def test_two_stores_on_one_file_interleave_turns(tmp_path):
+    a, b = store(tmp_path), store(tmp_path)
+    a.add_turn("s1", "q1", "a1")
+    assert contents(b) == ["q1", "a1"]
+    b.add_turn("s1", "q2", "a2")
+    # a's hot copy is stale: it is reloaded instead of served, and its next seq follows b's
+    assert contents(a) == ["q1", "a1", "q2", "a2"]
+    a.add_turn("s1", "q3", "a3")
+    assert contents(b) == contents(a) == ["q1", "a1", "q2", "a2", "q3", "a3"]
+    assert a.stats()["stale"] == 1
+
+
+def test_clear_in_one_store_is_seen_by_the_other(tmp_path):
+    a, b = store(tmp_path), store(tmp_path)
+    a.add_turn("s1", "q1", "a1")
+    assert contents(b) == ["q1", "a1"]
+    a.clear("s1")
+    assert contents(b) == []
+    b.add_turn("s1", "q2", "a2")
+    assert contents(a) == ["q2", "a2"]
+
+
+def test_fold_from_another_store_is_picked_up(tmp_path):
+    a = store(tmp_path, max_messages=4, max_tokens=10_000)
+    b = store(tmp_path, max_messages=4, max_tokens=10_000)
+    for i in range(3):
+        a.add_turn("s1", f"question {i}. More.", f"answer {i}")
+    a.flush()
+    assert a.stats()["folds"] == 1
+    messages = b.messages("s1")
+    assert messages[0].type == "system" and "question 0" in messages[0].content
+    assert contents(b)[1:] == contents(a)[1:]
+    b.add_turn("s1", "q3", "a3")
+    assert contents(a)[-2:] == ["q3", "a3"]
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    for test in (test_two_stores_on_one_file_interleave_turns, test_clear_in_one_store_is_seen_by_the_other,
+                 test_fold_from_another_store_is_picked_up):
+        test(Path(tempfile.mkdtemp()))
+    print("chat history tests passed")
@@ -0,0 +1,66 @@
+"""
+Testing code for the memory-mapped columnar docstore
+"""
+
+from langchain.schema import Document
+
+from utils.columnar_docstore import DocstoreAppender, MmapDocstore, RowIdMap, committed_sizes
+
+DOCS = [
+    Document(page_content="Termination requires 30 days notice.", metadata={"source": "lease.pdf", "page": 0, "start_index": 0}),
+    Document(page_content="Rent is due monthly — in € or $.", metadata={"source": "lease.pdf", "page": 1, "start_index": 120}),
+    Document(page_content="", metadata={}),
+    Document(page_content="Appendix", metadata={"source": "annex.docx", "page": -3, "section": "A", "tags": ["x"]}),
+]
+
+
+def write(root, docs, committed=None):
+    appender = DocstoreAppender(root, committed or {})
+    appender.append(docs)
+    return appender.close()
+
+
+def test_round_trip_by_row_and_by_id(tmp_path):
+    committed = write(tmp_path, DOCS)
+    assert committed["sources"] == 2
+    sizes = committed_sizes(len(DOCS), committed)
+    assert all((tmp_path / name).stat().st_size == size for name, size in sizes.items())
+
+    store = MmapDocstore(tmp_path, len(DOCS), committed)
+    assert len(store) == len(DOCS)
+    for i, doc in enumerate(DOCS):
+        assert store.row(i) == doc
+        assert store.search(str(i)) == doc
+    assert list(store) == DOCS
+    assert store.search("4") == "ID 4 not found." and store.search("x") == "ID x not found."
+
+
+def test_append_after_reopen(tmp_path):
+    committed = write(tmp_path, DOCS[:2])
+    more = [Document(page_content="New clause", metadata={"source": "lease.pdf", "page": 7}),
+            Document(page_content="Other file", metadata={"source": "other.pdf"})]
+    committed = write(tmp_path, more, committed)
+    assert committed["sources"] == 2  # lease.pdf keeps its source id
+
+    store = MmapDocstore(tmp_path, 4, committed)
+    assert [store.row(i) for i in range(4)] == DOCS[:2] + more
+
+
+def test_overlay_and_row_id_map(tmp_path):
+    committed = write(tmp_path, DOCS[:2])
+    store = MmapDocstore(tmp_path, 2, committed)
+    extra = Document(page_content="added in memory")
+    store.add({"tmp-1": extra})
+    assert store.search("tmp-1") == extra and len(store) == 3
+
+    ids = RowIdMap(2)
+    ids[2] = "tmp-1"
+    assert [ids[i] for i in range(3)] == ["0", "1", "tmp-1"] and len(ids) == 3
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    for test in (test_round_trip_by_row_and_by_id, test_append_after_reopen, test_overlay_and_row_id_map):
+        test(Path(tempfile.mkdtemp()))
+    print("columnar docstore tests passed")
@@ -0,0 +1,104 @@
+"""
+Testing code for the per-endpoint limiter: 429 when the wait queue is full, 503 when a wait times out
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from utils.concurrency import EndpointLimiter, ExecutorPool, ServerBusyError
+
+
+async def hold(limiter, release):
+    async with limiter.slot():
+        await release.wait()
+
+
+async def busy(limiter, waiters=0):
+    """Fill every slot, then park `waiters` requests in the queue; returns (release event, tasks)."""
+    release = asyncio.Event()
+    tasks = [asyncio.create_task(hold(limiter, release)) for _ in range(limiter.max_concurrency + waiters)]
+    await asyncio.sleep(0.01)
+    return release, tasks
+
+
+def test_full_queue_is_rejected_with_429():
+    async def scenario():
+        limiter = EndpointLimiter("analyze", max_concurrency=2, max_queue=1, queue_timeout=5)
+        release, tasks = await busy(limiter, waiters=1)
+        assert (limiter.in_flight, limiter.waiting) == (2, 1)
+        with pytest.raises(ServerBusyError) as err:
+            async with limiter.slot():
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        return limiter, err.value
+
+    limiter, error = asyncio.run(scenario())
+    assert error.status_code == 429 and error.endpoint == "analyze"
+    assert limiter.stats() == {
+        "max_concurrency": 2, "max_queue": 1, "in_flight": 0, "waiting": 0,
+        "completed": 3, "rejected_429": 1, "rejected_503": 0,
+    }
+
+
+def test_wait_timeout_is_rejected_with_503_and_frees_its_place():
+    async def scenario():
+        limiter = EndpointLimiter("compare", max_concurrency=1, max_queue=4, queue_timeout=0.05)
+        release, tasks = await busy(limiter)
+        with pytest.raises(ServerBusyError) as err:
+            async with limiter.slot():
+                pass
+        assert limiter.waiting == 0
+        release.set()
+        await asyncio.gather(*tasks)
+        async with limiter.slot():  # the slot is usable again
+            assert limiter.in_flight == 1
+        return limiter, err.value
+
+    limiter, error = asyncio.run(scenario())
+    assert (error.status_code, error.retry_after) == (503, 5)
+    assert (limiter.rejected_429, limiter.rejected_503, limiter.completed) == (0, 1, 2)
+
+
+def test_pool_configures_endpoint_limiters():
+    pool = ExecutorPool()
+    pool.configure({
+        "io_workers": 3,
+        "queue_timeout_seconds": 7,
+        "endpoints": {"chat": {"max_concurrency": 2, "max_queue": 0}},
+    })
+    chat = pool.limiter("chat")
+    assert (pool.io_workers, chat.max_concurrency, chat.max_queue, chat.queue_timeout) == (3, 2, 0, 7.0)
+    assert pool.limiter("other").max_concurrency == 4  # unconfigured endpoints get the defaults
+    assert set(pool.stats()["endpoints"]) == {"chat", "other"}
+
+    async def scenario():
+        # max_queue=0: once both slots are taken, the next request is turned away at once
+        release, tasks = await busy(chat)
+        with pytest.raises(ServerBusyError) as err:
+            async with chat.slot():
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        return err.value
+
+    assert asyncio.run(scenario()).status_code == 429
+
+
+def test_busy_error_becomes_a_response_with_retry_after():
+    from api.main import server_busy_handler
+
+    response = asyncio.run(server_busy_handler(None, ServerBusyError("compare", 503, "compare is busy", retry_after=5)))
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+    assert json.loads(response.body) == {"detail": "compare is busy"}
+
+
+if __name__ == "__main__":
+    test_full_queue_is_rejected_with_429()
+    test_wait_timeout_is_rejected_with_503_and_frees_its_place()
+    test_pool_configures_endpoint_limiters()
+    test_busy_error_becomes_a_response_with_retry_after()
+    print("concurrency tests passed")
@@ -0,0 +1,110 @@
+"""
+Testing code for the persistent embedding cache: hits and misses, in-batch dedup, reopening
+and crash leftovers
+"""
+
+import hashlib
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from utils.embedding_cache import DIGEST_SIZE, CachedEmbeddings, EmbeddingStore, content_hash
+
+DIM = 4
+
+
+def vector(text):
+    return np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:DIM * 4], dtype=np.uint32) / 2**32
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [vector(t).tolist() for t in texts]
+
+    def embed_query(self, text):
+        return vector(text).tolist()
+
+
+def cached(root, model="test-model"):
+    backend = CountingEmbeddings()
+    return backend, CachedEmbeddings(backend, EmbeddingStore(root, model))
+
+
+def assert_vectors(result, texts):
+    assert np.allclose(np.asarray(result), np.stack([vector(t) for t in texts]).astype(np.float32))
+
+
+def test_only_misses_reach_the_backend(tmp_path):
+    backend, emb = cached(tmp_path)
+    assert_vectors(emb.embed_documents(["a", "b"]), ["a", "b"])
+    assert_vectors(emb.embed_documents(["b", "c", "a"]), ["b", "c", "a"])
+    assert backend.calls == [["a", "b"], ["c"]]
+    stats = emb.store.stats()
+    assert (stats["rows"], stats["hits"], stats["misses"]) == (3, 2, 3)
+    assert emb.embed_query("q") == vector("q").tolist()  # queries bypass the cache
+
+
+def test_repeats_within_a_batch_are_embedded_once(tmp_path):
+    backend, emb = cached(tmp_path)
+    result = emb.embed_documents(["x", "y", "x", "x"])
+    assert backend.calls == [["x", "y"]]
+    assert_vectors(result, ["x", "y", "x", "x"])
+    assert len(emb.store) == 2 and (tmp_path / "keys.bin").stat().st_size == 2 * DIGEST_SIZE
+
+
+def test_reopened_store_serves_earlier_rows(tmp_path):
+    cached(tmp_path)[1].embed_documents(["a", "b", "c"])
+    backend, emb = cached(tmp_path)
+    assert len(emb.store) == 3
+    assert_vectors(emb.embed_documents(["c", "a"]), ["c", "a"])
+    assert backend.calls == []
+    with pytest.raises(ValueError):
+        EmbeddingStore(tmp_path, "other-model")
+
+
+def test_orphan_vectors_and_torn_keys_are_trimmed(tmp_path):
+    cached(tmp_path)[1].embed_documents(["a", "b"])
+    # a writer that died after writing its vectors, and part of a key
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(np.ones((3, DIM), dtype=np.float32).tobytes())
+    with open(tmp_path / "keys.bin", "ab") as f:
+        f.write(content_hash("c")[:10])
+
+    backend, emb = cached(tmp_path)
+    assert len(emb.store) == 2
+    assert (tmp_path / "vectors.f32").stat().st_size == 2 * DIM * 4
+    assert (tmp_path / "keys.bin").stat().st_size == 2 * DIGEST_SIZE
+    assert_vectors(emb.embed_documents(["c", "a", "d"]), ["c", "a", "d"])
+    assert backend.calls == [["c", "d"]]
+    assert_vectors(cached(tmp_path)[1].embed_documents(["d", "c", "b"]), ["d", "c", "b"])
+
+
+def test_stores_sharing_a_directory_place_rows_by_the_keys_on_disk(tmp_path):
+    # two handles on one directory, as two worker processes would have
+    _, first = cached(tmp_path)
+    _, second = cached(tmp_path)
+    first.embed_documents(["a"])
+    second.embed_documents(["b"])  # picks up "a" before appending, so "b" lands in row 1
+    first.embed_documents(["c"])   # picks up "b", so "c" lands in row 2
+    reopened = cached(tmp_path)[1]
+    for emb, texts in ((first, "abc"), (second, "ab"), (reopened, "abc")):
+        found = emb.store.lookup([content_hash(t) for t in texts])
+        assert sorted(found) == list(range(len(texts)))
+        for i, t in enumerate(texts):
+            assert np.allclose(found[i], vector(t))
+    assert [reopened.store._rows[content_hash(t)] for t in "abc"] == [0, 1, 2]
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    for test in (test_only_misses_reach_the_backend, test_repeats_within_a_batch_are_embedded_once,
+                 test_reopened_store_serves_earlier_rows, test_orphan_vectors_and_torn_keys_are_trimmed,
+                 test_stores_sharing_a_directory_place_rows_by_the_keys_on_disk):
+        test(Path(tempfile.mkdtemp()))
+    print("embedding cache tests passed")
@@ -0,0 +1,59 @@
+"""
+Testing code for streaming uploads to disk with a size limit
+"""
+
+import hashlib
+import io
+
+import pytest
+
+from utils.file_io import UploadLimits, UploadTooLargeError, save_uploaded_files, stream_upload
+
+
+class Upload:
+    """Minimal stand-in for FastAPI's UploadFile (filename + file, size when the client sent one)."""
+    def __init__(self, filename, data, size=None):
+        self.filename = filename
+        self.file = io.BytesIO(data)
+        self.size = size
+
+
+def test_stream_upload_copies_and_hashes_in_chunks(tmp_path):
+    data = bytes(range(256)) * 1000
+    limits = UploadLimits(max_mb=1, chunk_kb=4)
+    size, digest = stream_upload(Upload("a.pdf", data), tmp_path / "a.pdf", limits)
+    assert size == len(data) and digest == hashlib.sha256(data).hexdigest()
+    assert (tmp_path / "a.pdf").read_bytes() == data
+    assert limits.stats()["saved"] == 1
+
+
+def test_declared_size_over_limit_is_rejected_before_reading(tmp_path):
+    limits = UploadLimits(max_mb=1)
+    upload = Upload("big.pdf", b"", size=2 * 1024 * 1024)
+    with pytest.raises(UploadTooLargeError) as err:
+        stream_upload(upload, tmp_path / "big.pdf", limits)
+    assert err.value.status_code == 413
+    assert limits.stats()["rejected"] == 1
+
+
+def test_oversized_stream_is_stopped_and_partial_file_removed(tmp_path):
+    limits = UploadLimits(max_mb=0.01, chunk_kb=1)
+    with pytest.raises(UploadTooLargeError):
+        stream_upload(Upload("big.pdf", b"x" * 20_000), tmp_path / "big.pdf", limits)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_duplicate_uploads_are_stored_once(tmp_path):
+    paths = save_uploaded_files([Upload("a.pdf", b"same"), Upload("a.pdf", b"same")], tmp_path)
+    assert len(paths) == 1 and len(list(tmp_path.iterdir())) == 1
+    # uploading it again later reuses the stored file
+    assert save_uploaded_files([Upload("a.pdf", b"same")], tmp_path) == paths
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    for test in (test_stream_upload_copies_and_hashes_in_chunks, test_declared_size_over_limit_is_rejected_before_reading,
+                 test_oversized_stream_is_stopped_and_partial_file_removed, test_duplicate_uploads_are_stored_once):
+        test(Path(tempfile.mkdtemp()))
+    print("file io tests passed")
@@ -0,0 +1,78 @@
+"""
+Testing code for the FAISS index cache: byte-budget LRU eviction and reloads when an index changes
+"""
+
+import os
+
+from utils.index_cache import FaissIndexCache
+
+
+def make_index(root, name, size):
+    path = root / name
+    path.mkdir()
+    (path / "manifest.json").write_text('{"rows": 1}', encoding="utf-8")
+    (path / "vectors.f32").write_bytes(b"\0" * size)
+    return path
+
+
+class Loader:
+    def __init__(self):
+        self.loads = []
+
+    def __call__(self, path):
+        def load():
+            self.loads.append(path.name)
+            return {"path": path.name, "load": len(self.loads)}
+        return load
+
+
+def test_lru_eviction_keeps_the_cache_within_budget(tmp_path):
+    a, b, c = (make_index(tmp_path, name, 400) for name in "abc")
+    cache, loader = FaissIndexCache(max_bytes=1000), Loader()
+    cache.get(a, loader(a))
+    cache.get(b, loader(b))
+    cache.get(a, loader(a))  # a is now the most recently used
+    cache.get(c, loader(c))  # over budget: b goes, not a
+    stats = cache.stats()
+    assert (stats["entries"], stats["evictions"], stats["hits"]) == (2, 1, 1)
+    assert stats["bytes"] <= 1000
+    cache.get(a, loader(a))
+    cache.get(b, loader(b))
+    assert loader.loads == ["a", "b", "c", "b"]
+
+    big = make_index(tmp_path, "big", 2000)
+    assert cache.get(big, loader(big))["path"] == "big"  # served, but never cached
+    assert cache.stats()["entries"] == 2
+    cache.configure(max_bytes=500)
+    assert cache.stats()["entries"] == 1
+
+
+def test_changed_index_is_reloaded(tmp_path):
+    a = make_index(tmp_path, "a", 100)
+    cache, loader = FaissIndexCache(), Loader()
+    first = cache.get(a, loader(a))
+    assert cache.get(a, loader(a)) is first
+
+    # a commit swaps the manifest: same size, newer mtime
+    (a / "manifest.json").write_text('{"rows": 2}', encoding="utf-8")
+    st = (a / "manifest.json").stat()
+    os.utime(a / "manifest.json", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    second = cache.get(a, loader(a))
+    assert second is not first and second["load"] == 2
+
+    # a legacy save_local rewrite
+    (a / "index.faiss").write_bytes(b"x" * 10)
+    assert cache.get(a, loader(a))["load"] == 3
+    assert cache.get(a, loader(a))["load"] == 3
+
+    assert cache.invalidate(a) and not cache.invalidate(a)
+    assert cache.get(a, loader(a))["load"] == 4
+    assert cache.stats()["bytes"] == FaissIndexCache.signature(a)[1]
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    for test in (test_lru_eviction_keeps_the_cache_within_budget, test_changed_index_is_reloaded):
+        test(Path(tempfile.mkdtemp()))
+    print("index cache tests passed")
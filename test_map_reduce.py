@@ -0,0 +1,71 @@
+"""
+Testing code for map-reduce document analysis: section splitting and the local reduce
+"""
+
+import random
+
+from src.doc_analyzer.map_reduce import merge_partials, page_count, split_sections
+from utils.token_count import approx_tokens
+
+WORDS = ["contract", "payment", "clause", "term", "notice", "party", "liability", "renewal"]
+
+
+def document(pages):
+    return "".join(f"\n--- Page {i + 1} ---\n{p}\n" for i, p in enumerate(pages))
+
+
+def random_pages(n, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(200, 900))) for _ in range(n)]
+
+
+def test_sections_cover_the_text_within_budget():
+    text = document(random_pages(30))
+    sections = split_sections(text, 4000)
+    assert "".join(s.text for s in sections) == text
+    assert all(approx_tokens(s.text) <= 4000 for s in sections)
+    assert sections[0].first_page == 1 and sections[-1].last_page == 30
+    assert page_count(text) == 30
+
+
+def test_text_without_page_headers_splits_on_paragraphs():
+    text = "\n\n".join(" ".join(WORDS * 40) for _ in range(40))
+    sections = split_sections(text, 1000)
+    assert len(sections) > 1 and "".join(s.text for s in sections) == text
+    assert all(s.pages == "n/a" for s in sections)
+
+
+def test_editing_an_early_page_keeps_later_sections():
+    pages = random_pages(60)
+    before = {s.digest for s in split_sections(document(pages), 4000)}
+
+    edited = list(pages)
+    edited[2] += " extra words" * 50
+    after = split_sections(document(edited), 4000)
+    assert sum(s.digest not in before for s in after) <= 3
+
+    inserted = pages[:4] + [" ".join(WORDS * 60)] + pages[4:]
+    after = split_sections(document(inserted), 4000)
+    assert sum(s.digest not in before for s in after) <= 3
+
+
+def test_merge_partials_votes_and_dedupes_summary():
+    partials = [
+        {"Title": "Annual Report", "Author": "Not Available", "Summary": ["Revenue grew.", "Costs fell."]},
+        {"Title": "Annual Report", "Author": "J. Doe", "Summary": ["revenue  grew.", "New CEO."]},
+        {"Title": "Appendix", "Author": None, "Summary": "Tables."},
+    ]
+    merged = merge_partials(partials, pages=12, max_summary_points=3)
+    assert merged["Title"] == "Annual Report"
+    assert merged["Author"] == "J. Doe"
+    assert merged["Publisher"] == "Not Available"
+    assert merged["Summary"] == ["Revenue grew.", "Costs fell.", "New CEO."]
+    assert merged["PageCount"] == 12
+
+
+if __name__ == "__main__":
+    test_sections_cover_the_text_within_budget()
+    test_text_without_page_headers_splits_on_paragraphs()
+    test_editing_an_early_page_keeps_later_sections()
+    test_merge_partials_votes_and_dedupes_summary()
+    print("map-reduce tests passed")
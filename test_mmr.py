@@ -0,0 +1,60 @@
+"""
+Testing code for the vectorized maximal marginal relevance selection
+"""
+
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+from src.multidoc_chat.mmr import mmr_select
+
+QUERY = np.array([1.0, 0.0])
+
+
+def unit(degrees):
+    return [np.cos(np.radians(degrees)), np.sin(np.radians(degrees))]
+
+
+# candidates at 90, 10, 5 and -50 degrees from the query
+CANDIDATES = np.array([unit(90), unit(10), unit(5), unit(-50)])
+
+
+def test_hand_computed_selection():
+    # 1) 5 deg is most relevant.
+    # 2) score = 0.5 * cos(to query) - 0.5 * cos(to 5 deg):
+    #    10 deg: 0.4924 - 0.4981 = -0.0057 | -50 deg: 0.3214 - 0.2868 = 0.0346 | 90 deg: 0 - 0.0436
+    # 3) 10 deg: -0.0057 still beats 90 deg: -0.0436 (its closest pick is still 5 deg)
+    assert mmr_select(QUERY, CANDIDATES, 3, lambda_mult=0.5) == [2, 3, 1]
+
+
+def test_lambda_one_is_pure_relevance():
+    assert mmr_select(QUERY, CANDIDATES, 4, lambda_mult=1.0) == [2, 1, 3, 0]
+
+
+def test_lambda_zero_is_pure_diversity_after_the_most_relevant():
+    # after 5 deg, each pick is the candidate least similar to everything already picked
+    assert mmr_select(QUERY, CANDIDATES, 4, lambda_mult=0.0) == [2, 0, 3, 1]
+
+
+def test_small_and_empty_inputs():
+    assert mmr_select(QUERY, CANDIDATES, 10) == mmr_select(QUERY, CANDIDATES, 4)
+    assert mmr_select(QUERY, CANDIDATES, 0) == []
+    assert mmr_select(QUERY, np.empty((0, 2)), 3) == []
+
+
+def test_matches_langchain_mmr():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        candidates = rng.normal(size=(30, 16)).astype(np.float32)
+        query = rng.normal(size=16).astype(np.float32)
+        for lambda_mult in (0.0, 0.3, 0.5, 1.0):
+            expected = maximal_marginal_relevance(query, list(candidates), lambda_mult=lambda_mult, k=6)
+            assert mmr_select(query, candidates, 6, lambda_mult) == expected
+
+
+if __name__ == "__main__":
+    test_hand_computed_selection()
+    test_lambda_one_is_pure_relevance()
+    test_lambda_zero_is_pure_diversity_after_the_most_relevant()
+    test_small_and_empty_inputs()
+    test_matches_langchain_mmr()
+    print("mmr tests passed")
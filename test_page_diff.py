@@ -0,0 +1,49 @@
+"""
+Testing code for page-aligned document diffs and their comparison windows
+"""
+
+from src.doc_compare.page_diff import diff_pages, split_windows
+from utils.pdf_extraction import PageText
+
+
+def pages(*texts):
+    return [PageText(i + 1, t) for i, t in enumerate(texts)]
+
+
+def test_identical_documents_have_no_changes():
+    ref = pages("alpha\nbeta", "gamma")
+    diff = diff_pages(ref, pages("alpha  \n\nbeta", "gamma"))  # whitespace-only differences
+    assert diff.identical and diff.to_prompt() == ""
+
+
+def test_inserted_page_does_not_shift_later_pages():
+    diff = diff_pages(pages("one", "two", "three"), pages("one", "new page", "two", "three"))
+    assert [c.kind for c in diff.changes] == ["inserted"]
+    assert diff.changes[0].act.number == 2
+
+
+def test_modified_page_lists_changed_lines_only():
+    diff = diff_pages(pages("a\nb\nc\nd\ne", "same"), pages("a\nb\nC\nd\ne", "same"), context=0)
+    [change] = diff.changes
+    assert change.kind == "modified"
+    assert change.hunks == ["@@ reference lines 3 | actual lines 3 @@", "- [3] c", "+ [3] C"]
+    assert diff.stats()["changed_pages"] == 1
+
+
+def test_split_windows_respects_max_chars():
+    ref = pages(*[f"page {i} original text" for i in range(6)])
+    act = pages(*[f"page {i} edited text" for i in range(6)])
+    diff = diff_pages(ref, act)
+    windows = split_windows(diff, max_chars=150)
+    assert len(windows) > 1
+    assert [c for w in windows for c in w.changes] == diff.changes
+    for w in windows:
+        assert len(w.changes) == 1 or len(w.to_prompt()) <= 150
+
+
+if __name__ == "__main__":
+    test_identical_documents_have_no_changes()
+    test_inserted_page_does_not_shift_later_pages()
+    test_modified_page_lists_changed_lines_only()
+    test_split_windows_respects_max_chars()
+    print("page diff tests passed")
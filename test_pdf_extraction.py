@@ -0,0 +1,41 @@
+"""
+Testing code for the shared page-streaming PDF extraction engine
+"""
+
+from pathlib import Path
+import fitz
+from utils.pdf_extraction import iter_pdf_pages, extract_pdf_text, iter_pdf_documents
+
+PDF_PATH = Path(__file__).resolve().parent / "data" / "singledoc_chat" / "MoR_main.pdf"
+
+
+def test_serial_matches_pymupdf():
+    with fitz.open(str(PDF_PATH)) as doc:
+        expected = [page.get_text() for page in doc]
+
+    pages = list(iter_pdf_pages(PDF_PATH, workers=1))
+    assert [p.number for p in pages] == list(range(1, len(expected) + 1))
+    assert [p.text for p in pages] == expected
+
+
+def test_parallel_matches_serial():
+    serial = list(iter_pdf_pages(PDF_PATH, workers=1))
+    parallel = list(iter_pdf_pages(PDF_PATH, workers=2, parallel_min_pages=1, pages_per_task=4))
+    assert parallel == serial
+
+
+def test_extract_text_and_documents():
+    text, pages = extract_pdf_text(PDF_PATH, skip_empty=True)
+    assert pages > 0
+    assert text.startswith("\n--- Page 1 ---\n")
+
+    docs = list(iter_pdf_documents(PDF_PATH))
+    assert docs[0].metadata == {"source": str(PDF_PATH), "page": 0}
+    assert len(docs) == len(list(iter_pdf_pages(PDF_PATH, workers=1)))
+
+
+if __name__ == "__main__":
+    test_serial_matches_pymupdf()
+    test_parallel_matches_serial()
+    test_extract_text_and_documents()
+    print("pdf extraction tests passed")
@@ -0,0 +1,37 @@
+"""
+Testing code for the gate that skips the contextualize-question LLM call
+"""
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.multidoc_chat.query_rewrite import RewriteGate, rewrite_cue
+
+HISTORY = [HumanMessage("What is the notice period in the lease?"), AIMessage("Thirty days.")]
+
+
+def test_self_contained_questions_have_no_cue():
+    assert rewrite_cue("What is the termination fee in the supply agreement?") is None
+    assert rewrite_cue("Summarize section 4 of the lease agreement") is None
+
+
+def test_follow_up_cues():
+    assert rewrite_cue("And the deposit?") == "ellipsis"
+    assert rewrite_cue("What about the renewal terms?") == "ellipsis"
+    assert rewrite_cue("Does it apply to subtenants as well?") == "anaphora"
+    assert rewrite_cue("Why so long?") == "short"
+    assert rewrite_cue("Explain please", short_question_words=1) is None
+
+
+def test_needs_history():
+    gate = RewriteGate()
+    assert not gate.needs_history("Does it renew automatically?", [])
+    assert not gate.needs_history("What is the termination fee in the supply agreement?", HISTORY)
+    assert gate.needs_history("Does it renew automatically?", HISTORY)
+    assert RewriteGate(gate=False).needs_history("What is the termination fee in the supply agreement?", HISTORY)
+
+
+if __name__ == "__main__":
+    test_self_contained_questions_have_no_cue()
+    test_follow_up_cues()
+    test_needs_history()
+    print("query rewrite tests passed")
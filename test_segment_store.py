@@ -0,0 +1,147 @@
+"""
+Testing code for the append-only segment store: commit and reopen, crash recovery, and the
+cross-process writer lock
+"""
+
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from utils.file_lock import fcntl
+from utils.segment_store import MANIFEST, VECTORS, SegmentStore
+
+DIM = 8
+EMBEDDINGS = DeterministicFakeEmbedding(size=DIM)
+
+
+def rows(start, n):
+    vectors = np.random.default_rng(start).random((n, DIM), dtype=np.float32)
+    docs = [Document(page_content=f"chunk {i}", metadata={"source": "a.pdf", "page": i}) for i in range(start, start + n)]
+    return [str(i) for i in range(start, start + n)], vectors, docs
+
+
+def add(store, start, n, records=()):
+    store.begin()
+    ids, vectors, docs = rows(start, n)
+    store.append(ids, vectors, docs)
+    return store.commit(records), vectors
+
+
+def test_committed_rows_survive_reopen(tmp_path):
+    manifest, vectors = add(SegmentStore(tmp_path), 0, 3, [{"k": "a.pdf#0", "h": "x", "d": False}])
+    assert manifest["rows"] == 3
+    manifest, more = add(SegmentStore(tmp_path), 3, 2)
+    assert manifest["rows"] == 5 and manifest["tail_commits"] == 2
+
+    store = SegmentStore(tmp_path)
+    vs = store.load(EMBEDDINGS)
+    assert vs.index.ntotal == 5
+    assert vs.docstore.search("4").page_content == "chunk 4"
+    [hit] = vs.similarity_search_by_vector(more[0].tolist(), k=1)
+    assert hit.page_content == "chunk 3" and hit.metadata == {"source": "a.pdf", "page": 3}
+    assert np.array_equal(vs.raw_vectors[:3], vectors)
+    assert store.read_ingest_log() == [{"k": "a.pdf#0", "h": "x", "d": False}]
+
+
+def test_row_ids_must_continue_the_store(tmp_path):
+    add(SegmentStore(tmp_path), 0, 2)
+    store = SegmentStore(tmp_path)
+    store.begin()
+    with pytest.raises(ValueError):
+        store.append(*rows(5, 1))
+    store.abort()
+
+
+def test_torn_append_is_invisible_and_truncated(tmp_path):
+    add(SegmentStore(tmp_path), 0, 3)
+    sizes = {p.name: p.stat().st_size for p in tmp_path.iterdir() if p.is_file()}
+
+    # a writer that dies after appending but before swapping the manifest
+    crashed = SegmentStore(tmp_path)
+    crashed.begin()
+    crashed.append(*rows(3, 4))
+    crashed._vectors_file.flush()
+    crashed._docstore.close(sync=False)
+    crashed._lock.release()
+    with open(tmp_path / VECTORS, "ab") as f:
+        f.write(b"\x01\x02\x03")  # half a float: a torn write
+    assert (tmp_path / VECTORS).stat().st_size > sizes[VECTORS]
+
+    assert SegmentStore(tmp_path).load(EMBEDDINGS).index.ntotal == 3
+    manifest, _ = add(SegmentStore(tmp_path), 3, 1)
+    assert manifest["rows"] == 4
+    assert (tmp_path / VECTORS).stat().st_size == sizes[VECTORS] + DIM * 4
+    vs = SegmentStore(tmp_path).load(EMBEDDINGS)
+    assert [vs.docstore.search(str(i)).page_content for i in range(4)] == [f"chunk {i}" for i in range(4)]
+
+
+def test_torn_manifest_write_keeps_the_previous_manifest(tmp_path):
+    add(SegmentStore(tmp_path), 0, 2)
+    # a crash while writing the replacement leaves only its temporary file behind
+    (tmp_path / f".{MANIFEST}.deadbeef.tmp").write_bytes(b'{"version": 1, "rows": 9')
+    assert SegmentStore(tmp_path).read_manifest()["rows"] == 2
+    assert SegmentStore(tmp_path).load(EMBEDDINGS).index.ntotal == 2
+
+
+def test_snapshot_replaces_a_rebuilt_index(tmp_path):
+    add(SegmentStore(tmp_path), 0, 3)
+    _, vectors, docs = rows(10, 2)
+    store = SegmentStore(tmp_path)
+    with pytest.raises(ValueError):
+        store.write_snapshot(vectors, docs)
+    store.write_snapshot(vectors, docs, replace=True)
+    vs = SegmentStore(tmp_path).load(EMBEDDINGS)
+    assert vs.index.ntotal == 2
+    assert [vs.docstore.search(str(i)).page_content for i in range(2)] == ["chunk 10", "chunk 11"]
+
+
+WRITER = """
+import sys
+import numpy as np
+from langchain.schema import Document
+from utils.segment_store import SegmentStore
+store = SegmentStore(sys.argv[1])
+store.begin()
+start = store.committed_rows
+store.append([str(start)], np.ones((1, {dim}), dtype=np.float32), [Document(page_content="from the other worker")])
+store.commit()
+print(start)
+"""
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs fcntl")
+def test_writers_in_other_processes_wait_for_the_lock(tmp_path):
+    add(SegmentStore(tmp_path), 0, 2)
+    store = SegmentStore(tmp_path)
+    store.begin()
+    other = subprocess.Popen(
+        [sys.executable, "-c", WRITER.format(dim=DIM), str(tmp_path)],
+        cwd=Path(__file__).parent, stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        time.sleep(1.0)
+        assert other.poll() is None  # blocked in begin()
+        store.append(*rows(2, 3))
+        store.commit()
+        out, _ = other.communicate(timeout=60)
+    finally:
+        other.kill()
+    assert other.returncode == 0 and out.split()[-1] == "5"
+    vs = SegmentStore(tmp_path).load(EMBEDDINGS)
+    assert vs.index.ntotal == 6
+    assert vs.docstore.search("5").page_content == "from the other worker"
+
+
+if __name__ == "__main__":
+    import tempfile
+    for test in (test_committed_rows_survive_reopen, test_row_ids_must_continue_the_store,
+                 test_torn_append_is_invisible_and_truncated, test_torn_manifest_write_keeps_the_previous_manifest,
+                 test_snapshot_replaces_a_rebuilt_index, test_writers_in_other_processes_wait_for_the_lock):
+        test(Path(tempfile.mkdtemp()))
+    print("segment store tests passed")
@@ -0,0 +1,77 @@
+"""
+Testing code for session directory garbage collection (TTL and disk quota)
+"""
+
+import os
+import time
+
+from utils.session_manager import SessionManager
+
+HOUR = 3600
+
+
+def make_dir(root, name, size):
+    path = root / name
+    path.mkdir(parents=True)
+    (path / "data.bin").write_bytes(b"x" * size)
+    return path
+
+
+def manager(tmp_path, **kwargs):
+    roots = {"faiss": str(tmp_path / "faiss"), "analysis": str(tmp_path / "analysis")}
+    return SessionManager(roots=roots, index_path=str(tmp_path / "sessions" / "index.json"), **kwargs)
+
+
+def test_ttl_evicts_only_registered_sessions(tmp_path):
+    sessions = manager(tmp_path, ttl_hours=72)
+    ours = make_dir(tmp_path / "faiss", "session_1", 100)
+    sessions.touch("faiss", "session_1")
+    # sample data and anything else the manager did not create is never collected
+    foreign = make_dir(tmp_path / "analysis", "test_session", 100)
+    old = time.time() - 200 * HOUR
+    os.utime(foreign, (old, old))
+
+    evicted = []
+    sessions.on_evict("faiss", lambda kind, sid, path: evicted.append(sid))
+    assert sessions.collect(now=time.time() + 71 * HOUR)["evicted"] == 0
+    assert sessions.collect(now=time.time() + 73 * HOUR)["evicted"] == 1
+    assert evicted == ["session_1"]
+    assert not ours.exists() and foreign.exists()
+
+
+def test_quota_evicts_least_recently_used_first(tmp_path):
+    sessions = manager(tmp_path, max_disk_mb=1500 / (1024 * 1024))
+    for i, name in enumerate(["a", "b", "c"]):
+        make_dir(tmp_path / "faiss", name, 1000)
+        sessions.touch("faiss", name)
+        sessions._sessions[f"faiss/{name}"]["last_access"] = time.time() - (10 - i) * HOUR
+    sessions.collect()
+    assert sorted(p.name for p in (tmp_path / "faiss").iterdir()) == ["c"]
+
+
+def test_pinned_sessions_are_kept(tmp_path):
+    sessions = manager(tmp_path, ttl_hours=1)
+    path = make_dir(tmp_path / "faiss", "busy", 100)
+    with sessions.pin("faiss", "busy"):
+        assert sessions.collect(now=time.time() + 2 * HOUR)["evicted"] == 0
+        assert path.exists()
+    assert sessions.collect(now=time.time() + 2 * HOUR)["evicted"] == 1
+
+
+def test_unsafe_session_ids_are_ignored(tmp_path):
+    sessions = manager(tmp_path, ttl_hours=1)
+    make_dir(tmp_path, "outside", 100)
+    sessions.touch("faiss", "../outside")
+    sessions.touch("unknown_kind", "session_1")
+    assert sessions.stats()["sessions"] == 0
+    sessions.collect(now=time.time() + 2 * HOUR)
+    assert (tmp_path / "outside").exists()
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    for test in (test_ttl_evicts_only_registered_sessions, test_quota_evicts_least_recently_used_first,
+                 test_pinned_sessions_are_kept, test_unsafe_session_ids_are_ignored):
+        test(Path(tempfile.mkdtemp()))
+    print("session manager tests passed")
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import copy
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from logger import GLOBAL_LOGGER as log
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+DEFAULTS: Dict[str, Any] = {
+    "type": "auto",
+    # auto picks the largest type whose threshold the corpus has reached
+    "auto_thresholds": {"hnsw": 50_000, "ivf_flat": 500_000, "ivf_pq": 2_000_000},
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    "nlist": None,  # None -> 4 * sqrt(rows)
+    "nprobe": 16,
+    "pq_m": 16,
+    "pq_nbits": 8,
+    "train_sample": 100_000,
+    "retrain_growth": 2.0,  # retrain IVF centroids once the corpus doubles
+}
+
+# faiss k-means wants at least this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def index_config(config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """faiss_db.index from the app config, layered over DEFAULTS."""
+    section = ((config or {}).get("faiss_db", {}) or {}).get("index", {}) or {}
+    cfg = copy.deepcopy(DEFAULTS)
+    for key, value in section.items():
+        if isinstance(value, dict) and isinstance(cfg.get(key), dict):
+            cfg[key].update(value)
+        elif value is not None or key == "nlist":
+            cfg[key] = value
+    return cfg
+
+
+def choose_index_type(rows: int, cfg: Dict[str, Any]) -> str:
+    wanted = (cfg.get("type") or "auto").lower()
+    if wanted != "auto":
+        if wanted not in INDEX_TYPES:
+            raise ValueError(f"Unknown faiss_db.index.type: {wanted}")
+        return wanted
+    chosen = "flat"
+    for name in ("hnsw", "ivf_flat", "ivf_pq"):
+        threshold = (cfg.get("auto_thresholds") or {}).get(name)
+        if threshold is not None and rows >= int(threshold):
+            chosen = name
+    return chosen
+
+
+def index_type_of(index) -> str:
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def _nlist(rows: int, cfg: Dict[str, Any]) -> int:
+    nlist = int(cfg.get("nlist") or 4 * math.sqrt(max(rows, 1)))
+    return max(1, min(nlist, rows // MIN_POINTS_PER_CENTROID or 1, 65536))
+
+
+def _pq_m(dim: int, wanted: int) -> int:
+    # PQ sub-quantizers must divide the dimension
+    for m in range(min(wanted, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def _train_sample(vectors: np.ndarray, cfg: Dict[str, Any], needed: int) -> np.ndarray:
+    n = len(vectors)
+    size = min(n, max(int(cfg.get("train_sample") or 0), needed))
+    if size == n:
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    rows = np.sort(np.random.default_rng(0).choice(n, size=size, replace=False))
+    return np.ascontiguousarray(vectors[rows], dtype=np.float32)
+
+
+def build_index(vectors: np.ndarray, index_type: str, cfg: Dict[str, Any], batch_rows: int = 65536):
+    """Build (and for IVF, train) an L2 index over vectors, adding them in row order."""
+    rows, dim = vectors.shape
+    start = time.perf_counter()
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, int(cfg["hnsw_m"]))
+        index.hnsw.efConstruction = int(cfg["ef_construction"])
+        index.hnsw.efSearch = int(cfg["ef_search"])
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = _nlist(rows, cfg)
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+            needed = nlist * MIN_POINTS_PER_CENTROID
+        else:
+            # fewer bits per code when the corpus is too small to train 2**nbits centroids
+            nbits = max(1, min(int(cfg["pq_nbits"]), int(math.log2(max(2, rows // MIN_POINTS_PER_CENTROID)))))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim, int(cfg["pq_m"])), nbits)
+            needed = max(nlist, 2 ** nbits) * MIN_POINTS_PER_CENTROID
+        index.train(_train_sample(vectors, cfg, needed))
+        index.nprobe = min(int(cfg["nprobe"]), nlist)
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    for s in range(0, rows, batch_rows):
+        index.add(np.ascontiguousarray(vectors[s:s + batch_rows], dtype=np.float32))
+    log.info(
+        f"ANN index built | type={index_type} | rows={rows} | dim={dim} | "
+        f"seconds={time.perf_counter() - start:.3f}"
+    )
+    return index
+
+
+def search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """faiss SearchParameters for one query, or None to use the index's stored defaults."""
+    kind = index_type_of(index)
+    if kind in ("ivf_flat", "ivf_pq") and nprobe:
+        return faiss.SearchParametersIVF(nprobe=int(nprobe))
+    if kind == "hnsw" and ef_search:
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+    return None
+
+
+class _ParamSearchIndex:
+    """Index proxy that passes per-request SearchParameters to every search()."""
+    def __init__(self, index, params):
+        self._index = index
+        self._params = params
+
+    def search(self, x, k, params=None, **kwargs):
+        return self._index.search(x, k, params=params or self._params, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._index, name)
+
+
+def with_search_params(vs, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """
+    Shallow copy of a LangChain FAISS store whose searches use the given knobs.
+    The shared (cached) store and its index are left untouched, so concurrent
+    requests can each pick their own nprobe / efSearch.
+    """
+    params = search_params(vs.index, nprobe=nprobe, ef_search=ef_search)
+    if params is None:
+        return vs
+    view = copy.copy(vs)
+    view.index = _ParamSearchIndex(vs.index, params)
+    return view
+
+
+def benchmark(
+    vectors: np.ndarray,
+    k: int = 10,
+    n_queries: int = 200,
+    cfg: Optional[Dict[str, Any]] = None,
+    sweep: Optional[Dict[str, List[int]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    recall@k and query latency of each index type against the exact flat baseline.
+    Queries are rows sampled from the corpus itself, perturbed slightly.
+    """
+    cfg = cfg or index_config()
+    sweep = sweep or {"nprobe": [1, 4, 16, 64], "ef_search": [16, 32, 64, 128]}
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(1)
+    picks = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + rng.normal(0, 1e-3, size=(len(picks), vectors.shape[1])).astype(np.float32)
+
+    def timed(index, params=None):
+        t0 = time.perf_counter()
+        _, ids = index.search(queries, k, params=params)
+        return ids, (time.perf_counter() - t0) * 1000 / len(queries)
+
+    results = []
+    for index_type in INDEX_TYPES:
+        t0 = time.perf_counter()
+        index = build_index(vectors, index_type, cfg)
+        build_s = time.perf_counter() - t0
+        if index_type == "flat":
+            truth, ms = timed(index)
+            results.append({"type": "flat", "param": "-", "build_s": round(build_s, 3), "recall": 1.0, "ms_per_query": round(ms, 4)})
+            continue
+        knob = "ef_search" if index_type == "hnsw" else "nprobe"
+        for value in sweep[knob]:
+            ids, ms = timed(index, search_params(index, **{knob: value}))
+            hits = sum(len(set(a) & set(b)) for a, b in zip(ids.tolist(), truth.tolist()))
+            results.append({
+                "type": index_type,
+                "param": f"{knob}={value}",
+                "build_s": round(build_s, 3),
+                "recall": round(hits / truth.size, 4),
+                "ms_per_query": round(ms, 4),
+            })
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    from utils.segment_store import SegmentStore
+
+    if len(sys.argv) > 1:
+        data = np.array(SegmentStore(sys.argv[1]).vectors())
+    else:
+        data = np.random.default_rng(0).normal(size=(50_000, 384)).astype(np.float32)
+    print(f"rows={len(data)} dim={data.shape[1]}")
+    for row in benchmark(data):
+        print(
+            f"{row['type']:<9} {row['param']:<14} recall@10={row['recall']:<7} "
+            f"{row['ms_per_query']:>9.4f} ms/query  build={row['build_s']}s"
+        )
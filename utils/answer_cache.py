@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from logger import GLOBAL_LOGGER as log
+from utils.index_cache import FaissIndexCache
+
+DEFAULTS: Dict[str, Any] = {
+    "enabled": True,
+    "max_entries": 1024,
+    "ttl_seconds": 3600,
+    "semantic": {"enabled": False, "threshold": 0.95},
+}
+
+_TRAILING = re.compile(r"[\s?!.。？！]+$")
+
+
+def normalize_question(question: str) -> str:
+    """Case, width, whitespace and trailing punctuation do not change the answer."""
+    q = unicodedata.normalize("NFKC", question).casefold()
+    return _TRAILING.sub("", " ".join(q.split()))
+
+
+@dataclass
+class Probe:
+    """A question resolved against one index version; get() and put() share it."""
+    session: str
+    version: Tuple
+    variant: str
+    question: str
+    normalized: str
+    vector: Optional[np.ndarray] = None
+
+    @property
+    def key(self) -> Tuple:
+        return (self.session, self.version, self.variant, self.normalized)
+
+
+@dataclass
+class _Entry:
+    answer: str
+    created: float
+    vector: Optional[np.ndarray] = None
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of RAG answers, keyed by (index dir, index version, retrieval
+    settings, normalized question). The version is the FAISS index signature, so any
+    ingest into a session makes its cached answers unreachable; they are dropped the
+    next time that session is looked up.
+
+    With the optional semantic tier on, an exact miss falls back to the most similar
+    cached question of the same session/version/settings whose embedding cosine
+    similarity is at least the threshold. It is off by default: questions that differ
+    only in a year or an entity can embed that close and would get each other's answers.
+    """
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600,
+        semantic: bool = False,
+        threshold: float = 0.95,
+        enabled: bool = True,
+    ):
+        self.enabled = bool(enabled)
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = float(ttl_seconds)
+        self.semantic = bool(semantic)
+        self.threshold = float(threshold)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._versions: Dict[str, Tuple] = {}
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def configure(self, config: Optional[Dict[str, Any]] = None) -> None:
+        cfg = {**DEFAULTS, **((config or {}).get("answer_cache", {}) or {})}
+        semantic = {**DEFAULTS["semantic"], **(cfg.get("semantic") or {})}
+        with self._lock:
+            self.enabled = bool(cfg["enabled"])
+            self.max_entries = int(cfg["max_entries"])
+            self.ttl_seconds = float(cfg["ttl_seconds"])
+            self.semantic = bool(semantic["enabled"])
+            self.threshold = float(semantic["threshold"])
+            self._evict_locked()
+
+    @staticmethod
+    def _session(index_dir) -> str:
+        return str(Path(index_dir).resolve())
+
+    def probe(self, index_dir, variant: str, question: str) -> Probe:
+        return Probe(
+            session=self._session(index_dir),
+            version=FaissIndexCache.signature(index_dir)[0],
+            variant=variant,
+            question=question,
+            normalized=normalize_question(question),
+        )
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32).ravel()
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    def get(self, probe: Probe, embed: Optional[Callable[[str], List[float]]] = None) -> Optional[Dict[str, Any]]:
+        """Cached answer for the probe as {answer, match, similarity, age_seconds}, or None."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            self._check_version_locked(probe)
+            entry = self._live_locked(probe.key, now)
+            if entry is not None:
+                self.hits += 1
+                return self._hit(entry, "exact", 1.0, now)
+            candidates = [
+                (key, e) for key, e in self._entries.items()
+                if key[:3] == probe.key[:3] and e.vector is not None
+            ] if self.semantic and embed is not None else []
+
+        if candidates:
+            probe.vector = self._unit(embed(probe.question))
+            sims = np.stack([e.vector for _, e in candidates]) @ probe.vector
+            best = int(np.argmax(sims))
+            if float(sims[best]) >= self.threshold:
+                with self._lock:
+                    entry = self._live_locked(candidates[best][0], now)
+                    if entry is not None:
+                        self.hits += 1
+                        self.semantic_hits += 1
+                        return self._hit(entry, "semantic", float(sims[best]), now)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(
+        self,
+        probe: Probe,
+        answer: str,
+        embed: Optional[Callable[[str], List[float]]] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        if not self.enabled or not answer:
+            return
+        if self.semantic and embed is not None and probe.vector is None:
+            probe.vector = self._unit(embed(probe.question))
+        with self._lock:
+            if self._versions.get(probe.session, probe.version) != probe.version:
+                return  # the index changed while this answer was generated
+            self._versions[probe.session] = probe.version
+            self._entries[probe.key] = _Entry(answer, time.time(), probe.vector, dict(meta or {}))
+            self._entries.move_to_end(probe.key)
+            self._evict_locked()
+
+    def invalidate(self, index_dir) -> int:
+        session = self._session(index_dir)
+        with self._lock:
+            dropped = self._drop_session_locked(session)
+            self._versions.pop(session, None)
+            if dropped:
+                self.invalidations += 1
+        if dropped:
+            log.info(f"Answer cache invalidated | index={session} | entries={dropped}")
+        return dropped
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def _hit(self, entry: _Entry, match: str, similarity: float, now: float) -> Dict[str, Any]:
+        return {
+            "answer": entry.answer,
+            "match": match,
+            "similarity": round(similarity, 4),
+            "age_seconds": round(now - entry.created, 1),
+            **entry.meta,
+        }
+
+    def _live_locked(self, key: Tuple, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry.created > self.ttl_seconds:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _check_version_locked(self, probe: Probe) -> None:
+        known = self._versions.get(probe.session)
+        if known is not None and known != probe.version:
+            dropped = self._drop_session_locked(probe.session)
+            self.invalidations += 1
+            log.info(f"Answer cache: index changed | index={probe.session} | dropped={dropped}")
+        self._versions[probe.session] = probe.version
+
+    def _drop_session_locked(self, session: str) -> int:
+        stale = [k for k in self._entries if k[0] == session]
+        for k in stale:
+            del self._entries[k]
+        return len(stale)
+
+    def _evict_locked(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Shared by every request handled in this process
+ANSWER_CACHE = AnswerCache()
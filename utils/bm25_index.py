@@ -0,0 +1,436 @@
+from __future__ import annotations
+
+import os
+import re
+import json
+import math
+import time
+import uuid
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from logger import GLOBAL_LOGGER as log
+
+BM25_MANIFEST = "bm25.json"
+DOC_LENGTHS = "bm25.len"
+SEGMENT_MAGIC = b"BM25SEG1"
+DEFAULT_COMPACT_SEGMENTS = 8
+
+DEFAULTS: Dict[str, Any] = {
+    "enabled": True,
+    "k1": 1.5,
+    "b": 0.75,
+    "compact_segments": DEFAULT_COMPACT_SEGMENTS,
+    "cache_postings": 2_000_000,
+    "rrf_k": 60,
+}
+
+# words, numbers and dotted / hyphenated identifiers ("3.2", "gpt-4", "f1_score")
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._\-][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i if in into is it its of on or our "
+    "she so than that the their them then there these they this to was we were what when which who "
+    "will with you your not no do does did can could would should may might been being also such".split()
+)
+
+_HEADER = np.dtype([
+    ("magic", "S8"), ("n_terms", "<u4"), ("terms_bytes", "<u8"), ("ids_bytes", "<u8"), ("tfs_bytes", "<u8"),
+])
+_TERM_ENTRY = np.dtype([("df", "<u4"), ("ids_off", "<u8"), ("tfs_off", "<u8")])
+
+
+def bm25_config(config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """retriever.bm25 from the app config, layered over DEFAULTS."""
+    section = ((config or {}).get("retriever", {}) or {}).get("bm25", {}) or {}
+    return {**DEFAULTS, **{k: v for k, v in section.items() if v is not None}}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def encode_varints(values: np.ndarray) -> Tuple[bytes, np.ndarray]:
+    """
+    LEB128 varints (7 bits per byte, high bit set on every byte but the last).
+    Returns the encoded bytes and the byte length of each value.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    if not len(values):
+        return b"", nbytes
+    for shift in range(7, 64, 7):
+        nbytes += values >= (np.uint64(1) << np.uint64(shift))
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    starts = np.concatenate(([0], np.cumsum(nbytes)[:-1]))
+    for i in range(int(nbytes.max())):
+        live = nbytes > i
+        byte = (values[live] >> np.uint64(7 * i)) & np.uint64(0x7F)
+        more = (nbytes[live] > i + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[live] + i] = (byte | more).astype(np.uint8)
+    return out.tobytes(), nbytes
+
+
+def decode_varints(buf: np.ndarray) -> np.ndarray:
+    """Vectorized inverse of encode_varints over a uint8 array."""
+    if not len(buf):
+        return np.empty(0, dtype=np.int64)
+    ends = (buf & 0x80) == 0
+    if ends.all():
+        return buf.astype(np.int64)
+    value_of = np.concatenate(([0], np.cumsum(ends)[:-1]))
+    first = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    shift = np.arange(len(buf)) - first[value_of]
+    parts = (buf & 0x7F).astype(np.int64) << (7 * shift)
+    # integer sums per value (bincount weights are float64 and lose bits above 2**53)
+    return np.add.reduceat(parts, first)
+
+
+def _group_starts(counts: np.ndarray) -> np.ndarray:
+    return np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+
+
+class _Segment:
+    """
+    One immutable postings file:
+      header | term table | terms ("\n"-joined, sorted) | row-id varints | tf varints
+    A term's row ids are sorted and delta-encoded; its term frequencies follow the same
+    order in the tf blob. The file is memory-mapped and only the term list is decoded on open.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+        header = raw[:_HEADER.itemsize].view(_HEADER)[0]
+        if header["magic"] != SEGMENT_MAGIC:
+            raise ValueError(f"Not a BM25 segment: {path}")
+        n = int(header["n_terms"])
+        pos = _HEADER.itemsize
+        self.table = np.array(raw[pos:pos + n * _TERM_ENTRY.itemsize].view(_TERM_ENTRY))
+        pos += n * _TERM_ENTRY.itemsize
+        terms = raw[pos:pos + int(header["terms_bytes"])].tobytes().decode("utf-8")
+        self.terms = terms.split("\n") if n else []
+        self.term_ids = {t: i for i, t in enumerate(self.terms)}
+        pos += int(header["terms_bytes"])
+        self.ids = raw[pos:pos + int(header["ids_bytes"])]
+        pos += int(header["ids_bytes"])
+        self.tfs = raw[pos:pos + int(header["tfs_bytes"])]
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def df(self, term: str) -> int:
+        i = self.term_ids.get(term)
+        return 0 if i is None else int(self.table["df"][i])
+
+    def lookup(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        i = self.term_ids.get(term)
+        if i is None:
+            return None
+        last = i + 1 == len(self.terms)
+        ids_end = len(self.ids) if last else int(self.table["ids_off"][i + 1])
+        tfs_end = len(self.tfs) if last else int(self.table["tfs_off"][i + 1])
+        ids = np.cumsum(decode_varints(self.ids[int(self.table["ids_off"][i]):ids_end]))
+        return ids, decode_varints(self.tfs[int(self.table["tfs_off"][i]):tfs_end])
+
+    def postings(self) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        """Every posting as flat (terms, term index, row, tf) arrays, grouped by term."""
+        df = self.table["df"].astype(np.int64)
+        term_of = np.repeat(np.arange(len(df)), df)
+        deltas = decode_varints(np.asarray(self.ids))
+        # per-term cumulative sum: global cumsum minus the running total at each term's start
+        total = np.cumsum(deltas)
+        starts = _group_starts(df)
+        before = np.concatenate(([0], total))[starts]
+        return self.terms, term_of, total - np.repeat(before, df), decode_varints(np.asarray(self.tfs))
+
+    @staticmethod
+    def write(path: Path, terms: List[str], term_of: np.ndarray, rows: np.ndarray, tfs: np.ndarray) -> None:
+        """terms sorted; term_of / rows / tfs are one entry per posting, any order."""
+        order = np.lexsort((rows, term_of))
+        term_of, rows, tfs = term_of[order], rows[order], tfs[order]
+        df = np.bincount(term_of, minlength=len(terms)).astype(np.int64)
+        starts = _group_starts(df)
+        deltas = rows.astype(np.int64).copy()
+        deltas[1:] -= rows[:-1]
+        deltas[starts[df > 0]] = rows[starts[df > 0]]  # each term restarts from absolute row id
+
+        ids_data, id_len = encode_varints(deltas)
+        tfs_data, tf_len = encode_varints(tfs)
+        table = np.zeros(len(terms), dtype=_TERM_ENTRY)
+        table["df"] = df
+        table["ids_off"] = _group_starts(np.add.reduceat(id_len, starts) if len(rows) else df)
+        table["tfs_off"] = _group_starts(np.add.reduceat(tf_len, starts) if len(rows) else df)
+        terms_data = "\n".join(terms).encode("utf-8")
+        header = np.array(
+            [(SEGMENT_MAGIC, len(terms), len(terms_data), len(ids_data), len(tfs_data))], dtype=_HEADER
+        )
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(tmp, "wb") as f:
+            for part in (header.tobytes(), table.tobytes(), terms_data, ids_data, tfs_data):
+                f.write(part)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+
+class BM25Index:
+    """
+    Sparse BM25 index persisted next to a session's FAISS store, sharing its row ids.
+
+    bm25.json      - committed state (segments, rows, total tokens), swapped atomically
+    bm25.len       - uint32 token count per row, append-only
+    bm25-<n>.seg   - immutable postings segments (see _Segment), one per add()
+
+    Each add() writes one small segment, so indexing is incremental; once
+    compact_segments segments exist they are merged into one. Decoded postings of
+    recently queried terms are kept (with their length-normalized tf weights) up to
+    cache_postings entries, so frequent terms are not re-decoded on every query.
+    """
+    def __init__(
+        self,
+        root,
+        compact_segments: int = DEFAULT_COMPACT_SEGMENTS,
+        k1: float = 1.5,
+        b: float = 0.75,
+        cache_postings: int = 2_000_000,
+    ):
+        self.root = Path(root)
+        self.manifest_path = self.root / BM25_MANIFEST
+        self.compact_segments = max(1, int(compact_segments))
+        self.k1, self.b = float(k1), float(b)
+        self.cache_postings = int(cache_postings)
+        self._write_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._load()
+
+    def _load(self, retries: int = 3) -> None:
+        for attempt in range(retries):
+            m = (
+                json.loads(self.manifest_path.read_text(encoding="utf-8")) if self.manifest_path.exists()
+                else {"rows": 0, "total_tokens": 0, "segments": [], "next_seq": 1}
+            )
+            try:
+                segments = [_Segment(self.root / name) for name in m["segments"]]
+                break
+            except FileNotFoundError:
+                # a compaction (possibly in another process) replaced the segments we read; re-read
+                if attempt == retries - 1:
+                    raise
+        self._manifest = m
+        self.rows = int(m["rows"])
+        self.avgdl = m["total_tokens"] / self.rows if self.rows else 0.0
+        self._segments = segments
+        self._lengths = (
+            np.memmap(self.root / DOC_LENGTHS, dtype=np.uint32, mode="r", shape=(self.rows,)) if self.rows else None
+        )
+        self._cache: "OrderedDict[Tuple[int, str], Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._cached = 0
+
+    @classmethod
+    def from_config(cls, root, config: Optional[Dict[str, Any]] = None) -> Optional["BM25Index"]:
+        cfg = bm25_config(config)
+        if not cfg["enabled"]:
+            return None
+        return cls(
+            root,
+            compact_segments=cfg["compact_segments"],
+            k1=cfg["k1"],
+            b=cfg["b"],
+            cache_postings=cfg["cache_postings"],
+        )
+
+    @staticmethod
+    def exists(root) -> bool:
+        return (Path(root) / BM25_MANIFEST).exists()
+
+    def clear(self) -> None:
+        """Drop the index (e.g. when it no longer matches the FAISS rows) so it can be rebuilt."""
+        with self._write_lock:
+            for name in self._manifest["segments"]:
+                (self.root / name).unlink(missing_ok=True)
+            (self.root / DOC_LENGTHS).unlink(missing_ok=True)
+            self.manifest_path.unlink(missing_ok=True)
+            self._load()
+
+    # ---------- writing ----------
+
+    def add(self, rows: Sequence[int], texts: Sequence[str]) -> None:
+        """Index texts under their FAISS row ids; rows must extend the index contiguously."""
+        if not len(rows):
+            return
+        with self._write_lock:
+            rows = np.asarray(rows, dtype=np.int64)
+            if rows.min() != self.rows or rows.max() != self.rows + len(rows) - 1:
+                raise ValueError(f"BM25 rows must continue from {self.rows}, got {rows.min()}..{rows.max()}")
+
+            vocab: Dict[str, int] = {}
+            term_of: List[int] = []
+            posting_rows: List[int] = []
+            tfs: List[int] = []
+            lengths = np.zeros(len(rows), dtype=np.uint32)
+            for row, text in zip(rows.tolist(), texts):
+                tokens = tokenize(text)
+                lengths[row - self.rows] = len(tokens)
+                for term, tf in Counter(tokens).items():
+                    term_of.append(vocab.setdefault(term, len(vocab)))
+                    posting_rows.append(row)
+                    tfs.append(tf)
+
+            terms = sorted(vocab)
+            rank = np.empty(len(terms), dtype=np.int64)
+            rank[[vocab[t] for t in terms]] = np.arange(len(terms))
+            m = dict(self._manifest)
+            name = f"bm25-{m['next_seq']:06d}.seg"
+            _Segment.write(
+                self.root / name, terms, rank[np.asarray(term_of, dtype=np.int64)],
+                np.asarray(posting_rows, dtype=np.int64), np.asarray(tfs, dtype=np.int64),
+            )
+
+            len_path = self.root / DOC_LENGTHS
+            if len_path.exists() and len_path.stat().st_size != self.rows * 4:
+                os.truncate(len_path, self.rows * 4)  # drop a crashed writer's tail
+            with open(len_path, "ab") as f:
+                f.write(lengths.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            m.update(
+                rows=self.rows + len(rows),
+                total_tokens=int(m["total_tokens"]) + int(lengths.sum()),
+                segments=m["segments"] + [name],
+                next_seq=m["next_seq"] + 1,
+            )
+            self._swap_manifest(m)
+            if len(m["segments"]) >= self.compact_segments:
+                self._compact()
+
+    def _swap_manifest(self, m: Dict) -> None:
+        tmp = self.root / f".{BM25_MANIFEST}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(m, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_path)
+        self._load()
+
+    def _compact(self) -> None:
+        start = time.perf_counter()
+        parts = [seg.postings() for seg in self._segments]
+        terms = sorted(set().union(*(p[0] for p in parts)))
+        index_of = {t: i for i, t in enumerate(terms)}
+        remapped = [np.asarray([index_of[t] for t in seg_terms], dtype=np.int64)[term_of] for seg_terms, term_of, _, _ in parts]
+        m = dict(self._manifest)
+        name = f"bm25-{m['next_seq']:06d}.seg"
+        _Segment.write(
+            self.root / name, terms, np.concatenate(remapped),
+            np.concatenate([p[2] for p in parts]), np.concatenate([p[3] for p in parts]),
+        )
+        stale = m["segments"]
+        m.update(segments=[name], next_seq=m["next_seq"] + 1)
+        self._swap_manifest(m)
+        for old in stale:
+            (self.root / old).unlink(missing_ok=True)
+        log.info(
+            f"BM25 segments merged | segments={len(stale)} | terms={len(terms)} | "
+            f"seconds={time.perf_counter() - start:.3f} | path={self.root}"
+        )
+
+    # ---------- querying ----------
+
+    def _weights(self, s: int, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(rows, tf component of BM25) for one term in one segment; idf is applied per query."""
+        key = (s, term)
+        with self._cache_lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+                return hit
+        found = self._segments[s].lookup(term)
+        if found is None:
+            return None
+        ids, tf = found
+        tf = tf.astype(np.float64)
+        norm = self.k1 * (1.0 - self.b + self.b * self._lengths[ids] / max(self.avgdl, 1e-9))
+        entry = (ids, tf * (self.k1 + 1.0) / (tf + norm))
+        with self._cache_lock:
+            self._cache[key] = entry
+            self._cached += len(ids)
+            while self._cached > self.cache_postings and len(self._cache) > 1:
+                _, (old, _) = self._cache.popitem(last=False)
+                self._cached -= len(old)
+        return entry
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """Top-k (row, BM25 score) for the query, best first."""
+        if not self.rows:
+            return []
+        ids_parts, score_parts = [], []
+        for term in set(tokenize(query)):
+            df = sum(seg.df(term) for seg in self._segments)
+            if not df:
+                continue
+            idf = math.log(1.0 + (self.rows - df + 0.5) / (df + 0.5))
+            for s in range(len(self._segments)):
+                found = self._weights(s, term)
+                if found is not None:
+                    ids_parts.append(found[0])
+                    score_parts.append(idf * found[1])
+        if not ids_parts:
+            return []
+        if len(ids_parts) == 1:
+            rows, totals = ids_parts[0], score_parts[0]
+        else:
+            ids, scores = np.concatenate(ids_parts), np.concatenate(score_parts)
+            if len(ids) * 8 >= self.rows:
+                totals = np.bincount(ids, weights=scores, minlength=self.rows)
+                rows = np.arange(self.rows)
+            else:
+                rows, inverse = np.unique(ids, return_inverse=True)
+                totals = np.bincount(inverse, weights=scores)
+        top = np.argpartition(-totals, k)[:k] if len(totals) > k else np.arange(len(totals))
+        top = top[np.argsort(-totals[top], kind="stable")]
+        return [(int(rows[i]), float(totals[i])) for i in top if totals[i] > 0]
+
+    def stats(self) -> Dict:
+        return {"rows": self.rows, "segments": len(self._segments), "avgdl": round(self.avgdl, 2)}
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60, limit: Optional[int] = None) -> List[int]:
+    """Fuse ranked id lists: score(id) = sum over lists of 1 / (k + rank)."""
+    scores: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            scores[row] += 1.0 / (k + rank)
+    fused = sorted(scores, key=lambda r: (-scores[r], r))
+    return fused[:limit] if limit else fused
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = np.random.default_rng(0)
+    vocab = [f"w{i}" for i in range(30_000)] + ["lstm", "transformer", "3.2", "gpt-4"]
+    weights = 1.0 / np.arange(1, len(vocab) + 1)
+    weights /= weights.sum()
+    with tempfile.TemporaryDirectory() as tmp:
+        index = BM25Index(tmp)
+        t0 = time.perf_counter()
+        for s in range(0, n, 10_000):
+            words = rng.choice(len(vocab), size=(min(10_000, n - s), 150), p=weights)
+            index.add(list(range(s, s + len(words))), [" ".join(vocab[w] for w in row) for row in words])
+        print(f"indexed {n} chunks in {time.perf_counter() - t0:.2f}s | {index.stats()}")
+        size = sum(p.stat().st_size for p in Path(tmp).iterdir())
+        print(f"on disk: {size / 1e6:.1f} MB")
+        for q in ("lstm", "section 3.2 lstm", "gpt-4 transformer w12000", "w5 w900 w15000"):
+            t0 = time.perf_counter()
+            index.search(q, 10)
+            cold = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter()
+            for _ in range(50):
+                index.search(q, 10)
+            print(f"{q!r:<28} cold={cold:.3f} ms  warm={(time.perf_counter() - t0) / 50 * 1000:.3f} ms")
@@ -0,0 +1,410 @@
+from __future__ import annotations
+
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from logger import GLOBAL_LOGGER as log
+from utils.token_count import approx_tokens
+
+DEFAULTS: Dict[str, Any] = {
+    "enabled": True,
+    "path": "chat_history/history.db",
+    "hot_sessions": 256,    # sessions kept in memory (LRU); the rest are read back from SQLite
+    "max_messages": 12,     # recent messages kept verbatim
+    "max_tokens": 1500,     # summary + recent messages sent to the LLM
+    "summary_tokens": 300,  # cap on the rolling summary
+    "summarizer": "llm",    # llm | local
+}
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+_ROLES = {"human": HumanMessage, "ai": AIMessage}
+
+Summarizer = Callable[[str, List[Tuple[str, str]]], str]
+
+
+@dataclass
+class _Session:
+    summary: str = ""
+    # (seq, role, content, tokens), oldest first
+    messages: List[Tuple[int, str, str, int]] = field(default_factory=list)
+    upto: Optional[int] = None  # last seq folded into the summary (or cleared)
+    folding: bool = False
+
+    @property
+    def tokens(self) -> int:
+        return (approx_tokens(self.summary) if self.summary else 0) + sum(m[3] for m in self.messages)
+
+    @property
+    def version(self) -> Tuple[Optional[int], Optional[int]]:
+        """(max seq in messages, summaries.upto_seq) as last seen; compared with the db before serving."""
+        return (self.messages[-1][0] if self.messages else None), self.upto
+
+    @property
+    def next_seq(self) -> int:
+        return max((x for x in self.version if x is not None), default=-1) + 1
+
+
+def local_summary(previous: str, messages: List[Tuple[str, str]], max_tokens: int = 300) -> str:
+    """Extractive fallback: the first sentence of each folded message appended to the previous
+    summary, keeping the most recent max_tokens (approx.)."""
+    lines = [previous] if previous else []
+    for role, content in messages:
+        first = " ".join(content.split()).split(". ")[0][:240]
+        lines.append(f"{'User' if role == 'human' else 'Assistant'}: {first}")
+    text = " ".join(lines)
+    if approx_tokens(text) <= max_tokens:
+        return text
+    tail = text[-max_tokens * 4:]
+    return tail[tail.find(" ") + 1:] if " " in tail else tail
+
+
+def llm_summarizer(max_tokens: int = 300) -> Summarizer:
+    """Summarize with the shared LLM and the chat_history_summary prompt; falls back to local_summary."""
+    from langchain_core.output_parsers import StrOutputParser
+    from prompt.prompt_library import PROMPT_REGISTRY
+    from utils.model_loader import MODEL_REGISTRY
+
+    def summarize(previous: str, messages: List[Tuple[str, str]]) -> str:
+        chain = PROMPT_REGISTRY["chat_history_summary"] | MODEL_REGISTRY.get_llm() | StrOutputParser()
+        text = chain.invoke({
+            "summary": previous or "(none)",
+            "messages": "\n".join(f"{'User' if r == 'human' else 'Assistant'}: {c}" for r, c in messages),
+            "max_words": max(20, max_tokens * 3 // 4),
+        })
+        return " ".join(text.split())[: max_tokens * 4]
+
+    return summarize
+
+
+class ChatHistoryStore:
+    """
+    Bounded, persistent chat history per session.
+
+    Messages are appended to SQLite (WAL) and served from an in-memory LRU of hot
+    sessions. Several processes may share one db file: seqs are allocated inside the
+    write transaction that inserts the messages, and a hot session is checked against
+    the db's max seq and summary before it is served, so another worker's turns are
+    never missed or overwritten. Once a session holds more than max_messages messages or max_tokens
+    tokens, its oldest messages are folded into a rolling summary (capped at
+    summary_tokens) and deleted from disk, down to half of either cap so that
+    summarizing happens every few turns rather than on every one. What is sent to the
+    LLM, summary plus recent messages, therefore stays bounded however long the
+    conversation runs. Folding runs on a background thread, so append() never waits
+    for the summary LLM call; a fold whose session was cleared meanwhile is dropped.
+    """
+    def __init__(
+        self,
+        path: str = DEFAULTS["path"],
+        hot_sessions: int = DEFAULTS["hot_sessions"],
+        max_messages: int = DEFAULTS["max_messages"],
+        max_tokens: int = DEFAULTS["max_tokens"],
+        summary_tokens: int = DEFAULTS["summary_tokens"],
+        summarizer: str = DEFAULTS["summarizer"],
+        enabled: bool = True,
+    ):
+        self.path = str(path)
+        self.hot_sessions = int(hot_sessions)
+        self.max_messages = int(max_messages)
+        self.max_tokens = int(max_tokens)
+        self.summary_tokens = int(summary_tokens)
+        self.summarizer = summarizer
+        self.enabled = bool(enabled)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._hot: "OrderedDict[str, _Session]" = OrderedDict()
+        self._folder: Optional[ThreadPoolExecutor] = None
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.folds = 0
+        self.folded_messages = 0
+        self.summary_failures = 0
+        self.dropped_folds = 0
+
+    def configure(self, config: Optional[Dict[str, Any]] = None) -> None:
+        cfg = {**DEFAULTS, **((config or {}).get("chat_history", {}) or {})}
+        with self._lock:
+            if str(cfg["path"]) != self.path:
+                self._close_locked()
+                self.path = str(cfg["path"])
+                self._hot.clear()
+            self.enabled = bool(cfg["enabled"])
+            self.hot_sessions = int(cfg["hot_sessions"])
+            self.max_messages = int(cfg["max_messages"])
+            self.max_tokens = int(cfg["max_tokens"])
+            self.summary_tokens = int(cfg["summary_tokens"])
+            self.summarizer = cfg["summarizer"]
+            self._evict_locked()
+
+    # ---------- storage ----------
+
+    def _db_locked(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages (session TEXT NOT NULL, seq INTEGER NOT NULL, "
+                "role TEXT NOT NULL, content TEXT NOT NULL, tokens INTEGER NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (session, seq))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries (session TEXT PRIMARY KEY, summary TEXT NOT NULL, "
+                "upto_seq INTEGER NOT NULL, updated REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _close_locked(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            folder, self._folder = self._folder, None
+            self._close_locked()
+        if folder is not None:
+            folder.shutdown(wait=True)
+
+    def flush(self) -> None:
+        """Wait for the folds scheduled so far to finish."""
+        with self._lock:
+            folder = self._folder
+        if folder is not None:
+            folder.submit(lambda: None).result()
+
+    @staticmethod
+    def _version(db: sqlite3.Connection, session_id: str) -> Tuple[Optional[int], Optional[int]]:
+        row = db.execute(
+            "SELECT (SELECT MAX(seq) FROM messages WHERE session = ?), "
+            "(SELECT upto_seq FROM summaries WHERE session = ?)",
+            (session_id, session_id),
+        ).fetchone()
+        return row[0], row[1]
+
+    def _session_locked(self, session_id: str) -> _Session:
+        db = self._db_locked()
+        # one read snapshot for the version check and the reload (append already holds a write transaction)
+        own = not db.in_transaction
+        if own:
+            db.execute("BEGIN")
+        try:
+            version = self._version(db, session_id)
+            s = self._hot.get(session_id)
+            if s is not None and s.version == version:
+                self._hot.move_to_end(session_id)
+                self.hits += 1
+                return s
+            if s is not None:
+                # another process appended, folded or cleared this session
+                self.stale += 1
+            self.misses += 1
+            s = _Session()
+            row = db.execute("SELECT summary, upto_seq FROM summaries WHERE session = ?", (session_id,)).fetchone()
+            if row is not None:
+                s.summary, s.upto = row
+            rows = db.execute(
+                "SELECT seq, role, content, tokens FROM messages WHERE session = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+            s.messages = [tuple(r) for r in rows]
+            self._hot[session_id] = s
+            self._evict_locked()
+            return s
+        finally:
+            if own:
+                db.execute("COMMIT")
+
+    def _evict_locked(self) -> None:
+        while len(self._hot) > self.hot_sessions:
+            self._hot.popitem(last=False)
+
+    # ---------- public API ----------
+
+    def messages(self, session_id: str) -> List[BaseMessage]:
+        """The rolling summary (as a system message) followed by the recent messages, oldest first."""
+        if not self.enabled:
+            return []
+        with self._lock:
+            s = self._session_locked(session_id)
+            out: List[BaseMessage] = [SystemMessage(SUMMARY_PREFIX + s.summary)] if s.summary else []
+            out.extend(_ROLES.get(role, HumanMessage)(content) for _, role, content, _ in s.messages)
+            return out
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]) -> None:
+        """Persist new messages, then fold the oldest ones into the summary if a cap is exceeded."""
+        if not self.enabled or not messages:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._db_locked()
+            # IMMEDIATE takes the write lock first, so the seqs read here cannot be taken by another process
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                s = self._session_locked(session_id)
+                rows = []
+                for seq, m in enumerate(messages, start=s.next_seq):
+                    role = "ai" if m.type == "ai" else "human"
+                    content = m.content if isinstance(m.content, str) else str(m.content)
+                    rows.append((session_id, seq, role, content, approx_tokens(content), now))
+                db.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)", rows)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            s.messages.extend(r[1:5] for r in rows)
+            plan = self._plan_fold_locked(s)
+            if plan is not None:
+                if self._folder is None:
+                    # one thread: folds are rare, and a session's folds must not overlap anyway
+                    self._folder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-fold")
+                self._folder.submit(self._fold_quietly, session_id, s, *plan)
+
+    def add_turn(self, session_id: str, question: str, answer: str) -> None:
+        self.append(session_id, [HumanMessage(question), AIMessage(answer)])
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._hot.pop(session_id, None)
+            db = self._db_locked()
+            db.execute("BEGIN IMMEDIATE")
+            last = max((x for x in self._version(db, session_id) if x is not None), default=None)
+            db.execute("DELETE FROM messages WHERE session = ?", (session_id,))
+            db.execute("DELETE FROM summaries WHERE session = ?", (session_id,))
+            if last is not None:
+                # an empty summary keeps the last seq, so seqs are never reused and other
+                # processes' hot copies of the session no longer match the db
+                db.execute("INSERT INTO summaries VALUES (?, '', ?, ?)", (session_id, last, time.time()))
+            db.execute("COMMIT")
+
+    # ---------- folding ----------
+
+    def _over(self, s: _Session) -> bool:
+        return len(s.messages) > self.max_messages or s.tokens > self.max_tokens
+
+    def _plan_fold_locked(self, s: _Session) -> Optional[Tuple[str, List[Tuple[int, str, str, int]]]]:
+        """(summary so far, oldest messages to fold), or None when within the caps."""
+        if s.folding or not self._over(s):
+            return None
+        keep_messages, keep_tokens = max(2, self.max_messages // 2), self.max_tokens // 2
+        cut, tokens = 0, sum(m[3] for m in s.messages) + self.summary_tokens
+        while len(s.messages) - cut > keep_messages or (tokens > keep_tokens and len(s.messages) - cut > 2):
+            tokens -= s.messages[cut][3]
+            cut += 1
+        # fold whole turns: never keep an answer without its question
+        while 0 < cut < len(s.messages) - 1 and s.messages[cut][1] != "human":
+            cut += 1
+        if cut == 0:
+            return None
+        s.folding = True
+        return s.summary, s.messages[:cut]
+
+    def _summarize(self, previous: str, folded: List[Tuple[int, str, str, int]]) -> str:
+        pairs = [(role, content) for _, role, content, _ in folded]
+        if self.summarizer == "llm":
+            try:
+                return llm_summarizer(self.summary_tokens)(previous, pairs)
+            except Exception as e:
+                self.summary_failures += 1
+                log.warning(f"Chat history summary failed, summarizing locally | error={e}")
+        return local_summary(previous, pairs, self.summary_tokens)
+
+    def _fold_quietly(self, session_id: str, s: _Session, previous: str, folded: List[Tuple[int, str, str, int]]) -> None:
+        try:
+            self._fold(session_id, s, previous, folded)
+        except Exception as e:
+            log.warning(f"Chat history fold failed | session={session_id} | error={e}")
+
+    def _fold(self, session_id: str, s: _Session, previous: str, folded: List[Tuple[int, str, str, int]]) -> None:
+        # the LLM call runs outside the lock; the session is flagged so it is not folded twice
+        started = time.perf_counter()
+        try:
+            summary = self._summarize(previous, folded)
+        except Exception:
+            with self._lock:
+                s.folding = False
+            raise
+        upto = folded[-1][0]
+        with self._lock:
+            s.folding = False
+            if self._hot.get(session_id) is not s:
+                # cleared (or evicted and reloaded) while summarizing: writing now would resurrect
+                # cleared turns; an evicted session is simply folded again on its next append
+                self.dropped_folds += 1
+                log.info(f"Chat history fold dropped, session changed | session={session_id}")
+                return
+            db = self._db_locked()
+            db.execute("BEGIN IMMEDIATE")
+            if self._version(db, session_id)[1] != s.upto:
+                # another process folded or cleared the session first
+                db.execute("ROLLBACK")
+                self._hot.pop(session_id, None)
+                self.dropped_folds += 1
+                log.info(f"Chat history fold dropped, summary changed | session={session_id}")
+                return
+            db.execute("DELETE FROM messages WHERE session = ? AND seq <= ?", (session_id, upto))
+            db.execute(
+                "INSERT INTO summaries VALUES (?, ?, ?, ?) ON CONFLICT(session) DO UPDATE SET "
+                "summary = excluded.summary, upto_seq = excluded.upto_seq, updated = excluded.updated",
+                (session_id, summary, upto, time.time()),
+            )
+            db.execute("COMMIT")
+            s.summary, s.upto = summary, upto
+            s.messages = [m for m in s.messages if m[0] > upto]
+            self.folds += 1
+            self.folded_messages += len(folded)
+        log.info(
+            f"Chat history folded | session={session_id} | messages={len(folded)} | "
+            f"summary_tokens={approx_tokens(summary)} | seconds={time.perf_counter() - started:.2f}"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "path": self.path,
+                "hot_sessions": len(self._hot),
+                "max_hot_sessions": self.hot_sessions,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "folds": self.folds,
+                "folded_messages": self.folded_messages,
+                "summary_failures": self.summary_failures,
+                "dropped_folds": self.dropped_folds,
+            }
+
+
+class SessionHistory(BaseChatMessageHistory):
+    """BaseChatMessageHistory view of one session in a ChatHistoryStore (for RunnableWithMessageHistory)."""
+    def __init__(self, store: ChatHistoryStore, session_id: str):
+        self.store = store
+        self.session_id = session_id
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return self.store.messages(self.session_id)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.store.append(self.session_id, messages)
+
+    def clear(self) -> None:
+        self.store.clear(self.session_id)
+
+
+# Shared by every request handled in this process
+CHAT_HISTORY = ChatHistoryStore()
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import os
+import json
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+TEXT_BLOB = "text.bin"
+TEXT_OFFSETS = "text.off"
+META_BLOB = "meta.bin"
+META_OFFSETS = "meta.off"
+COLUMNS_FILE = "rows.col"
+SOURCES_LOG = "sources.jsonl"
+
+# Fixed-width per-row columns for the metadata every chunk carries; anything else
+# goes to the JSON side table. -1 / NO_SOURCE mean "key absent".
+COLUMNS = np.dtype([("source", "<u4"), ("page", "<i4"), ("start", "<i8")])
+NO_SOURCE = np.iinfo(np.uint32).max
+
+DOCSTORE_FILES = (TEXT_BLOB, TEXT_OFFSETS, META_BLOB, META_OFFSETS, COLUMNS_FILE, SOURCES_LOG)
+
+
+def _small_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value < 2**31
+
+
+class DocstoreAppender:
+    """
+    Appends chunks to the columnar files of one store directory.
+
+    text.bin / text.off   - UTF-8 chunk text and one uint64 end offset per row
+    rows.col              - source id, page and start_index per row (COLUMNS)
+    sources.jsonl         - source dictionary; a row's source id is its line number
+    meta.bin / meta.off   - JSON of any remaining metadata keys ("" when none)
+
+    committed is {"text_bytes", "meta_bytes", "sources", "sources_bytes"}: the state the caller last made
+    durable. Nothing written here is visible to readers until the caller records the
+    new state (see SegmentStore.commit).
+    """
+    def __init__(self, root: Path, committed: Dict[str, int]):
+        self.root = Path(root)
+        self.text_bytes = int(committed.get("text_bytes", 0))
+        self.meta_bytes = int(committed.get("meta_bytes", 0))
+        self.sources_bytes = int(committed.get("sources_bytes", 0))
+        self._sources: Dict[str, int] = {}
+        if committed.get("sources"):
+            for i, s in enumerate(read_sources(self.root, committed["sources"])):
+                self._sources[s] = i
+        self._files: Dict[str, Any] = {}
+
+    def _file(self, name: str):
+        if name not in self._files:
+            self._files[name] = open(self.root / name, "ab")
+        return self._files[name]
+
+    def _source_id(self, source: str) -> int:
+        sid = self._sources.get(source)
+        if sid is None:
+            sid = self._sources[source] = len(self._sources)
+            line = json.dumps(source, ensure_ascii=False).encode("utf-8") + b"\n"
+            self._file(SOURCES_LOG).write(line)
+            self.sources_bytes += len(line)
+        return sid
+
+    def append(self, docs: Sequence[Document]) -> None:
+        cols = np.empty(len(docs), dtype=COLUMNS)
+        text_ends = np.empty(len(docs), dtype=np.uint64)
+        meta_ends = np.empty(len(docs), dtype=np.uint64)
+        texts, metas = [], []
+        for i, d in enumerate(docs):
+            md = dict(d.metadata or {})
+            source, page, start = md.get("source"), md.get("page"), md.get("start_index")
+            cols[i] = (
+                self._source_id(md.pop("source")) if isinstance(source, str) else NO_SOURCE,
+                md.pop("page") if _small_int(page) else -1,
+                md.pop("start_index") if _small_int(start) else -1,
+            )
+            text = d.page_content.encode("utf-8")
+            self.text_bytes += len(text)
+            text_ends[i] = self.text_bytes
+            texts.append(text)
+            meta = json.dumps(md, ensure_ascii=False).encode("utf-8") if md else b""
+            self.meta_bytes += len(meta)
+            meta_ends[i] = self.meta_bytes
+            metas.append(meta)
+        self._file(TEXT_BLOB).write(b"".join(texts))
+        self._file(TEXT_OFFSETS).write(text_ends.tobytes())
+        self._file(COLUMNS_FILE).write(cols.tobytes())
+        self._file(META_BLOB).write(b"".join(metas))
+        self._file(META_OFFSETS).write(meta_ends.tobytes())
+
+    def close(self, sync: bool = True) -> Dict[str, int]:
+        for f in self._files.values():
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+            f.close()
+        self._files.clear()
+        return {
+            "text_bytes": self.text_bytes,
+            "meta_bytes": self.meta_bytes,
+            "sources": len(self._sources),
+            "sources_bytes": self.sources_bytes,
+        }
+
+
+def read_sources(root: Path, count: int) -> List[str]:
+    out: List[str] = []
+    if not count:
+        return out
+    with open(Path(root) / SOURCES_LOG, "rb") as f:
+        for line in f:
+            out.append(json.loads(line))
+            if len(out) == count:
+                break
+    return out
+
+
+def committed_sizes(rows: int, committed: Dict[str, int]) -> Dict[str, int]:
+    """Expected byte size of every docstore file for a committed state."""
+    return {
+        TEXT_BLOB: committed.get("text_bytes", 0),
+        TEXT_OFFSETS: rows * 8,
+        META_BLOB: committed.get("meta_bytes", 0),
+        META_OFFSETS: rows * 8,
+        COLUMNS_FILE: rows * COLUMNS.itemsize,
+        SOURCES_LOG: committed.get("sources_bytes", 0),
+    }
+
+
+def _memmap(path: Path, dtype, count: int) -> Optional[np.memmap]:
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,)) if count else None
+
+
+class MmapDocstore(Docstore, AddableMixin):
+    """
+    Read-only, memory-mapped view of the columnar files, addressed by row number.
+    Opening maps the files without reading them; search() materializes a single
+    Document, so retrieval only decodes the top-k hits. Documents added in memory
+    (e.g. by FAISS.add_embeddings during an ingest) live in a small overlay.
+    """
+    def __init__(self, root: Path, rows: int, committed: Dict[str, int]):
+        self.root = Path(root)
+        self.rows = int(rows)
+        self._text = _memmap(self.root / TEXT_BLOB, np.uint8, committed.get("text_bytes", 0))
+        self._text_ends = _memmap(self.root / TEXT_OFFSETS, np.uint64, self.rows)
+        self._meta = _memmap(self.root / META_BLOB, np.uint8, committed.get("meta_bytes", 0))
+        self._meta_ends = _memmap(self.root / META_OFFSETS, np.uint64, self.rows)
+        self._cols = _memmap(self.root / COLUMNS_FILE, COLUMNS, self.rows)
+        self._sources = read_sources(self.root, committed.get("sources", 0))
+        self._overlay: Dict[str, Document] = {}
+
+    def __len__(self) -> int:
+        return self.rows + len(self._overlay)
+
+    @staticmethod
+    def _span(ends: np.ndarray, row: int) -> Tuple[int, int]:
+        return (int(ends[row - 1]) if row else 0), int(ends[row])
+
+    def row(self, row: int) -> Document:
+        start, end = self._span(self._text_ends, row)
+        text = self._text[start:end].tobytes().decode("utf-8") if end > start else ""
+        source, page, offset = self._cols[row]
+        md: Dict[str, Any] = {}
+        if source != NO_SOURCE:
+            md["source"] = self._sources[int(source)]
+        if page >= 0:
+            md["page"] = int(page)
+        if offset >= 0:
+            md["start_index"] = int(offset)
+        start, end = self._span(self._meta_ends, row)
+        if end > start:
+            md.update(json.loads(self._meta[start:end].tobytes().decode("utf-8")))
+        return Document(page_content=text, metadata=md)
+
+    def search(self, search: str) -> Union[str, Document]:
+        doc = self._overlay.get(search)
+        if doc is not None:
+            return doc
+        try:
+            row = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= row < self.rows:
+            return f"ID {search} not found."
+        return self.row(row)
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = set(texts).intersection(self._overlay)
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._overlay.update(texts)
+
+    def delete(self, ids: List) -> None:
+        raise NotImplementedError("The columnar docstore is append-only")
+
+    def __iter__(self) -> Iterator[Document]:
+        for i in range(self.rows):
+            yield self.row(i)
+        yield from self._overlay.values()
+
+
+class RowIdMap(MutableMapping):
+    """index position -> docstore id without a per-row dict: committed rows map to str(row)."""
+    def __init__(self, rows: int):
+        self.rows = int(rows)
+        self._extra: Dict[int, str] = {}
+
+    def __getitem__(self, i: int) -> str:
+        if 0 <= i < self.rows:
+            return str(i)
+        return self._extra[i]
+
+    def __setitem__(self, i: int, value: str) -> None:
+        if 0 <= i < self.rows:
+            raise KeyError(f"Row {i} is committed and cannot be remapped")
+        self._extra[i] = value
+
+    def __delitem__(self, i: int) -> None:
+        raise NotImplementedError("The columnar docstore is append-only")
+
+    def __iter__(self):
+        yield from range(self.rows)
+        yield from self._extra
+
+    def __len__(self) -> int:
+        return self.rows + len(self._extra)
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+
+from logger import GLOBAL_LOGGER as log
+
+
+class ServerBusyError(Exception):
+    """Raised when an endpoint has no free slot; carries the HTTP status to return."""
+    def __init__(self, endpoint: str, status_code: int, detail: str, retry_after: int = 1):
+        super().__init__(detail)
+        self.endpoint = endpoint
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class EndpointLimiter:
+    """
+    Caps in-flight requests for one endpoint and bounds how many may wait for a slot.
+    A full wait queue is rejected immediately with 429; a request that waits longer
+    than queue_timeout gets 503.
+    """
+    def __init__(self, name: str, max_concurrency: int = 4, max_queue: int = 16, queue_timeout: float = 30.0):
+        self.name = name
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = float(queue_timeout)
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected_429 = 0
+        self.rejected_503 = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if not self._sem.locked():
+            # free slot: acquire() returns without suspending
+            await self._sem.acquire()
+        else:
+            if self.waiting >= self.max_queue:
+                self.rejected_429 += 1
+                raise ServerBusyError(self.name, 429, f"Too many queued requests for {self.name}")
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._sem.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected_503 += 1
+                raise ServerBusyError(self.name, 503, f"{self.name} is busy, retry later", retry_after=5)
+            finally:
+                self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._sem.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected_429": self.rejected_429,
+            "rejected_503": self.rejected_503,
+        }
+
+
+class ExecutorPool:
+    """
+    Bounded executors for blocking work called from async endpoints:
+    a thread pool for file I/O and LLM / embedding calls, and a process pool
+    for CPU-bound parsing. Both are created lazily and shut down on app exit.
+    """
+    def __init__(self, io_workers: int = 8, cpu_workers: int = 2):
+        self.io_workers = max(1, int(io_workers))
+        self.cpu_workers = max(1, int(cpu_workers))
+        self._lock = threading.Lock()
+        self._io: Optional[ThreadPoolExecutor] = None
+        self._cpu: Optional[ProcessPoolExecutor] = None
+        self.limiters: Dict[str, EndpointLimiter] = {}
+
+    def configure(self, cfg: Optional[Dict[str, Any]] = None) -> None:
+        cfg = cfg or {}
+        self.shutdown()
+        self.io_workers = max(1, int(cfg.get("io_workers", self.io_workers)))
+        self.cpu_workers = max(1, int(cfg.get("cpu_workers", self.cpu_workers)))
+        queue_timeout = float(cfg.get("queue_timeout_seconds", 30))
+        for name, lim in (cfg.get("endpoints") or {}).items():
+            lim = lim or {}
+            self.limiters[name] = EndpointLimiter(
+                name,
+                max_concurrency=lim.get("max_concurrency", 4),
+                max_queue=lim.get("max_queue", 16),
+                queue_timeout=lim.get("queue_timeout_seconds", queue_timeout),
+            )
+        log.info(
+            f"Executors configured | io_workers={self.io_workers} | cpu_workers={self.cpu_workers} | "
+            f"endpoints={sorted(self.limiters)}"
+        )
+
+    def limiter(self, name: str) -> EndpointLimiter:
+        if name not in self.limiters:
+            self.limiters[name] = EndpointLimiter(name)
+        return self.limiters[name]
+
+    @property
+    def io(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._io is None:
+                self._io = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="portal-io")
+            return self._io
+
+    @property
+    def cpu(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._cpu is None:
+                self._cpu = ProcessPoolExecutor(max_workers=self.cpu_workers)
+            return self._cpu
+
+    async def run_io(self, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.io, functools.partial(fn, *args, **kwargs))
+
+    async def run_cpu(self, fn: Callable, *args, **kwargs) -> Any:
+        """fn and its arguments must be picklable (module-level functions, bound methods of plain objects)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.cpu, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            io, cpu = self._io, self._cpu
+            self._io = self._cpu = None
+        if io is not None:
+            io.shutdown(wait=False, cancel_futures=True)
+        if cpu is not None:
+            cpu.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "io_workers": self.io_workers,
+            "cpu_workers": self.cpu_workers,
+            "endpoints": {name: lim.stats() for name, lim in self.limiters.items()},
+        }
+
+
+# Shared by every request handled in this process
+EXECUTORS = ExecutorPool()
+
+_RATE_LIMITERS: Dict[float, Any] = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def rate_limiter(requests_per_minute: Optional[float]):
+    """
+    Process-wide token-bucket limiter for outbound LLM calls, one per rate, or None
+    when unlimited. Shared so that concurrent requests draw from the same budget.
+    """
+    if not requests_per_minute or float(requests_per_minute) <= 0:
+        return None
+    from langchain_core.rate_limiters import InMemoryRateLimiter
+
+    rpm = float(requests_per_minute)
+    with _RATE_LIMITERS_LOCK:
+        if rpm not in _RATE_LIMITERS:
+            _RATE_LIMITERS[rpm] = InMemoryRateLimiter(
+                requests_per_second=rpm / 60.0, check_every_n_seconds=0.05, max_bucket_size=1
+            )
+        return _RATE_LIMITERS[rpm]
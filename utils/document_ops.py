@@ -3,9 +3,10 @@ from pathlib import Path
 from typing import Iterable, List
 from fastapi import UploadFile
 from langchain.schema import Document
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
+from langchain_community.document_loaders import Docx2txtLoader, TextLoader
 from logger import GLOBAL_LOGGER as log
 from exception.custom_exception import DocumentPortalException
+from utils.pdf_extraction import iter_pdf_documents
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 
 
@@ -16,19 +17,21 @@ def load_documents(paths: Iterable[Path]) -> List[Document]:
         for p in paths:
             ext = p.suffix.lower()
             if ext == ".pdf":
-                loader = PyPDFLoader(str(p))
+                # page-streaming PyMuPDF engine shared with analysis/comparison
+                docs.extend(iter_pdf_documents(p))
+                continue
             elif ext == ".docx":
                 loader = Docx2txtLoader(str(p))
             elif ext == ".txt":
                 loader = TextLoader(str(p), encoding="utf-8")
             else:
-                log.warning("Unsupported extension skipped", path=str(p))
+                log.warning(f"Unsupported extension skipped | path={p}")
                 continue
             docs.extend(loader.load())
-        log.info("Documents loaded", count=len(docs))
+        log.info(f"Documents loaded | count={len(docs)}")
         return docs
     except Exception as e:
-        log.error("Failed loading documents", error=str(e))
+        log.error(f"Failed loading documents | error={e}")
         raise DocumentPortalException("Error loading documents", e) from e
 
 def concat_for_analysis(docs: List[Document]) -> str:
@@ -45,11 +48,22 @@ def concat_for_comparison(ref_docs: List[Document], act_docs: List[Document]) ->
 
 # ---------- Helpers ----------
 class FastAPIFileAdapter:
-    """Adapt FastAPI UploadFile -> .name + .getbuffer() API"""
+    """Adapt FastAPI UploadFile -> .name + .file (streamed by utils.file_io.stream_upload) + .getbuffer() API"""
     def __init__(self, uf: UploadFile):
         self._uf = uf
         self.name = uf.filename
+        self.file = uf.file
+    @property
+    def size(self) -> int:
+        """Upload size in bytes, from the request or the spooled file (nothing is read)."""
+        if self._uf.size is not None:
+            return self._uf.size
+        pos = self._uf.file.tell()
+        size = self._uf.file.seek(0, 2)
+        self._uf.file.seek(pos)
+        return size
     def getbuffer(self) -> bytes:
+        """The whole upload in memory; prefer stream_upload for saving."""
         self._uf.file.seek(0)
         return self._uf.file.read()
 
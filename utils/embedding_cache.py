@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from logger import GLOBAL_LOGGER as log
+from utils.file_lock import interprocess_lock
+
+DIGEST_SIZE = 32  # sha256
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk embedding store for one embedding model.
+
+    vectors.f32 - row-major float32 matrix (rows x dim), read through np.memmap
+    keys.bin    - one 32-byte sha256 digest per row; its position is the row offset
+    meta.json   - model name and dimension
+
+    Vectors are written before their keys, so a crash can only leave orphan
+    vectors behind (trimmed by the next writer), never a key without a vector.
+    Several worker processes may share a store: writes hold a lock file, and each
+    writer first picks up the rows the others appended, so a row's offset always
+    comes from the keys file on disk.
+    """
+    def __init__(self, root: Path, model_name: str):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.vectors_path = self.root / "vectors.f32"
+        self.keys_path = self.root / "keys.bin"
+        self.meta_path = self.root / "meta.json"
+        self._lock = threading.Lock()
+        self._file_lock = interprocess_lock(self.root / ".lock")
+        self._rows: Dict[bytes, int] = {}
+        self._n = 0  # rows of keys.bin read so far
+        self._mmap: Optional[np.memmap] = None
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.embed_seconds = 0.0
+        self._open()
+
+    def _open(self) -> None:
+        with self._file_lock:
+            if self._read_meta_locked():
+                self._sync_locked()
+
+    def _read_meta_locked(self) -> bool:
+        if self.dim is None and self.meta_path.exists():
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            if meta.get("model_name") != self.model_name:
+                raise ValueError(f"Embedding cache at {self.root} belongs to {meta.get('model_name')}")
+            self.dim = int(meta["dim"])
+        return self.dim is not None
+
+    def _sync_locked(self) -> int:
+        """Trim a crashed writer's leftovers and read keys appended since; the on-disk row count."""
+        n_keys = self.keys_path.stat().st_size // DIGEST_SIZE if self.keys_path.exists() else 0
+        row_bytes = self.dim * 4
+        n_vecs = self.vectors_path.stat().st_size // row_bytes if self.vectors_path.exists() else 0
+        n = min(n_keys, n_vecs)
+        # drop anything written past the last complete (key, vector) pair
+        if self.keys_path.exists() and self.keys_path.stat().st_size != n * DIGEST_SIZE:
+            os.truncate(self.keys_path, n * DIGEST_SIZE)
+        if self.vectors_path.exists() and self.vectors_path.stat().st_size != n * row_bytes:
+            os.truncate(self.vectors_path, n * row_bytes)
+
+        if n > self._n:
+            with open(self.keys_path, "rb") as f:
+                f.seek(self._n * DIGEST_SIZE)
+                keys = f.read((n - self._n) * DIGEST_SIZE)
+            for i in range(n - self._n):
+                self._rows.setdefault(keys[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE], self._n + i)
+            self._n = n
+            self._remap(n)
+        return n
+
+    def _remap(self, n: int) -> None:
+        self._mmap = (
+            np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim)) if n else None
+        )
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def lookup(self, digests: Sequence[bytes]) -> Dict[int, np.ndarray]:
+        """Map position in `digests` -> cached vector, for the digests that are present."""
+        with self._lock:
+            if self._mmap is None:
+                return {}
+            found = {}
+            for i, d in enumerate(digests):
+                row = self._rows.get(d)
+                if row is not None:
+                    found[i] = np.array(self._mmap[row])
+            return found
+
+    def append(self, digests: Sequence[bytes], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock:
+            if not self._read_meta_locked():
+                self.dim = int(vectors.shape[1])
+                self.meta_path.write_text(
+                    json.dumps({"model_name": self.model_name, "dim": self.dim}), encoding="utf-8"
+                )
+            start = self._sync_locked()
+            new: Dict[bytes, np.ndarray] = {}
+            for d, v in zip(digests, vectors):
+                if d not in self._rows:
+                    new.setdefault(d, v)
+            if not new:
+                return
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.stack(list(new.values())).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new))
+            for offset, d in enumerate(new):
+                self._rows[d] = start + offset
+            self._n = start + len(new)
+            self._remap(self._n)
+
+    def record(self, hits: int, misses: int, seconds: float) -> None:
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.embed_seconds += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_name": self.model_name,
+                "rows": len(self._rows),
+                "dim": self.dim,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "embed_seconds": round(self.embed_seconds, 4),
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings backend with a persistent cache keyed by sha256(text) + model name.
+    Only chunks never seen before reach the backend; queries are passed through.
+    """
+    def __init__(self, backend: Embeddings, store: EmbeddingStore):
+        self.backend = backend
+        self.store = store
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [v.tolist() for v in self.embed_with(texts, self.backend.embed_documents)]
+
+    def embed_with(self, texts: List[str], embed_fn: Callable[[List[str]], Any]) -> List[np.ndarray]:
+        """Cache-aware embedding where embed_fn computes the misses (e.g. in a worker process)."""
+        digests = [content_hash(t) for t in texts]
+        found = self.store.lookup(digests)
+
+        # embed each missing text once, even if it repeats within the batch
+        missing: Dict[bytes, int] = {}
+        for i, d in enumerate(digests):
+            if i not in found and d not in missing:
+                missing[d] = i
+        if missing:
+            start = time.perf_counter()
+            vectors = np.asarray(embed_fn([texts[i] for i in missing.values()]), dtype=np.float32)
+            elapsed = time.perf_counter() - start
+            self.store.append(list(missing), vectors)
+            by_digest = dict(zip(missing, vectors))
+            for i, d in enumerate(digests):
+                if i not in found:
+                    found[i] = by_digest[d]
+        else:
+            elapsed = 0.0
+
+        self.store.record(len(texts) - len(missing), len(missing), elapsed)
+        if texts:
+            log.info(
+                f"Embedding cache | texts={len(texts)} | hits={len(texts) - len(missing)} | "
+                f"embedded={len(missing)} | model={self.store.model_name}"
+            )
+        return [found[i] for i in range(len(texts))]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.backend.embed_query(text)
+
+    def __getattr__(self, name: str) -> Any:
+        # expose backend attributes (model_name, client, ...) unchanged
+        if name in ("backend", "store"):
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+
+_STORES: Dict[str, EmbeddingStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_.-]+", "_", name).strip("_").lower()
+
+
+def wrap_with_cache(backend: Embeddings, model_name: str, cache_dir: str = "embedding_cache") -> CachedEmbeddings:
+    """Return backend wrapped with the shared on-disk cache for model_name."""
+    root = Path(cache_dir) / _slug(model_name)
+    with _STORES_LOCK:
+        key = str(root.resolve())
+        if key not in _STORES:
+            _STORES[key] = EmbeddingStore(root, model_name)
+            log.info(f"Embedding cache opened | path={root} | rows={len(_STORES[key])}")
+        return CachedEmbeddings(backend, _STORES[key])
+
+
+def embedding_cache_stats() -> List[Dict[str, Any]]:
+    with _STORES_LOCK:
+        stores = list(_STORES.values())
+    return [s.stats() for s in stores]
@@ -1,15 +1,138 @@
 from __future__ import annotations
+import os
 import re
 import uuid
+import hashlib
+import threading
 from pathlib import Path
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from typing import Iterable, List
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from logger import GLOBAL_LOGGER as log
 from exception.custom_exception import DocumentPortalException
 
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 
+UPLOAD_DEFAULTS: Dict[str, Any] = {
+    "max_mb": 200,      # per uploaded file; larger uploads are rejected with 413
+    "chunk_kb": 1024,   # copy buffer: peak memory per upload being saved
+}
+
+
+class UploadTooLargeError(Exception):
+    """Raised as soon as an upload is known to exceed the size limit; carries the HTTP status to return."""
+    status_code = 413
+
+    def __init__(self, filename: str, limit_bytes: int, size: Optional[int] = None):
+        self.filename = filename
+        self.limit_bytes = limit_bytes
+        self.size = size
+        self.detail = (
+            f"{filename} is larger than the {limit_bytes / (1024 * 1024):g} MB upload limit"
+            + (f" ({size / (1024 * 1024):.1f} MB)" if size is not None else "")
+        )
+        super().__init__(self.detail)
+
+
+class UploadLimits:
+    """Upload size limit and copy buffer size, plus counters for what was saved or rejected."""
+    def __init__(self, max_mb: float = UPLOAD_DEFAULTS["max_mb"], chunk_kb: int = UPLOAD_DEFAULTS["chunk_kb"]):
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+        self.chunk_size = int(chunk_kb) * 1024
+        self._lock = threading.Lock()
+        self.saved = 0
+        self.saved_bytes = 0
+        self.duplicates = 0
+        self.rejected = 0
+
+    def configure(self, config: Optional[Dict[str, Any]] = None) -> None:
+        cfg = {**UPLOAD_DEFAULTS, **((config or {}).get("uploads", {}) or {})}
+        self.max_bytes = int(float(cfg["max_mb"]) * 1024 * 1024)
+        self.chunk_size = int(cfg["chunk_kb"]) * 1024
+
+    def check(self, filename: str, size: Optional[int]) -> None:
+        """Reject an upload whose (declared or measured) size is over the limit."""
+        if size is not None and self.max_bytes and size > self.max_bytes:
+            with self._lock:
+                self.rejected += 1
+            raise UploadTooLargeError(filename, self.max_bytes, size)
+
+    def record(self, size: int) -> None:
+        with self._lock:
+            self.saved += 1
+            self.saved_bytes += size
+
+    def record_duplicate(self) -> None:
+        with self._lock:
+            self.duplicates += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_bytes": self.max_bytes,
+                "chunk_bytes": self.chunk_size,
+                "saved": self.saved,
+                "saved_bytes": self.saved_bytes,
+                "duplicates": self.duplicates,
+                "rejected": self.rejected,
+            }
+
+
+# Shared by every request handled in this process
+UPLOAD_LIMITS = UploadLimits()
+
+
+def upload_name(uploaded) -> str:
+    # FastAPI UploadFile has .filename; Streamlit uploads and FastAPIFileAdapter have .name
+    return getattr(uploaded, "filename", None) or getattr(uploaded, "name", None) or "file"
+
+
+def iter_upload_chunks(uploaded, chunk_size: int) -> Iterator[bytes]:
+    """
+    The upload's bytes from the start, chunk_size at a time. File-like uploads (.file,
+    .read) are streamed; objects that only offer getbuffer() already hold their bytes
+    in memory and are sliced without another copy.
+    """
+    f = getattr(uploaded, "file", None)
+    if f is None and hasattr(uploaded, "read"):
+        f = uploaded
+    if f is not None:
+        if hasattr(f, "seekable") and f.seekable():
+            f.seek(0)
+        yield from iter(lambda: f.read(chunk_size), b"")
+        return
+    view = memoryview(uploaded.getbuffer())
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+
+def stream_upload(uploaded, out_path: Path, limits: Optional[UploadLimits] = None) -> Tuple[int, str]:
+    """
+    Copy an upload to out_path in fixed-size chunks, hashing as it goes, and return
+    (size, sha256 hex). The copy goes to a temporary file next to out_path that is
+    renamed into place once complete; UploadTooLargeError is raised (and the partial
+    file removed) as soon as the limit is crossed.
+    """
+    limits = limits or UPLOAD_LIMITS
+    name = upload_name(uploaded)
+    limits.check(name, getattr(uploaded, "size", None))
+    out_path = Path(out_path)
+    tmp = out_path.with_name(f".{out_path.name}.{uuid.uuid4().hex[:8]}.part")
+    h, size = hashlib.sha256(), 0
+    try:
+        with open(tmp, "wb") as f:
+            for block in iter_upload_chunks(uploaded, limits.chunk_size):
+                size += len(block)
+                limits.check(name, size)
+                h.update(block)
+                f.write(block)
+        os.replace(tmp, out_path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    limits.record(size)
+    return size, h.hexdigest()
+
 
 def generate_session_id(prefix: str = "session") -> str:
     """Generate a timestamped unique session id (IST timezone)."""
@@ -20,36 +143,46 @@ def generate_session_id(prefix: str = "session") -> str:
 def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path]:
     """
     Save uploaded files (FastAPI UploadFile, Streamlit, or file-like) and return local paths.
+
+    Files are streamed to disk (see stream_upload) and named after their content hash:
+    an upload identical to a file already in target_dir reuses that file, and a repeat
+    within the same batch is dropped.
     """
     try:
         target_dir.mkdir(parents=True, exist_ok=True)
         saved: List[Path] = []
 
+        seen = set()
         for uf in uploaded_files:
-            # Try both FastAPI (filename) and others (name)
-            original_name = getattr(uf, "filename", None) or getattr(uf, "name", None) or "file"
+            original_name = upload_name(uf)
             ext = Path(original_name).suffix.lower()
 
             if ext not in SUPPORTED_EXTENSIONS:
-                log.warning("Unsupported file skipped", filename=original_name)
+                log.warning(f"Unsupported file skipped | filename={original_name}")
                 continue
 
-            # Safe + unique file name
+            # Safe file name; the content hash is only known once the copy is done
             safe_name = re.sub(r'[^a-zA-Z0-9_\-]', '_', Path(original_name).stem).lower()
-            fname = f"{safe_name}_{uuid.uuid4().hex[:6]}{ext}"
-            out_path = target_dir / fname
-
-            with open(out_path, "wb") as f:
-                if hasattr(uf, "read"):
-                    f.write(uf.read())
-                else:
-                    f.write(uf.getbuffer())  # fallback for BytesIO-like
+            part_path = target_dir / f"{safe_name}_{uuid.uuid4().hex[:6]}{ext}"
+            size, digest = stream_upload(uf, part_path)
+            out_path = target_dir / f"{safe_name}_{digest[:12]}{ext}"
 
+            if out_path in seen or out_path.exists():
+                part_path.unlink()
+                UPLOAD_LIMITS.record_duplicate()
+                log.info(f"Duplicate upload | uploaded={original_name} | existing={out_path} | sha256={digest}")
+                if out_path in seen:
+                    continue
+            else:
+                os.replace(part_path, out_path)
+                log.info(f"File saved for ingestion | uploaded={original_name} | saved_as={out_path} | bytes={size} | sha256={digest}")
+            seen.add(out_path)
             saved.append(out_path)
-            log.info("File saved for ingestion", uploaded=original_name, saved_as=str(out_path))
 
         return saved
 
+    except UploadTooLargeError:
+        raise
     except Exception as e:
-        log.error("Failed to save uploaded files", error=str(e), dir=str(target_dir))
+        log.error(f"Failed to save uploaded files | error={e} | dir={target_dir}")
         raise DocumentPortalException("Failed to save uploaded files", e) from e
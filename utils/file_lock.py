@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: the locks below then only serialize threads of this process
+    fcntl = None
+
+
+def flock(fd: int, shared: bool = False, blocking: bool = True) -> bool:
+    """Advisory flock on an open file; False when non-blocking and another holder conflicts."""
+    if fcntl is None:
+        return True
+    op = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+        op |= fcntl.LOCK_NB
+    try:
+        fcntl.flock(fd, op)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def funlock(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class InterProcessLock:
+    """
+    Exclusive lock on a lock file, held by one thread of one process at a time:
+    re-entrant within a thread, and flock'ed for the outermost acquisition so that
+    other worker processes using the same path wait too.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> None:
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    flock(fd)
+                except BaseException:
+                    os.close(fd)
+                    raise
+            except BaseException:
+                self._thread_lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd = self._fd, None
+            try:
+                funlock(fd)
+            finally:
+                os.close(fd)
+        self._thread_lock.release()
+
+    def __enter__(self) -> "InterProcessLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+_LOCKS: Dict[str, InterProcessLock] = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+def interprocess_lock(path) -> InterProcessLock:
+    """The process-wide lock object for a lock file path (one per path, shared by threads)."""
+    key = os.path.abspath(path)
+    with _LOCKS_GUARD:
+        lock = _LOCKS.get(key)
+        if lock is None:
+            lock = _LOCKS[key] = InterProcessLock(key)
+        return lock
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from logger import GLOBAL_LOGGER as log
+
+# manifest.json is swapped on every segment-store commit; index.* is the legacy layout
+INDEX_FILES = ("manifest.json", "index.faiss", "index.pkl")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class FaissIndexCache:
+    """
+    LRU cache of loaded FAISS vector stores, keyed by index directory + file mtimes.
+    Entries are charged by their on-disk size and evicted least-recently-used first
+    once the byte budget is exceeded.
+    """
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        # key -> (signature, size_bytes, vectorstore)
+        self._entries: "OrderedDict[str, Tuple[Tuple, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(index_dir) -> str:
+        return str(Path(index_dir).resolve())
+
+    @staticmethod
+    def signature(index_dir) -> Tuple[Tuple, int]:
+        """(mtime_ns, size) of every index file, plus the total size of the directory in bytes."""
+        sig = []
+        for name in INDEX_FILES:
+            p = Path(index_dir) / name
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                sig.append((name, None, None))
+                continue
+            sig.append((name, st.st_mtime_ns, st.st_size))
+        try:
+            total = sum(e.stat().st_size for e in os.scandir(index_dir) if e.is_file())
+        except FileNotFoundError:
+            total = 0
+        return tuple(sig), total
+
+    def configure(self, max_bytes: Optional[int] = None) -> None:
+        if max_bytes is not None:
+            with self._lock:
+                self.max_bytes = int(max_bytes)
+                self._evict_locked()
+
+    def get(self, index_dir, loader: Callable[[], Any]) -> Any:
+        """Return the cached store for index_dir, calling loader() on a miss or a stale entry."""
+        key = self._key(index_dir)
+        sig, size = self.signature(index_dir)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == sig:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # another thread may have loaded it while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == sig:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                self.misses += 1
+
+            vs = loader()
+
+            with self._lock:
+                self._drop_locked(key)
+                if size <= self.max_bytes:
+                    self._entries[key] = (sig, size, vs)
+                    self._bytes += size
+                    self._evict_locked()
+                else:
+                    log.warning(f"FAISS index larger than cache budget, not cached | index={key} | bytes={size}")
+            return vs
+
+    def invalidate(self, index_dir) -> bool:
+        key = self._key(index_dir)
+        with self._lock:
+            dropped = self._drop_locked(key)
+            if dropped:
+                self.invalidations += 1
+        if dropped:
+            log.info(f"FAISS index cache invalidated | index={key}")
+        return dropped
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop_locked(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[1]
+        return True
+
+    def _evict_locked(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            key, (_, size, _) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            log.info(f"FAISS index evicted from cache | index={key} | bytes={size}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Shared by every request handled in this process
+FAISS_INDEX_CACHE = FaissIndexCache()
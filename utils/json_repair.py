@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import re
+import json
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union, get_args, get_origin
+
+from langchain.output_parsers import OutputFixingParser
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.outputs import Generation
+from pydantic import BaseModel, RootModel, ValidationError
+
+from logger import GLOBAL_LOGGER as log
+
+# reasoning blocks emitted by r1-style models before (or around) the answer
+_REASONING = re.compile(r"<(think|thinking|reasoning)>.*?</\1>", re.DOTALL | re.IGNORECASE)
+_REASONING_TAG = re.compile(r"</?(think|thinking|reasoning)>", re.IGNORECASE)
+_FENCE = re.compile(r"```(?:json|JSON)?")
+_NUMBER = re.compile(r"-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+_WORD = re.compile(r"[A-Za-z_][\w.\-]*")
+_LITERALS = {"true": "true", "false": "false", "null": "null", "True": "true", "False": "false", "None": "null", "NaN": "null"}
+_CLOSE = {"{": "}", "[": "]"}
+_MISSING = "Not Available"  # what the prompts ask for when a field is not stated
+
+
+def strip_reasoning(text: str) -> str:
+    """Drop <think>...</think> (and similar) blocks and any stray reasoning tags."""
+    return _REASONING_TAG.sub("", _REASONING.sub("", text))
+
+
+def extract_json_span(text: str, opener: Optional[str] = None) -> Optional[str]:
+    """
+    The first balanced JSON object/array in text (string-aware), preferring opener
+    ('{' or '[') when given. A span left open at the end of the text (a truncated
+    reply) is returned as-is, up to the end, for repair_json to close.
+    """
+    text = _FENCE.sub("", text)
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return None
+    start = min(starts)
+    if opener is not None and text.find(opener) >= 0:
+        start = text.find(opener)
+    depth, quote, i = 0, None, start
+    while i < len(text):
+        c = text[i]
+        if quote:
+            if c == "\\":
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in "\"'":
+            quote = c
+        elif c in "{[":
+            depth += 1
+        elif c in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+        i += 1
+    return text[start:]
+
+
+def _read_string(span: str, i: int) -> Tuple[str, int]:
+    """A single- or double-quoted string starting at span[i], re-emitted as a JSON string."""
+    quote, j, buf = span[i], i + 1, []
+    while j < len(span) and span[j] != quote:
+        c = span[j]
+        if c == "\\" and j + 1 < len(span):
+            nxt = span[j + 1]
+            buf.append("'" if nxt == "'" else c + nxt if nxt in '"\\/bfnrtu' else "\\\\" + nxt)
+            j += 2
+            continue
+        buf.append({'"': '\\"', "\n": "\\n", "\r": "\\r", "\t": "\\t"}.get(c, c))
+        j += 1
+    return '"' + "".join(buf) + '"', j + 1
+
+
+def repair_json(span: str) -> str:
+    """
+    Rewrite near-JSON into JSON, fixing what LLMs commonly get wrong: trailing and
+    missing commas, single quotes, Python literals (True/None), // and /* */ comments,
+    unquoted keys and raw newlines in strings. Unclosed strings, brackets and a
+    dangling key at the end (a truncated reply) are closed.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    need_comma = False  # the last token completed a value; another value needs a comma first
+
+    def value(token: str) -> None:
+        nonlocal need_comma
+        if need_comma:
+            out.append(",")
+        out.append(token)
+        need_comma = True
+
+    def drop_trailing_comma() -> None:
+        while out and out[-1] in (",",):
+            out.pop()
+
+    i, n = 0, len(span)
+    while i < n:
+        c = span[i]
+        if c.isspace():
+            i += 1
+        elif span.startswith("//", i):
+            i = n if span.find("\n", i) < 0 else span.find("\n", i)
+        elif span.startswith("/*", i):
+            i = n if span.find("*/", i) < 0 else span.find("*/", i) + 2
+        elif c in "\"'":
+            token, i = _read_string(span, i)
+            value(token)
+        elif c in "{[":
+            value(c)
+            stack.append(c)
+            need_comma = False
+            i += 1
+        elif c in "}]":
+            drop_trailing_comma()
+            if out and out[-1] == ":":
+                out.append("null")
+            if stack:
+                out.append(_CLOSE[stack.pop()])
+            need_comma = True
+            i += 1
+        elif c == ":":
+            out.append(":")
+            need_comma = False
+            i += 1
+        elif c == ",":
+            if need_comma:
+                out.append(",")
+            need_comma = False
+            i += 1
+        elif (m := _NUMBER.match(span, i)) is not None:
+            value(m.group(0))
+            i = m.end()
+        elif (m := _WORD.match(span, i)) is not None:
+            word = m.group(0)
+            value(_LITERALS.get(word) or json.dumps(word))
+            i = m.end()
+        else:
+            i += 1  # stray character (';', '`', ...)
+    drop_trailing_comma()
+    if out and out[-1] == ":":
+        out.append("null")
+    out.extend(_CLOSE[b] for b in reversed(stack))
+    return "".join(out)
+
+
+def coerce_to_schema(annotation: Any, value: Any) -> Any:
+    """
+    Loosen a parsed value toward a pydantic annotation the way a lenient reader would:
+    numbers become strings and null becomes "Not Available" where a str is expected,
+    and a lone value becomes a one-item list where a list is expected. Anything it
+    does not recognize is returned unchanged for validation to judge.
+    """
+    origin, args = get_origin(annotation), get_args(annotation)
+    if origin is Union or type(annotation).__name__ == "UnionType":
+        if value is None and type(None) not in args and str in args:
+            return _MISSING
+        if isinstance(value, (int, float)) and type(value) not in args and str in args:
+            return str(value)
+        return value
+    if origin in (list, List):
+        if value is None:
+            return []
+        items = value if isinstance(value, list) else [value]
+        return [coerce_to_schema(args[0], v) for v in items] if args else items
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        fields = annotation.model_fields
+        if issubclass(annotation, RootModel):
+            return coerce_to_schema(fields["root"].annotation, value)
+        if isinstance(value, dict):
+            return {k: coerce_to_schema(fields[k].annotation, v) if k in fields else v for k, v in value.items()}
+        return value
+    if annotation is str:
+        if value is None:
+            return _MISSING
+        if isinstance(value, (int, float)):
+            return str(value)
+    return value
+
+
+class RepairStats:
+    """How often each parsing tier produced the result, per output schema."""
+    TIERS = ("direct", "repaired", "llm", "failed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._llm_seconds: Dict[str, float] = {}
+
+    def record(self, schema: str, tier: str, seconds: float = 0.0) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(schema, dict.fromkeys(self.TIERS, 0))
+            counts[tier] += 1
+            if tier == "llm":
+                self._llm_seconds[schema] = self._llm_seconds.get(schema, 0.0) + seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {}
+            for schema, counts in self._counts.items():
+                avg = self._llm_seconds.get(schema, 0.0) / counts["llm"] if counts["llm"] else None
+                out[schema] = {
+                    **counts,
+                    "avg_llm_fix_ms": round(avg * 1000, 2) if avg is not None else None,
+                    # each local repair stood in for one LLM fix round-trip
+                    "est_saved_ms": round(avg * 1000 * counts["repaired"], 2) if avg is not None else None,
+                }
+            return out
+
+
+# Shared by every parser in this process
+JSON_REPAIR_STATS = RepairStats()
+
+
+class RepairingJsonParser(JsonOutputParser):
+    """
+    JsonOutputParser that, when the reply is not valid JSON as-is, repairs it locally:
+    reasoning blocks are stripped, the JSON span is extracted and its syntax fixed.
+    The result is coerced leniently toward its pydantic_object and validated, falling
+    back to the parsed JSON when it still does not fit. Raises OutputParserException
+    only when the local repair fails too, which is when LocalFirstFixingParser calls the LLM.
+    """
+
+    @property
+    def schema_name(self) -> str:
+        return getattr(self.pydantic_object, "__name__", "json")
+
+    def _validate(self, obj: Any) -> Any:
+        model = self.pydantic_object
+        if model is None:
+            return obj
+        if issubclass(model, RootModel) and isinstance(obj, dict):
+            # {"changes": [...]} or a lone row where a list of rows was asked for
+            lists = [v for v in obj.values() if isinstance(v, list)]
+            obj = lists[0] if len(obj) == 1 and lists else [obj]
+        obj = coerce_to_schema(model, obj)
+        try:
+            return model.model_validate(obj).model_dump()
+        except ValidationError as e:
+            # JsonOutputParser never validated: well-formed JSON that still does not fit the
+            # schema is passed on as parsed rather than spent on an LLM fix round-trip
+            log.warning(f"JSON does not match schema, using it as parsed | schema={self.schema_name} | errors={e.error_count()}")
+            return obj
+
+    def parse_tiered(self, text: str) -> Tuple[Any, str]:
+        """(validated result, 'direct' | 'repaired')."""
+        try:
+            return self._validate(super().parse_result([Generation(text=text)])), "direct"
+        except (OutputParserException, ValidationError) as e:
+            first_error = e
+        opener = "[" if self.pydantic_object is not None and issubclass(self.pydantic_object, RootModel) else "{"
+        span = extract_json_span(strip_reasoning(text), opener)
+        if span is not None:
+            for candidate in (span, repair_json(span)):
+                try:
+                    return self._validate(json.loads(candidate)), "repaired"
+                except (ValueError, ValidationError) as e:
+                    last_error = e
+            first_error = last_error
+        raise OutputParserException(
+            f"Invalid {self.schema_name} JSON after local repair: {first_error}", llm_output=text
+        )
+
+    def parse_result(self, result: List[Generation], *, partial: bool = False) -> Any:
+        if partial:
+            return super().parse_result(result, partial=True)
+        return self.parse_tiered(result[0].text)[0]
+
+    def parse(self, text: str) -> Any:
+        return self.parse_tiered(text)[0]
+
+
+class LocalFirstFixingParser(OutputFixingParser):
+    """
+    OutputFixingParser whose parser (a RepairingJsonParser) gets the first go locally;
+    the LLM fix round-trip only runs when local repair fails. Tier counts go to
+    JSON_REPAIR_STATS.
+    """
+
+    def _local(self, completion: str) -> Tuple[Optional[Any], Optional[Exception]]:
+        try:
+            result, tier = self.parser.parse_tiered(completion)
+        except OutputParserException as e:
+            return None, e
+        JSON_REPAIR_STATS.record(self.parser.schema_name, tier)
+        return result, None
+
+    def _fallback_failed(self, started: float, e: Exception) -> None:
+        JSON_REPAIR_STATS.record(self.parser.schema_name, "failed")
+        log.warning(f"JSON repair failed | schema={self.parser.schema_name} | seconds={time.perf_counter() - started:.2f} | error={e}")
+
+    def parse(self, completion: str) -> Any:
+        result, error = self._local(completion)
+        if error is None:
+            return result
+        started = time.perf_counter()
+        try:
+            result = super().parse(completion)
+        except Exception as e:
+            self._fallback_failed(started, e)
+            raise
+        JSON_REPAIR_STATS.record(self.parser.schema_name, "llm", time.perf_counter() - started)
+        log.info(f"JSON fixed by LLM | schema={self.parser.schema_name} | local_error={error}")
+        return result
+
+    async def aparse(self, completion: str) -> Any:
+        result, error = self._local(completion)
+        if error is None:
+            return result
+        started = time.perf_counter()
+        try:
+            result = await super().aparse(completion)
+        except Exception as e:
+            self._fallback_failed(started, e)
+            raise
+        JSON_REPAIR_STATS.record(self.parser.schema_name, "llm", time.perf_counter() - started)
+        log.info(f"JSON fixed by LLM (async) | schema={self.parser.schema_name} | local_error={error}")
+        return result
@@ -1,5 +1,9 @@
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 import os
+import json
+import time
+import hashlib
+import threading
 from logger.custom_logger import CustomLogger
 
 class ModelLoader:
@@ -26,16 +30,25 @@ class ModelLoader:
 
         if provider in ("huggingface", "hf", "local"):
             from langchain_community.embeddings import HuggingFaceEmbeddings
-            return HuggingFaceEmbeddings(model_name=model_name)
+            embeddings = HuggingFaceEmbeddings(model_name=model_name)
 
-        if provider == "google":
+        elif provider == "google":
             try:
                 from langchain_google_genai import GoogleGenerativeAIEmbeddings
             except Exception as e:
                 raise ImportError("Install langchain-google-genai for Google embeddings") from e
-            return GoogleGenerativeAIEmbeddings(model=model_name)
+            embeddings = GoogleGenerativeAIEmbeddings(model=model_name)
+
+        else:
+            raise ValueError(f"Unknown embeddings provider: {provider}")
 
-        raise ValueError(f"Unknown embeddings provider: {provider}")
+        cache_cfg = emb_cfg.get("cache") or {}
+        if cache_cfg.get("enabled", True):
+            from utils.embedding_cache import wrap_with_cache
+            return wrap_with_cache(
+                embeddings, f"{provider}/{model_name}", cache_cfg.get("dir", "embedding_cache")
+            )
+        return embeddings
 
     def load_llm(self):
         self.log.info("Loading LLM (customize as needed)")
@@ -63,3 +76,113 @@ class ModelLoader:
             return ChatGoogleGenerativeAI(model=model_name, temperature=temperature, max_output_tokens=max_tokens)
 
         raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+class ModelRegistry:
+    """
+    Process-wide, thread-safe cache of model clients.
+    Holds one embedding instance and one LLM client per config fingerprint,
+    so request handlers never re-instantiate models from disk.
+    """
+    _SECTIONS = {"embeddings": "embedding_model", "llm": "llm"}
+
+    def __init__(self) -> None:
+        self.log = CustomLogger.get_logger(__name__)
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._models: Dict[Tuple[str, str], Any] = {}
+        self._stats: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._default_config: Optional[Dict[str, Any]] = None
+
+    @staticmethod
+    def fingerprint(section: Optional[Dict[str, Any]]) -> str:
+        payload = json.dumps(section or {}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def _resolve_config(self, config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if config:
+            return config
+        if self._default_config is None:
+            with self._lock:
+                if self._default_config is None:
+                    self._default_config = ModelLoader().config
+        return self._default_config
+
+    def default_config(self) -> Dict[str, Any]:
+        """The app config, loaded once per process."""
+        return self._resolve_config(None)
+
+    def _get(self, kind: str, config: Optional[Dict[str, Any]], factory: Callable[[ModelLoader], Any]) -> Any:
+        cfg = self._resolve_config(config)
+        section = cfg.get(self._SECTIONS[kind], {}) or {}
+        key = (kind, self.fingerprint(section))
+
+        with self._lock:
+            if key in self._models:
+                self._stats[key]["hits"] += 1
+                return self._models[key]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Load outside the registry lock so other keys are not blocked by a slow load.
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    self._stats[key]["hits"] += 1
+                    return self._models[key]
+
+            start = time.perf_counter()
+            model = factory(ModelLoader(cfg))
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self._models[key] = model
+                self._stats[key] = {
+                    "kind": kind,
+                    "fingerprint": key[1],
+                    "provider": section.get("provider"),
+                    "model_name": section.get("model_name"),
+                    "load_seconds": round(elapsed, 4),
+                    "loaded_at": time.time(),
+                    "hits": 0,
+                }
+            self.log.info(
+                f"Model registered | kind={kind} | model={section.get('model_name')} | "
+                f"fingerprint={key[1]} | load_seconds={elapsed:.3f}"
+            )
+            return model
+
+    def get_embeddings(self, config: Optional[Dict[str, Any]] = None):
+        return self._get("embeddings", config, lambda loader: loader.load_embeddings())
+
+    def get_llm(self, config: Optional[Dict[str, Any]] = None):
+        return self._get("llm", config, lambda loader: loader.load_llm())
+
+    def warmup(self, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Eagerly load the embedding model and LLM; failures are logged, not raised."""
+        for kind, getter in (("embeddings", self.get_embeddings), ("llm", self.get_llm)):
+            try:
+                getter(config)
+            except Exception as e:
+                self.log.warning(f"Model warmup failed | kind={kind} | error={e}")
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = [dict(s) for s in self._stats.values()]
+        return {
+            "loaded": len(models),
+            "total_hits": sum(m["hits"] for m in models),
+            "total_load_seconds": round(sum(m["load_seconds"] for m in models), 4),
+            "models": models,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._stats.clear()
+            self._load_locks.clear()
+            self._default_config = None
+
+
+# Keep one registry per process
+MODEL_REGISTRY = ModelRegistry()
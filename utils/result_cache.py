@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+from logger import GLOBAL_LOGGER as log
+
+DEFAULTS: Dict[str, Any] = {"enabled": True, "dir": "result_cache", "max_mb": 256}
+
+
+def prompt_version(prompt, format_instructions: str = "") -> str:
+    """Short hash of the prompt(s)' templates and output format; changes whenever either is edited."""
+    prompts = prompt if isinstance(prompt, (list, tuple)) else [prompt]
+    messages = [m for p in prompts for m in (getattr(p, "messages", None) or [p])]
+    parts = [getattr(getattr(m, "prompt", m), "template", repr(m)) for m in messages]
+    payload = json.dumps([parts, format_instructions], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def model_id(config: Optional[Dict[str, Any]]) -> str:
+    """provider/model plus a hash of the whole llm section (temperature, max tokens, ...)."""
+    llm = (config or {}).get("llm", {}) or {}
+    section = json.dumps(llm, sort_keys=True, default=str)
+    return f"{llm.get('provider')}/{llm.get('model_name')}@{hashlib.sha256(section.encode()).hexdigest()[:8]}"
+
+
+class ResultCache:
+    """
+    Persistent, content-addressed cache of /analyze and /compare results.
+
+    A key is sha256 over (kind, ordered upload digests, prompt version, model id), so
+    the same bytes analysed with the same prompt and model resolve to the same entry.
+    Each entry is one JSON file (<dir>/<kind>/<key[:2]>/<key>.json) written atomically;
+    hits touch the file's mtime, and once the directory exceeds max_bytes the least
+    recently used entries are deleted.
+    """
+    def __init__(self, root: str = DEFAULTS["dir"], max_bytes: int = DEFAULTS["max_mb"] * 1024 * 1024, enabled: bool = True):
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        self.enabled = bool(enabled)
+        self._lock = threading.Lock()
+        # path -> (size, last use); built from the directory on first use
+        self._index: Optional[Dict[Path, list]] = None
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def configure(self, config: Optional[Dict[str, Any]] = None) -> None:
+        cfg = {**DEFAULTS, **((config or {}).get("result_cache", {}) or {})}
+        with self._lock:
+            if Path(cfg["dir"]) != self.root:
+                self.root, self._index, self._bytes = Path(cfg["dir"]), None, 0
+            self.enabled = bool(cfg["enabled"])
+            self.max_bytes = int(cfg["max_mb"]) * 1024 * 1024
+
+    @staticmethod
+    def key(kind: str, digests: Sequence[str], prompt: str, model: str) -> str:
+        payload = json.dumps({"kind": kind, "inputs": list(digests), "prompt": prompt, "model": model})
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, kind: str, key: str) -> Path:
+        return self.root / kind / key[:2] / f"{key}.json"
+
+    def _scan_locked(self) -> Dict[Path, list]:
+        if self._index is None:
+            self._index, self._bytes = {}, 0
+            if self.root.exists():
+                for p in self.root.rglob("*.json"):
+                    st = p.stat()
+                    self._index[p] = [st.st_size, st.st_mtime]
+                    self._bytes += st.st_size
+        return self._index
+
+    def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """The stored payload, or None on a miss (or when the cache is disabled)."""
+        if not self.enabled:
+            return None
+        path = self._path(kind, key)
+        with self._lock:
+            index = self._scan_locked()
+            try:
+                payload = json.loads(path.read_text(encoding="utf-8"))
+            except (FileNotFoundError, ValueError):
+                self.misses += 1
+                return None
+            now = time.time()
+            os.utime(path, (now, now))
+            if path in index:
+                index[path][1] = now
+            self.hits += 1
+        log.info(f"Result cache hit | kind={kind} | key={key[:12]}")
+        return payload
+
+    def put(self, kind: str, key: str, payload: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        path = self._path(kind, key)
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        with self._lock:
+            index = self._scan_locked()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            old = index.get(path)
+            if old is not None:
+                self._bytes -= old[0]
+            index[path] = [len(data), time.time()]
+            self._bytes += len(data)
+            self.writes += 1
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        if self._bytes <= self.max_bytes:
+            return
+        for path, (size, _) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if self._bytes <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            del self._index[path]
+            self._bytes -= size
+            self.evictions += 1
+            log.info(f"Result cache entry evicted | path={path} | bytes={size}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            index = self._scan_locked()
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Shared by every request handled in this process
+RESULT_CACHE = ResultCache()
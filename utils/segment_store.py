@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+
+from utils.columnar_docstore import DocstoreAppender, MmapDocstore, RowIdMap, committed_sizes
+from utils.file_lock import InterProcessLock, interprocess_lock
+from logger import GLOBAL_LOGGER as log
+
+MANIFEST = "manifest.json"
+VECTORS = "vectors.f32"
+INGEST_LOG = "ingest.jsonl"
+LEGACY_FILES = ("index.faiss", "index.pkl")
+WRITE_LOCK = ".write.lock"
+FORMAT_VERSION = 1
+DEFAULT_COMPACT_SEGMENTS = 16
+
+
+def _write_lock(root: Path) -> InterProcessLock:
+    # a lock file, not a threading lock: begin() truncates uncommitted bytes, which must
+    # never be another worker process's write in flight
+    return interprocess_lock(root / WRITE_LOCK)
+
+
+def _fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _new_manifest(next_seq: int = 1) -> Dict[str, Any]:
+    return {
+        "version": FORMAT_VERSION,
+        "dim": None,
+        "rows": 0,
+        "base": None,
+        "base_rows": 0,
+        "index_type": "flat",
+        "trained_rows": 0,
+        "tail_commits": 0,
+        "docstore": {},
+        "ingest_bytes": 0,
+        "next_seq": next_seq,
+    }
+
+
+def _jsonl(records: Iterable[Dict[str, Any]]) -> bytes:
+    return b"".join(json.dumps(r, ensure_ascii=False).encode("utf-8") + b"\n" for r in records)
+
+
+class SegmentStore:
+    """
+    Append-only on-disk layout for one FAISS session directory.
+
+    manifest.json   - the committed state; replaced atomically (tmp file + os.replace)
+    vectors.f32     - every embedding as a row-major float32 matrix, in row order
+    base-<n>.faiss  - ANN index (HNSW / IVF) over the first base_rows rows (optional)
+    text.*, meta.*, rows.col, sources.jsonl
+                    - columnar, memory-mapped docstore in row order (see columnar_docstore)
+    ingest.jsonl    - one {"k", "h", "d"} line per ingested chunk (key, content hash, duplicate)
+
+    The manifest records the committed row count and the committed length of each
+    append-only file, so readers never see a half-written add: anything past those
+    lengths is ignored by readers and truncated by the next writer. Adding n chunks
+    writes n vectors, n docstore rows and a small manifest, independent of the index
+    size. Loading reads the base index (a flat index has none) and adds the rows
+    committed since; after compact_segments commits those are folded into a new base.
+    Nothing is pickled; a docstore id is the row number.
+    """
+    def __init__(self, root, compact_segments: int = DEFAULT_COMPACT_SEGMENTS):
+        self.root = Path(root)
+        self.manifest_path = self.root / MANIFEST
+        self.compact_segments = max(1, int(compact_segments))
+        self._lock = _write_lock(self.root)
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._staged = 0
+        self._vectors_file = None
+        self._docstore: Optional[DocstoreAppender] = None
+
+    # ---------- reading ----------
+
+    def exists(self) -> bool:
+        return self.manifest_path.exists()
+
+    def has_legacy(self) -> bool:
+        return all((self.root / name).exists() for name in LEGACY_FILES)
+
+    def read_manifest(self) -> Dict[str, Any]:
+        manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        if manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported segment store version {manifest.get('version')} at {self.root}")
+        return manifest
+
+    def _read_log(self, name: str, committed: int) -> List[Dict[str, Any]]:
+        if not committed:
+            return []
+        with open(self.root / name, "rb") as f:
+            data = f.read(committed)
+        return [json.loads(line) for line in data.splitlines() if line]
+
+    def vectors(self, manifest: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """Memory-mapped (rows, dim) view of every committed embedding."""
+        m = manifest or self.read_manifest()
+        if not m["rows"]:
+            return np.empty((0, m["dim"] or 0), dtype=np.float32)
+        return np.memmap(self.root / VECTORS, dtype=np.float32, mode="r", shape=(m["rows"], m["dim"]))
+
+    def _read_index(self, manifest: Dict[str, Any]):
+        dim = int(manifest["dim"])
+        index = faiss.read_index(str(self.root / manifest["base"])) if manifest.get("base") else faiss.IndexFlatL2(dim)
+        tail = self.vectors(manifest)[manifest["base_rows"]:]
+        if len(tail):
+            index.add(np.ascontiguousarray(tail))
+        return index
+
+    def load(self, embeddings, retries: int = 3) -> FAISS:
+        """Build a FAISS vector store from the committed state; chunk text stays on disk."""
+        start = time.perf_counter()
+        for attempt in range(retries):
+            manifest = self.read_manifest()
+            try:
+                index = self._read_index(manifest)
+                break
+            except (FileNotFoundError, RuntimeError):
+                # a compaction replaced the base listed in the manifest we read; re-read it
+                if attempt == retries - 1:
+                    raise
+        docstore = MmapDocstore(self.root, manifest["rows"], manifest["docstore"])
+        log.info(
+            f"Segment store loaded | rows={index.ntotal} | index={manifest['index_type']} | "
+            f"tail_rows={manifest['rows'] - manifest['base_rows']} | "
+            f"seconds={time.perf_counter() - start:.3f} | path={self.root}"
+        )
+        vs = FAISS(embeddings, index, docstore, RowIdMap(manifest["rows"]))
+        # exact stored embeddings for rerankers (MMR), even when the index is lossy (IVF-PQ)
+        vs.raw_vectors = self.vectors(manifest)
+        return vs
+
+    def read_ingest_log(self) -> List[Dict[str, Any]]:
+        if not self.exists():
+            return []
+        return self._read_log(INGEST_LOG, self.read_manifest()["ingest_bytes"])
+
+    # ---------- writing ----------
+
+    def begin(self) -> None:
+        """Take the writer lock and drop anything a crashed writer left uncommitted."""
+        self._lock.acquire()
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._manifest = self.read_manifest() if self.exists() else _new_manifest()
+            self._recover()
+        except Exception:
+            self._lock.release()
+            raise
+
+    @property
+    def write_lock(self) -> InterProcessLock:
+        """The writer lock begin() takes; re-entrant, so callers may hold it around a whole update."""
+        return self._lock
+
+    @property
+    def committed_rows(self) -> int:
+        """Rows committed when begin() took the lock (other processes may have added some)."""
+        return self._manifest["rows"]
+
+    def _recover(self) -> None:
+        m = self._manifest
+        sizes = committed_sizes(m["rows"], m["docstore"])
+        sizes[INGEST_LOG] = m["ingest_bytes"]
+        sizes[VECTORS] = m["rows"] * (m["dim"] or 0) * 4
+        for name, committed in sizes.items():
+            path = self.root / name
+            if path.exists() and path.stat().st_size != committed:
+                os.truncate(path, committed)
+        for p in self.root.glob("base-*.faiss"):
+            if p.name != m["base"]:
+                p.unlink(missing_ok=True)
+
+    def append(self, ids: Sequence[str], vectors: np.ndarray, docs: Sequence[Document]) -> None:
+        """Stage index rows; they become visible to readers at commit()."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        m = self._manifest
+        if m["dim"] is None:
+            m["dim"] = int(vectors.shape[1])
+        if self._vectors_file is None:
+            self._vectors_file = open(self.root / VECTORS, "ab")
+            self._docstore = DocstoreAppender(self.root, m["docstore"])
+        if ids and ids[0] != str(m["rows"] + self._staged):
+            raise ValueError(f"Row ids must continue from row {m['rows'] + self._staged}, got {ids[0]}")
+        self._vectors_file.write(vectors.tobytes())
+        self._staged += len(ids)
+        self._docstore.append(docs)
+
+    def commit(self, ingest_records: Sequence[Dict[str, Any]] = ()) -> Dict[str, Any]:
+        """Make staged rows and ingest records durable, then swap the manifest in one rename."""
+        try:
+            m = self._manifest
+            if self._vectors_file is not None:
+                self._vectors_file.flush()
+                os.fsync(self._vectors_file.fileno())
+                self._vectors_file.close()
+                m["docstore"] = self._docstore.close()
+                m["rows"] += self._staged
+                m["tail_commits"] += 1
+            if ingest_records:
+                with open(self.root / INGEST_LOG, "ab") as f:
+                    f.write(_jsonl(ingest_records))
+                    f.flush()
+                    os.fsync(f.fileno())
+                m["ingest_bytes"] = (self.root / INGEST_LOG).stat().st_size
+            self._write_manifest(m)
+            return dict(m)
+        finally:
+            self._reset()
+            self._lock.release()
+
+    def abort(self) -> None:
+        """Discard staged rows; the next begin() trims them from disk."""
+        if self._vectors_file is not None:
+            self._vectors_file.close()
+        if self._docstore is not None:
+            self._docstore.close(sync=False)
+        self._reset()
+        self._lock.release()
+
+    def _reset(self) -> None:
+        self._staged = 0
+        self._vectors_file = self._docstore = None
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        manifest["updated_at"] = time.time()
+        tmp = self.root / f".{MANIFEST}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_path)
+        _fsync_dir(self.root)
+
+    def needs_compaction(self, index_type: str = "flat", retrain_growth: float = 2.0) -> Optional[str]:
+        """Why the base index should be rewritten: 'retype', 'retrain', 'fold' or None."""
+        if not self.exists():
+            return None
+        m = self.read_manifest()
+        if m["index_type"] != index_type:
+            return "retype"
+        if index_type == "flat":
+            return None  # a flat index is rebuilt from vectors.f32 on every load
+        if index_type.startswith("ivf") and m["rows"] >= retrain_growth * max(1, m["trained_rows"]):
+            return "retrain"
+        return "fold" if m["tail_commits"] >= self.compact_segments else None
+
+    def compact(self, index, index_type: str, trained: bool = False) -> None:
+        """Make index (covering every committed row) the new base, replacing the old one."""
+        with self._lock:
+            m = self.read_manifest()
+            if index.ntotal != m["rows"]:
+                raise ValueError(f"Index has {index.ntotal} rows but the manifest has {m['rows']}")
+            start = time.perf_counter()
+            stale = m["base"]
+            if index_type == "flat":
+                m["base"] = None
+            else:
+                name = f"base-{m['next_seq']:06d}.faiss"
+                m["next_seq"] += 1
+                tmp = self.root / f".{name}.tmp"
+                faiss.write_index(index, str(tmp))
+                with open(tmp, "rb+") as f:
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.root / name)
+                m["base"] = name
+            if trained or index_type != m["index_type"]:
+                m["trained_rows"] = m["rows"]
+            m.update(base_rows=m["rows"], index_type=index_type, tail_commits=0)
+            self._write_manifest(m)
+            if stale and stale != m["base"]:
+                (self.root / stale).unlink(missing_ok=True)
+        log.info(
+            f"Segment store compacted | rows={m['rows']} | index={index_type} | "
+            f"seconds={time.perf_counter() - start:.3f} | path={self.root}"
+        )
+
+    def write_snapshot(
+        self,
+        vectors: np.ndarray,
+        docs: Iterable[Document],
+        ingest_records: Sequence[Dict[str, Any]] = (),
+        replace: bool = False,
+    ) -> None:
+        """Fill an empty store from existing vectors and their documents in row order.
+        With replace, a non-empty store is emptied first (for indexes rebuilt from scratch)."""
+        self.begin()
+        try:
+            m = self._manifest
+            if m["rows"] and not replace:
+                raise ValueError(f"Segment store at {self.root} is not empty")
+            if m["rows"]:
+                # commit the empty state before truncating, so a crash leaves an empty store, not a torn one
+                self._manifest = m = _new_manifest(m["next_seq"])
+                self._write_manifest(m)
+                self._recover()
+            m["dim"] = int(vectors.shape[1])
+            with open(self.root / VECTORS, "wb") as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            appender = DocstoreAppender(self.root, m["docstore"])
+            batch: List[Document] = []
+            for doc in docs:
+                batch.append(doc)
+                if len(batch) == 1024:
+                    appender.append(batch)
+                    batch = []
+            if batch:
+                appender.append(batch)
+            m.update(rows=len(vectors), docstore=appender.close())
+        except Exception:
+            self.abort()
+            raise
+        self.commit(ingest_records)
+
+
+def migrate_legacy(index_dir, embeddings) -> None:
+    """
+    One-time conversion of a save_local directory (index.faiss + pickled index.pkl).
+    This is the only place a docstore is unpickled, and only for the app's own legacy files.
+    """
+    store = SegmentStore(index_dir)
+    vs = FAISS.load_local(str(index_dir), embeddings=embeddings, allow_dangerous_deserialization=True)
+    docs = (vs.docstore.search(vs.index_to_docstore_id[i]) for i in range(vs.index.ntotal))
+    store.write_snapshot(vs.index.reconstruct_n(0, vs.index.ntotal), docs)
+    # the legacy files are left in place; manifest.json takes precedence from now on
+    log.info(f"Legacy FAISS index migrated to segment store | rows={vs.index.ntotal} | path={store.root}")
+
+
+def load_vectorstore(index_dir, embeddings) -> FAISS:
+    """Load a session index, converting a legacy save_local layout on first use."""
+    store = SegmentStore(index_dir)
+    if not store.exists() and store.has_legacy():
+        migrate_legacy(index_dir, embeddings)
+    return store.load(embeddings)
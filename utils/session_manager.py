@@ -0,0 +1,348 @@
+from __future__ import annotations
+
+import os
+import re
+import json
+import time
+import shutil
+import asyncio
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from logger import GLOBAL_LOGGER as log
+from utils.file_lock import flock, funlock, interprocess_lock
+
+DEFAULTS: Dict[str, Any] = {
+    "enabled": True,
+    "index_path": "sessions/index.json",
+    "ttl_hours": 72,            # unused sessions older than this are deleted
+    "max_disk_mb": 4096,        # then least recently used sessions go until under this
+    "gc_interval_seconds": 600,
+    "roots": {
+        "analysis": "data/document_analysis",
+        "compare": "data/document_compare",
+        "chat_uploads": "data/document_chat/uploads",
+        "faiss": "faiss_index",
+    },
+}
+
+EvictHook = Callable[[str, str, Path], None]
+
+# one plain path component: a client-supplied session id must never reach outside its root
+_SESSION_ID = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_.-]*")
+
+
+def dir_bytes(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class SessionManager:
+    """
+    Tracks the per-request session directories under each root (document analysis,
+    comparison, chat uploads, FAISS indexes) in a small JSON index: size, last access
+    and owner per session.
+
+    collect() deletes sessions unused for ttl_hours, then the least recently used ones
+    until the roots fit in max_disk_mb. Only sessions registered through touch() / pin()
+    are ever deleted; any other directory under a root (sample data, indexes built
+    outside the API) is left alone.
+
+    Several worker processes can share one index: writes merge with the file under a
+    lock file, GC passes are serialized by it, and pin() holds a shared flock on a
+    per-session pin file that collect() must take exclusively before deleting, so a
+    session in use by any worker is skipped. (Without fcntl, i.e. on Windows, pins only
+    protect sessions in use by this process.)
+    """
+    def __init__(
+        self,
+        roots: Optional[Dict[str, str]] = None,
+        index_path: str = DEFAULTS["index_path"],
+        ttl_hours: float = DEFAULTS["ttl_hours"],
+        max_disk_mb: float = DEFAULTS["max_disk_mb"],
+        gc_interval_seconds: float = DEFAULTS["gc_interval_seconds"],
+        enabled: bool = True,
+    ):
+        self.roots = {kind: Path(p) for kind, p in (roots or DEFAULTS["roots"]).items()}
+        self.index_path = Path(index_path)
+        self.ttl_seconds = float(ttl_hours) * 3600
+        self.max_bytes = int(float(max_disk_mb) * 1024 * 1024)
+        self.gc_interval_seconds = float(gc_interval_seconds)
+        self.enabled = bool(enabled)
+        self._lock = threading.RLock()
+        # "kind/session_id" -> {kind, session, bytes, created, last_access, owner, dirty}
+        self._sessions: Optional[Dict[str, Dict[str, Any]]] = None
+        self._evicted: set = set()  # keys removed here since the last save
+        self._pins: Dict[str, int] = {}
+        self._hooks: Dict[str, List[EvictHook]] = {}
+        self.evictions = {"ttl": 0, "quota": 0}
+        self.evicted_bytes = 0
+        self.last_gc: Optional[Dict[str, Any]] = None
+
+    def configure(self, config: Optional[Dict[str, Any]] = None, base_dir: Optional[Path] = None) -> None:
+        """Apply the sessions config section; relative paths are resolved against base_dir when given."""
+        cfg = {**DEFAULTS, **((config or {}).get("sessions", {}) or {})}
+        base = Path(base_dir) if base_dir is not None else Path()
+        with self._lock:
+            roots = {**DEFAULTS["roots"], **(cfg.get("roots") or {})}
+            self.roots = {kind: base / p for kind, p in roots.items()}
+            if base / cfg["index_path"] != self.index_path:
+                self.index_path, self._sessions = base / cfg["index_path"], None
+            self.ttl_seconds = float(cfg["ttl_hours"]) * 3600
+            self.max_bytes = int(float(cfg["max_disk_mb"]) * 1024 * 1024)
+            self.gc_interval_seconds = float(cfg["gc_interval_seconds"])
+            self.enabled = bool(cfg["enabled"])
+
+    def on_evict(self, kind: str, hook: EvictHook) -> None:
+        """hook(kind, session_id, path) runs after a session of this kind is deleted."""
+        self._hooks.setdefault(kind, []).append(hook)
+
+    # ---------- index ----------
+
+    @staticmethod
+    def _key(kind: str, session_id: str) -> str:
+        return f"{kind}/{session_id}"
+
+    def path(self, kind: str, session_id: str) -> Path:
+        return self.roots[kind] / session_id
+
+    def _tracked(self, kind: str, session_id: Optional[str]) -> bool:
+        return (
+            self.enabled and kind in self.roots and bool(session_id)
+            and _SESSION_ID.fullmatch(session_id) is not None
+        )
+
+    def _file_lock(self):
+        return interprocess_lock(self.index_path.with_name(f".{self.index_path.name}.lock"))
+
+    def _pin_path(self, key: str) -> Path:
+        return self.index_path.parent / "pins" / (key.replace("/", "__") + ".pin")
+
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            index = json.loads(self.index_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            log.warning(f"Session index unreadable, starting empty | path={self.index_path} | error={e}")
+            return {}
+        # entries without the flag were adopted from disk by an earlier version; never ours to delete
+        return {k: v for k, v in index.items() if v.get("registered")}
+
+    def _index_locked(self) -> Dict[str, Dict[str, Any]]:
+        if self._sessions is None:
+            self._sessions = self._read_index()
+        return self._sessions
+
+    def _merge_locked(self) -> Dict[str, Dict[str, Any]]:
+        """Fold the on-disk index (other workers' sessions) into ours; the latest access wins."""
+        index = self._index_locked()
+        for key, theirs in self._read_index().items():
+            if key in self._evicted:
+                continue
+            ours = index.get(key)
+            if ours is None or theirs.get("last_access", 0) > ours.get("last_access", 0):
+                index[key] = {**theirs, "dirty": True}
+        return index
+
+    def save(self) -> None:
+        with self._file_lock(), self._lock:
+            index = self._merge_locked()
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_path.with_name(f".{self.index_path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.index_path)
+            self._evicted.clear()
+
+    def touch(self, kind: str, session_id: str, owner: Optional[str] = None) -> None:
+        """Record an access (registering the session if it is new); its size is refreshed by the next scan."""
+        if not self._tracked(kind, session_id):
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._index_locked().setdefault(
+                self._key(kind, session_id),
+                {"kind": kind, "session": session_id, "bytes": 0, "created": now, "owner": owner, "registered": True},
+            )
+            entry["last_access"] = now
+            entry["dirty"] = True
+            if owner and not entry.get("owner"):
+                entry["owner"] = owner
+
+    @contextmanager
+    def pin(self, kind: str, session_id: Optional[str], owner: Optional[str] = None) -> Iterator[None]:
+        """Keep a session from being collected, by any worker, while a request uses it."""
+        if not self._tracked(kind, session_id):
+            yield
+            return
+        key = self._key(kind, session_id)
+        pin_path = self._pin_path(key)
+        pin_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(pin_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            flock(fd, shared=True)
+            with self._lock:
+                self._pins[key] = self._pins.get(key, 0) + 1
+            self.touch(kind, session_id, owner)
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self._pins[key] -= 1
+                    if not self._pins[key]:
+                        del self._pins[key]
+                self.touch(kind, session_id, owner)
+        finally:
+            funlock(fd)
+            os.close(fd)
+
+    def scan(self) -> None:
+        """Refresh the sizes of registered sessions and forget those whose directory is gone."""
+        with self._lock:
+            index = self._index_locked()
+            entries = [
+                (key, e["kind"], e["session"], bool(e.get("dirty")))
+                for key, e in index.items() if e.get("kind") in self.roots
+            ]
+        for key, kind, session_id, dirty in entries:
+            d = self.path(kind, session_id)
+            if not d.is_dir():
+                with self._lock:
+                    if key in index and self._unpinned(key, lambda: None):
+                        del index[key]
+                        self._evicted.add(key)
+                continue
+            if not dirty:
+                continue
+            size = dir_bytes(d)
+            with self._lock:
+                entry = index.get(key)
+                if entry is not None:
+                    entry["bytes"] = size
+                    entry["dirty"] = False
+
+    # ---------- collection ----------
+
+    def _unpinned(self, key: str, action: Callable[[], None]) -> bool:
+        """Run action() and drop the pin file while holding it exclusively; False if any worker has it pinned."""
+        if key in self._pins:
+            return False
+        pin_path = self._pin_path(key)
+        pin_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(pin_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if not flock(fd, blocking=False):
+                return False
+            try:
+                action()
+                pin_path.unlink(missing_ok=True)
+            finally:
+                funlock(fd)
+        finally:
+            os.close(fd)
+        return True
+
+    def _evict_locked(self, key: str, reason: str) -> Optional[Tuple[str, str, Path, int]]:
+        """Delete a session unless a request in any worker has it pinned (then None)."""
+        entry = self._sessions[key]
+        path = self.path(entry["kind"], entry["session"])
+        if not self._unpinned(key, lambda: shutil.rmtree(path, ignore_errors=True)):
+            return None
+        del self._sessions[key]
+        self._evicted.add(key)
+        self.evictions[reason] += 1
+        self.evicted_bytes += int(entry.get("bytes") or 0)
+        log.info(
+            f"Session evicted | reason={reason} | kind={entry['kind']} | session={entry['session']} | "
+            f"bytes={entry.get('bytes')} | idle_hours={(time.time() - entry['last_access']) / 3600:.1f}"
+        )
+        return entry["kind"], entry["session"], path, int(entry.get("bytes") or 0)
+
+    def collect(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """One GC pass: scan, TTL eviction, then LRU eviction down to the disk quota."""
+        if not self.enabled:
+            return {"enabled": False}
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        evicted: List[Tuple[str, str, Path, int]] = []
+        # one GC pass at a time across workers, over everyone's sessions
+        with self._file_lock():
+            with self._lock:
+                self._merge_locked()
+            self.scan()
+            with self._lock:
+                index = self._index_locked()
+                for key, entry in list(index.items()):
+                    if now - entry["last_access"] > self.ttl_seconds:
+                        if (gone := self._evict_locked(key, "ttl")) is not None:
+                            evicted.append(gone)
+                total = sum(int(e.get("bytes") or 0) for e in index.values())
+                for key, entry in sorted(index.items(), key=lambda kv: kv[1]["last_access"]):
+                    if total <= self.max_bytes:
+                        break
+                    if (gone := self._evict_locked(key, "quota")) is not None:
+                        total -= gone[3]
+                        evicted.append(gone)
+                self.last_gc = {
+                    "at": now,
+                    "evicted": len(evicted),
+                    "freed_bytes": sum(e[3] for e in evicted),
+                    "bytes": total,
+                    "seconds": round(time.perf_counter() - started, 3),
+                }
+            self.save()
+        for kind, session_id, path, _ in evicted:
+            for hook in self._hooks.get(kind, []):
+                try:
+                    hook(kind, session_id, path)
+                except Exception as e:
+                    log.warning(f"Session evict hook failed | kind={kind} | session={session_id} | error={e}")
+        return self.last_gc
+
+    async def run(self) -> None:
+        """Background GC loop for the API process; cancel the task to stop it."""
+        while True:
+            await asyncio.sleep(self.gc_interval_seconds)
+            try:
+                await asyncio.to_thread(self.collect)
+            except Exception as e:
+                log.error(f"Session GC failed | error={e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            index = self._index_locked()
+            kinds: Dict[str, Dict[str, Any]] = {k: {"sessions": 0, "bytes": 0} for k in self.roots}
+            owners: Dict[str, int] = {}
+            for entry in index.values():
+                k = kinds.setdefault(entry["kind"], {"sessions": 0, "bytes": 0})
+                k["sessions"] += 1
+                k["bytes"] += int(entry.get("bytes") or 0)
+                owner = entry.get("owner") or "unknown"
+                owners[owner] = owners.get(owner, 0) + int(entry.get("bytes") or 0)
+            oldest = min((e["last_access"] for e in index.values()), default=None)
+            return {
+                "enabled": self.enabled,
+                "sessions": len(index),
+                "bytes": sum(k["bytes"] for k in kinds.values()),
+                "max_bytes": self.max_bytes,
+                "ttl_hours": round(self.ttl_seconds / 3600, 2),
+                "pinned": sum(self._pins.values()),
+                "kinds": kinds,
+                "bytes_by_owner": owners,
+                "oldest_idle_hours": round((time.time() - oldest) / 3600, 2) if oldest else None,
+                "evictions": dict(self.evictions),
+                "evicted_bytes": self.evicted_bytes,
+                "last_gc": self.last_gc,
+            }
+
+
+# Shared by every request handled in this process
+SESSIONS = SessionManager()
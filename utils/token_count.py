@@ -0,0 +1,6 @@
+from __future__ import annotations
+
+
+def approx_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English BPE vocabularies)."""
+    return max(1, (len(text) + 3) // 4)